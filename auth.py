@@ -1,47 +1,62 @@
 # ferremas_api/auth.py
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from typing import Optional, List
+from typing import Optional, List, Dict, FrozenSet, NamedTuple, Tuple
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 
 from config import settings
+from metrics import JWT_VERIFY_DURATION
 from models import TokenData, UserInDB
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+logger = logging.getLogger(__name__)
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=settings.BCRYPT_ROUNDS)
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
-# Usuarios de ejemplo en memoria (para pruebas)
+# bcrypt es CPU intensivo: se ejecuta en un pool de hilos acotado para no
+# bloquear el event loop. Las verificaciones que exceden el pool esperan en
+# cola hasta PASSWORD_HASH_MAX_PENDING; más allá se rechazan.
+_password_executor = ThreadPoolExecutor(max_workers=settings.PASSWORD_HASH_WORKERS, thread_name_prefix="bcrypt")
+_password_pending = 0
+
+# Usuarios de ejemplo en memoria (para pruebas).
+# Los hashes están precalculados para no ejecutar bcrypt al importar el módulo.
 FAKE_USERS_DB = {
     "javier_thompson": {
         "username": "javier_thompson",
-        "hashed_password": pwd_context.hash("a0NF4d6aNBIxRjlgjBRRzrS"),
+        "hashed_password": "$2b$12$FtBuGUPbN0U/6JZ4ry1HguoO1athv7iFkx4kDej9uqWhwQQR4qcZ.",
         "roles": ["admin"],
     },
     "ignacio_tapia": {
         "username": "ignacio_tapia",
-        "hashed_password": pwd_context.hash("f7rWChmQS1JYfThT"),
+        "hashed_password": "$2b$12$/Ez6UtiFzD5FqNlzrBxQn.8LNFA1m.n5fmLlUxBr58icNQxRaBiUm",
         "roles": ["client"],
     },
     "stripe_sa": {
         "username": "stripe_sa",
-        "hashed_password": pwd_context.hash("dzkQqDL9XZH33YDzhmsf"),
+        "hashed_password": "$2b$12$5L48dwbdl7xlxqPmq1Nc4e35sJ2OZdQZWi8iQqdbgXSPMckgNwiSa",
         "roles": ["service_account"],
     },
     "bodega_user": {
         "username": "bodega_user",
-        "hashed_password": pwd_context.hash("bodega_password"),
+        "hashed_password": "$2b$12$SNoiC2NYqumLcf5p/F6HbOJpnNblnzq0JTq8lqQX7B8LDAokNWW7O",
         "roles": ["bodega"],
     },
     "mantenedor_user": {
         "username": "mantenedor_user",
-        "hashed_password": pwd_context.hash("mantenedor_password"),
+        "hashed_password": "$2b$12$FspoumF/8azlPy/68..e8u0JLWtguCuPrILQzHDm47aSOe6YFW8AO",
         "roles": ["mantenedor"],
     },
     "jefe_tienda_user": {
         "username": "jefe_tienda_user",
-        "hashed_password": pwd_context.hash("jefetienda_password"),
+        "hashed_password": "$2b$12$0sQetfdYv8agj0JCdFw.VO3qokVBXD1DOtNzc7.Kq4TbwXlvMzD2e",
         "roles": ["jefe_tienda"],
     },
 }
@@ -49,16 +64,49 @@ FAKE_USERS_DB = {
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
 
+async def verify_password_async(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    """
+    Verifica la contraseña en el pool de hilos de bcrypt. Si PASSWORD_REHASH_ENABLED
+    y el hash usa otro costo que BCRYPT_ROUNDS, devuelve además el hash nuevo.
+    """
+    global _password_pending
+    if _password_pending >= settings.PASSWORD_HASH_MAX_PENDING:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Demasiados inicios de sesión simultáneos, intenta nuevamente",
+            headers={"Retry-After": "1"},
+        )
+    _password_pending += 1
+    try:
+        loop = asyncio.get_running_loop()
+        if settings.PASSWORD_REHASH_ENABLED:
+            return await loop.run_in_executor(_password_executor, pwd_context.verify_and_update, plain_password, hashed_password)
+        verified = await loop.run_in_executor(_password_executor, pwd_context.verify, plain_password, hashed_password)
+        return verified, None
+    finally:
+        _password_pending -= 1
+
+def shutdown_password_executor() -> None:
+    _password_executor.shutdown(wait=False, cancel_futures=True)
+
 def get_user(username: str) -> Optional[UserInDB]:
     user_dict = FAKE_USERS_DB.get(username)
     if user_dict:
         return UserInDB(**user_dict)
     return None
 
-def authenticate_user(username: str, password: str) -> Optional[UserInDB]:
+async def authenticate_user(username: str, password: str) -> Optional[UserInDB]:
     user = get_user(username)
-    if not user or not verify_password(password, user.hashed_password):
+    if not user:
         return None
+    verified, new_hash = await verify_password_async(password, user.hashed_password)
+    if not verified:
+        return None
+    if new_hash:
+        # Rehash transparente al costo configurado
+        FAKE_USERS_DB[username]["hashed_password"] = new_hash
+        user.hashed_password = new_hash
+        logger.info(f"Contraseña de {username} rehasheada con costo {settings.BCRYPT_ROUNDS}")
     return user
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
@@ -68,12 +116,50 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -
     encoded_jwt = jwt.encode(to_encode, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
     return encoded_jwt
 
-async def get_current_user(token: str = Depends(oauth2_scheme)) -> UserInDB:
+class VerifiedToken(NamedTuple):
+    user: UserInDB
+    roles: FrozenSet[str]
+    expires_at: float
+
+# Caché LRU de tokens ya verificados: evita decodificar el JWT y reconstruir el
+# usuario en cada petición cuando el mismo token se reutiliza. Cada entrada
+# vence junto con el claim "exp" del token.
+_token_cache: "OrderedDict[str, VerifiedToken]" = OrderedDict()
+_token_cache_stats = {"hits": 0, "misses": 0, "evictions": 0, "verify_seconds": 0.0}
+
+def clear_token_cache() -> None:
+    _token_cache.clear()
+
+def get_token_cache_stats() -> Dict[str, float]:
+    misses = _token_cache_stats["misses"]
+    avg_verify = _token_cache_stats["verify_seconds"] / misses if misses else 0.0
+    return {
+        "size": len(_token_cache),
+        "hits": _token_cache_stats["hits"],
+        "misses": misses,
+        "evictions": _token_cache_stats["evictions"],
+        "avg_verify_ms": round(avg_verify * 1000, 4),
+        # Tiempo de verificación que se evitó gracias a los hits
+        "saved_ms": round(avg_verify * _token_cache_stats["hits"] * 1000, 2),
+    }
+
+def verify_token(token: str) -> VerifiedToken:
+    now = time.time()
+    cached = _token_cache.get(token)
+    if cached is not None:
+        if cached.expires_at > now:
+            _token_cache.move_to_end(token)
+            _token_cache_stats["hits"] += 1
+            return cached
+        del _token_cache[token]
+    _token_cache_stats["misses"] += 1
+
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="No se pudieron validar las credenciales",
         headers={"WWW-Authenticate": "Bearer"},
     )
+    started = time.perf_counter()
     try:
         payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
         username: str = payload.get("sub")
@@ -86,14 +172,30 @@ async def get_current_user(token: str = Depends(oauth2_scheme)) -> UserInDB:
     user = get_user(token_data.username)
     if user is None:
         raise credentials_exception
-    return user
+    verified = VerifiedToken(user=user, roles=frozenset(user.roles), expires_at=float(payload.get("exp", now)))
+    elapsed = time.perf_counter() - started
+    _token_cache_stats["verify_seconds"] += elapsed
+    JWT_VERIFY_DURATION.observe(elapsed)
+
+    if verified.expires_at > now:
+        _token_cache[token] = verified
+        if len(_token_cache) > settings.TOKEN_CACHE_SIZE:
+            _token_cache.popitem(last=False)
+            _token_cache_stats["evictions"] += 1
+    return verified
+
+async def get_current_user(token: str = Depends(oauth2_scheme)) -> UserInDB:
+    return verify_token(token).user
 
 def has_roles(required_roles: List[str]):
-    def roles_checker(current_user: UserInDB = Depends(get_current_user)):
-        if not any(role in current_user.roles for role in required_roles):
+    required = frozenset(required_roles)
+
+    async def roles_checker(token: str = Depends(oauth2_scheme)) -> UserInDB:
+        verified = verify_token(token)
+        if required.isdisjoint(verified.roles):
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
                 detail="No tienes los permisos necesarios para realizar esta acción"
             )
-        return current_user
+        return verified.user
     return roles_checker
@@ -0,0 +1,113 @@
+# ferremas_api/benchmarks/bench_http_client.py
+"""
+Compara peticiones/segundo hacia un stub local de la API de Ferremas:
+un httpx.AsyncClient nuevo por petición (comportamiento anterior) contra
+el cliente compartido con pool de database.py.
+
+Ambas variantes hacen GET directos, cada uno a un producto distinto: pasar
+por fetch_from_ferremas_api juntaría las peticiones concurrentes al mismo
+endpoint (coalescing) y mediría eso en lugar del pool de conexiones.
+
+Uso:
+    python benchmarks/bench_http_client.py --requests 2000 --concurrency 50
+"""
+import argparse
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_port(port: int, timeout: float = 10.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.2):
+                return
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError(f"El stub no respondió en el puerto {port}")
+
+
+# Productos que sirve el stub (su valor por defecto de --products)
+STUB_PRODUCTS = 1000
+
+
+async def run(label: str, fetch, total: int, concurrency: int) -> float:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(i: int):
+        async with semaphore:
+            assert await fetch(f"products/{i % STUB_PRODUCTS + 1}") is not None
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(total)))
+    elapsed = time.perf_counter() - start
+    rps = total / elapsed
+    print(f"{label:<28} {rps:>10.1f} req/s  ({elapsed:.2f}s)")
+    return rps
+
+
+async def bench(total: int, concurrency: int) -> None:
+    import httpx
+    import database
+    from config import settings
+
+    async def fetch_per_request(endpoint: str):
+        # Reproduce el comportamiento previo: un cliente (y un handshake) por llamada
+        url = f"{str(settings.FERREMAS_DB_API_URL).rstrip('/')}/{endpoint}"
+        async with httpx.AsyncClient() as client:
+            response = await client.get(url, headers={"token": settings.FERREMAS_DB_API_TOKEN})
+            response.raise_for_status()
+            return response.json()
+
+    async def fetch_pooled(endpoint: str):
+        response = await database.get_http_client().get(endpoint)
+        response.raise_for_status()
+        return response.json()
+
+    before = await run("cliente por petición", fetch_per_request, total, concurrency)
+    await database.init_http_client()
+    try:
+        after = await run("cliente compartido (pool)", fetch_pooled, total, concurrency)
+    finally:
+        await database.close_http_client()
+    print(f"mejora: x{after / before:.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    args = parser.parse_args()
+
+    port = free_port()
+    stub = subprocess.Popen([
+        sys.executable, os.path.join(ROOT, "benchmarks", "stub_upstream.py"),
+        "--port", str(port), "--latency-ms", str(args.latency_ms),
+    ])
+    try:
+        wait_for_port(port)
+        os.environ["FERREMAS_DB_API_URL"] = f"http://127.0.0.1:{port}"
+        os.environ.setdefault("FERREMAS_DB_API_TOKEN", "bench")
+        os.environ.setdefault("SECRET_KEY", "bench")
+        asyncio.run(bench(args.requests, args.concurrency))
+    finally:
+        stub.terminate()
+        stub.wait()
+
+
+if __name__ == "__main__":
+    main()
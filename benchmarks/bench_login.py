@@ -0,0 +1,98 @@
+# ferremas_api/benchmarks/bench_login.py
+"""
+Mide el rendimiento de /token y la latencia de otra ruta (GET /) mientras
+ocurre una ráfaga de inicios de sesión, comparando bcrypt ejecutado dentro del
+event loop (comportamiento anterior) con el pool de hilos de auth.py.
+
+Uso:
+    python benchmarks/bench_login.py --logins 32 --concurrency 16
+"""
+import argparse
+import asyncio
+import logging
+import os
+import statistics
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+PROBE_INTERVAL = 0.01
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+async def run(app, logins: int, concurrency: int) -> dict:
+    import httpx
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        semaphore = asyncio.Semaphore(concurrency)
+        done = asyncio.Event()
+        probe_latencies = []
+
+        async def login():
+            async with semaphore:
+                response = await client.post("/token", data={"username": "bodega_user", "password": "bodega_password"})
+                assert response.status_code == 200, response.text
+
+        async def probe():
+            # Se mide desde que la petición debía salir: incluye el tiempo que el
+            # event loop estuvo bloqueado antes de poder atenderla
+            while not done.is_set():
+                start = time.perf_counter()
+                await asyncio.sleep(PROBE_INTERVAL)
+                await client.get("/")
+                probe_latencies.append(time.perf_counter() - start - PROBE_INTERVAL)
+
+        probe_task = asyncio.create_task(probe())
+        start = time.perf_counter()
+        await asyncio.gather(*(login() for _ in range(logins)))
+        elapsed = time.perf_counter() - start
+        done.set()
+        await probe_task
+
+    return {
+        "logins_per_second": logins / elapsed,
+        "probe_p50_ms": statistics.median(probe_latencies) * 1000,
+        "probe_p99_ms": percentile(probe_latencies, 99) * 1000,
+        "probe_max_ms": max(probe_latencies) * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de inicio de sesión con bcrypt")
+    parser.add_argument("--logins", type=int, default=32)
+    parser.add_argument("--concurrency", type=int, default=16)
+    args = parser.parse_args()
+
+    os.environ.setdefault("FERREMAS_DB_API_URL", "http://127.0.0.1")
+    os.environ.setdefault("FERREMAS_DB_API_TOKEN", "bench")
+    os.environ.setdefault("SECRET_KEY", "bench")
+    import auth
+    from main import app
+
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    pooled = auth.verify_password_async
+
+    async def inline(plain_password, hashed_password):
+        # Comportamiento anterior: bcrypt dentro del event loop
+        return auth.pwd_context.verify(plain_password, hashed_password), None
+
+    for label, verifier in (("bcrypt en el event loop", inline), ("bcrypt en pool de hilos", pooled)):
+        auth.verify_password_async = verifier
+        result = asyncio.run(run(app, args.logins, args.concurrency))
+        print(
+            f"{label:<26} {result['logins_per_second']:>6.1f} logins/s   "
+            f"GET / p50 {result['probe_p50_ms']:>7.1f}ms  p99 {result['probe_p99_ms']:>7.1f}ms  "
+            f"max {result['probe_max_ms']:>7.1f}ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
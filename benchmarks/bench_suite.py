@@ -0,0 +1,272 @@
+# ferremas_api/benchmarks/bench_suite.py
+"""
+Suite de benchmarks de extremo a extremo: levanta el stub de la API de
+Ferremas y la app real con uvicorn (procesos aparte) y ejecuta escenarios
+sobre las rutas de productos, sucursales y rutas protegidas con JWT.
+
+Por escenario se registra: peticiones/segundo, latencia p50/p95/p99, errores,
+llamadas que recibió el stub y memoria residente máxima de la app. El
+resultado se escribe en JSON para compararlo con compare_results.py.
+
+Uso:
+    python benchmarks/bench_suite.py --products 5000 --latency-ms 20 --concurrency 32 --output base.json
+    python benchmarks/bench_suite.py --scenarios products_list,product_detail --duration 5
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_http_client import free_port, wait_for_port
+from bench_login import percentile
+
+# Misma clave para la app y para los tokens que se firman aquí
+BENCH_SECRET_KEY = "bench-suite"
+
+
+class Scenario(NamedTuple):
+    method: str
+    # Recibe el generador aleatorio y las dimensiones del stub; devuelve (ruta, cuerpo JSON)
+    request: Callable[[random.Random, argparse.Namespace], tuple]
+    # Usuario con el que se firma el token (None: ruta pública)
+    user: Optional[str] = None
+
+
+SCENARIOS: Dict[str, Scenario] = {
+    "root": Scenario("GET", lambda rnd, a: ("/", None)),
+    "products_list": Scenario("GET", lambda rnd, a: ("/products?limit=50&sort=-price", None)),
+    "products_full": Scenario("GET", lambda rnd, a: ("/products", None)),
+    "product_detail": Scenario("GET", lambda rnd, a: (f"/products/{rnd.randint(1, a.products)}", None)),
+    "products_search": Scenario("GET", lambda rnd, a: (f"/products/search?q={rnd.choice(['taladro', 'marti', 'pintura bosch', 'cable'])}", None)),
+    "products_batch": Scenario("POST", lambda rnd, a: ("/products/batch", {"ids": rnd.sample(range(1, a.products + 1), min(20, a.products))})),
+    "branches_list": Scenario("GET", lambda rnd, a: ("/branches", None)),
+    "branches_nearest": Scenario("GET", lambda rnd, a: (f"/branches/nearest?lat={rnd.uniform(-41, -29):.4f}&lon={rnd.uniform(-73.5, -70):.4f}", None)),
+    "branch_sellers": Scenario("GET", lambda rnd, a: (f"/branches/{rnd.randint(1, a.branches)}/sellers", None), user="javier_thompson"),
+    "branch_overview": Scenario("GET", lambda rnd, a: (f"/branches/{rnd.randint(1, a.branches)}/overview", None), user="javier_thompson"),
+    "seller_detail": Scenario("GET", lambda rnd, a: (f"/sellers/{rnd.randint(1, a.sellers)}", None), user="ignacio_tapia"),
+}
+DEFAULT_SCENARIOS = [name for name in SCENARIOS if name != "products_full"]
+
+
+def _children(pid: int) -> List[int]:
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children") as f:
+            return [int(child) for child in f.read().split()]
+    except OSError:
+        return []
+
+
+def _status_kb(pid: int, field: str) -> int:
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return 0
+
+
+def tree_rss_kb(pid: int, field: str = "VmRSS") -> int:
+    """
+    Memoria residente del proceso y sus hijos (workers de uvicorn). Solo Linux;
+    en otros sistemas devuelve 0.
+    """
+    return _status_kb(pid, field) + sum(tree_rss_kb(child, field) for child in _children(pid))
+
+
+async def run_scenario(client, name: str, scenario: Scenario, args, headers: dict, app_pid: int, stub_url: str) -> dict:
+    rnd = random.Random(args.seed)
+    latencies: List[float] = []
+    statuses: Dict[str, int] = {}
+    errors = 0
+
+    async def send():
+        path, body = scenario.request(rnd, args)
+        return await client.request(scenario.method, path, json=body, headers=headers)
+
+    # Calentamiento: llena las cachés y abre las conexiones antes de medir
+    for _ in range(args.warmup):
+        await send()
+
+    await client.post(f"{stub_url}/__stats/reset")
+    peak_rss = [tree_rss_kb(app_pid)]
+    stop = asyncio.Event()
+
+    async def sample_memory():
+        while not stop.is_set():
+            peak_rss[0] = max(peak_rss[0], tree_rss_kb(app_pid))
+            try:
+                await asyncio.wait_for(stop.wait(), 0.05)
+            except asyncio.TimeoutError:
+                pass
+
+    deadline = time.perf_counter() + args.duration if args.duration else None
+    remaining = [args.requests]
+
+    async def worker():
+        nonlocal errors
+        while (remaining[0] > 0) if deadline is None else (time.perf_counter() < deadline):
+            remaining[0] -= 1
+            started = time.perf_counter()
+            try:
+                response = await send()
+            except Exception:
+                errors += 1
+                continue
+            latencies.append(time.perf_counter() - started)
+            statuses[str(response.status_code)] = statuses.get(str(response.status_code), 0) + 1
+            if response.status_code >= 400:
+                errors += 1
+
+    sampler = asyncio.create_task(sample_memory())
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await sampler
+
+    upstream = (await client.get(f"{stub_url}/__stats")).json()
+    completed = len(latencies)
+    result = {
+        "requests": completed,
+        "errors": errors,
+        "status_codes": statuses,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(completed / elapsed, 1) if elapsed else 0.0,
+        "latency_ms": {
+            "mean": round(sum(latencies) / completed * 1000, 3) if completed else None,
+            "p50": round(percentile(latencies, 50) * 1000, 3) if completed else None,
+            "p95": round(percentile(latencies, 95) * 1000, 3) if completed else None,
+            "p99": round(percentile(latencies, 99) * 1000, 3) if completed else None,
+            "max": round(max(latencies) * 1000, 3) if completed else None,
+        },
+        "upstream_calls": upstream["total"],
+        "upstream_calls_per_request": round(upstream["total"] / completed, 4) if completed else None,
+        "upstream_by_route": upstream["calls"],
+        "peak_rss_mb": round(peak_rss[0] / 1024, 1),
+    }
+    print(
+        f"{name:<18} {result['throughput_rps']:>9.1f} req/s  "
+        f"p50={result['latency_ms']['p50']}ms p95={result['latency_ms']['p95']}ms p99={result['latency_ms']['p99']}ms  "
+        f"errores={errors} upstream={upstream['total']} rss={result['peak_rss_mb']}MB"
+    )
+    return result
+
+
+async def drive(args, app_url: str, stub_url: str, app_pid: int) -> dict:
+    import httpx
+    from auth import FAKE_USERS_DB, create_access_token
+
+    def auth_headers(user: Optional[str]) -> dict:
+        if user is None:
+            return {}
+        token = create_access_token({"sub": user, "roles": FAKE_USERS_DB[user]["roles"]})
+        return {"Authorization": f"Bearer {token}"}
+
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    results = {}
+    async with httpx.AsyncClient(base_url=app_url, limits=limits, timeout=60.0) as client:
+        for name in args.scenarios:
+            scenario = SCENARIOS[name]
+            results[name] = await run_scenario(client, name, scenario, args, auth_headers(scenario.user), app_pid, stub_url)
+    return results
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Suite de benchmarks de extremo a extremo")
+    parser.add_argument("--scenarios", default=",".join(DEFAULT_SCENARIOS),
+                        help=f"Escenarios separados por coma. Disponibles: {', '.join(SCENARIOS)}")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--requests", type=int, default=2000, help="Peticiones por escenario")
+    parser.add_argument("--duration", type=float, default=None, help="Segundos por escenario (reemplaza --requests)")
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument("--products", type=int, default=1000)
+    parser.add_argument("--branches", type=int, default=20)
+    parser.add_argument("--sellers", type=int, default=200)
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="Latencia simulada del stub")
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--workers", type=int, default=1, help="Workers de uvicorn para la app")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--app-logs", action="store_true", help="Mostrar los logs de la app (por defecto se descartan)")
+    parser.add_argument("--output", default=None, help="Archivo JSON de resultados")
+    args = parser.parse_args()
+    args.scenarios = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = [name for name in args.scenarios if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"Escenarios desconocidos: {', '.join(unknown)}")
+
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    stub_port, app_port = free_port(), free_port()
+    stub_url, app_url = f"http://127.0.0.1:{stub_port}", f"http://127.0.0.1:{app_port}"
+    env = dict(
+        os.environ,
+        FERREMAS_DB_API_URL=stub_url,
+        FERREMAS_DB_API_TOKEN=os.environ.get("FERREMAS_DB_API_TOKEN", "bench"),
+        SECRET_KEY=BENCH_SECRET_KEY,
+    )
+    os.environ.update(env)
+
+    stub = subprocess.Popen([
+        sys.executable, os.path.join(ROOT, "benchmarks", "stub_upstream.py"), "--port", str(stub_port),
+        "--products", str(args.products), "--branches", str(args.branches), "--sellers", str(args.sellers),
+        "--latency-ms", str(args.latency_ms), "--jitter-ms", str(args.jitter_ms),
+    ])
+    app = None
+    try:
+        wait_for_port(stub_port)
+        app = subprocess.Popen([
+            sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(app_port),
+            "--workers", str(args.workers), "--log-level", "warning", "--no-access-log",
+        ], cwd=ROOT, env=env, stderr=None if args.app_logs else subprocess.DEVNULL)
+        wait_for_port(app_port, timeout=30.0)
+        scenarios = asyncio.run(drive(args, app_url, stub_url, app.pid))
+        report = {
+            "meta": {
+                "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+                "git_revision": git_revision(),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "cpu_count": os.cpu_count(),
+                "config": {key: value for key, value in vars(args).items() if key not in ("output", "app_logs")},
+            },
+            "app_peak_rss_mb": round(tree_rss_kb(app.pid, "VmHWM") / 1024, 1),
+            "scenarios": scenarios,
+        }
+    finally:
+        for process in (app, stub):
+            if process is not None:
+                process.terminate()
+                process.wait()
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"Resultados en {args.output}")
+    else:
+        print(json.dumps(report, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+# ferremas_api/benchmarks/bench_validation.py
+"""
+Microbenchmark de validación y serialización del catálogo.
+
+Compara el camino anterior (json.loads + Product(**item) por elemento y luego
+la revalidación/serialización del response_model de FastAPI) con el actual
+(TypeAdapter.validate_json desde bytes y dump_json de la copia en caché).
+
+Uso:
+    python benchmarks/bench_validation.py --sizes 1000 10000 100000
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+
+
+def best_of(fn, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Microbenchmark de validación del catálogo")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000, 100_000])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    os.environ.setdefault("FERREMAS_DB_API_URL", "http://127.0.0.1")
+    os.environ.setdefault("FERREMAS_DB_API_TOKEN", "bench")
+    os.environ.setdefault("SECRET_KEY", "bench")
+    from typing import List
+    from fastapi.encoders import jsonable_encoder
+    from pydantic import TypeAdapter
+    from database import PRODUCT_LIST_ADAPTER
+    from models import Product
+    from stub_upstream import make_products
+
+    # Equivalente a la revalidación del response_model antes de serializar
+    response_model = TypeAdapter(List[Product])
+
+    print(f"{'items':>8} {'etapa':<34} {'anterior':>10} {'actual':>10} {'mejora':>8}")
+    for size in args.sizes:
+        raw = json.dumps(make_products(size)).encode()
+        products = PRODUCT_LIST_ADAPTER.validate_json(raw)
+
+        rows = [
+            (
+                "validar respuesta de la API",
+                lambda: [Product(**item) for item in json.loads(raw)],
+                lambda: PRODUCT_LIST_ADAPTER.validate_json(raw),
+            ),
+            (
+                "model_construct (sin validar)",
+                lambda: [Product(**item) for item in json.loads(raw)],
+                lambda: [Product.model_construct(**item) for item in json.loads(raw)],
+            ),
+            (
+                "serializar respuesta",
+                lambda: json.dumps(jsonable_encoder(response_model.validate_python(products)), ensure_ascii=False).encode(),
+                lambda: PRODUCT_LIST_ADAPTER.dump_json(products),
+            ),
+        ]
+        for label, before, after in rows:
+            t_before = best_of(before, args.repeat)
+            t_after = best_of(after, args.repeat)
+            print(f"{size:>8} {label:<34} {t_before * 1000:>8.1f}ms {t_after * 1000:>8.1f}ms {t_before / t_after:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+# ferremas_api/benchmarks/compare_results.py
+"""
+Compara dos archivos de resultados de bench_suite.py y marca regresiones:
+menos peticiones/segundo, más latencia p95/p99, más llamadas a la API de
+Ferremas por petición o más memoria que el umbral dado.
+
+Uso:
+    python benchmarks/compare_results.py base.json nuevo.json --threshold 0.10
+
+Sale con código 1 si hay alguna regresión (útil en CI).
+"""
+import argparse
+import json
+import sys
+
+# (nombre, cómo leerlo del escenario, True si mayor es mejor, diferencia absoluta
+# por debajo de la cual el cambio se considera ruido)
+METRICS = [
+    ("throughput_rps", lambda s: s["throughput_rps"], True, 1.0),
+    ("p50_ms", lambda s: s["latency_ms"]["p50"], False, 0.5),
+    ("p95_ms", lambda s: s["latency_ms"]["p95"], False, 0.5),
+    ("p99_ms", lambda s: s["latency_ms"]["p99"], False, 0.5),
+    ("upstream/req", lambda s: s["upstream_calls_per_request"], False, 0.01),
+    ("peak_rss_mb", lambda s: s["peak_rss_mb"], False, 2.0),
+]
+
+
+def relative_change(base: float, new: float) -> float:
+    if not base:
+        return 0.0 if not new else float("inf")
+    return (new - base) / base
+
+
+def compare(base: dict, new: dict, threshold: float) -> int:
+    regressions = 0
+    print(f"base: {base['meta'].get('git_revision')} ({base['meta']['timestamp']})")
+    print(f"new:  {new['meta'].get('git_revision')} ({new['meta']['timestamp']})")
+    for name, scenario in new["scenarios"].items():
+        if name not in base["scenarios"]:
+            print(f"\n{name}: sin datos en la base")
+            continue
+        print(f"\n{name}")
+        for metric, read, higher_is_better, noise in METRICS:
+            before, after = read(base["scenarios"][name]), read(scenario)
+            if before is None or after is None:
+                continue
+            change = relative_change(before, after)
+            worse = -change if higher_is_better else change
+            flag = ""
+            if abs(after - before) <= noise:
+                pass
+            elif worse > threshold:
+                flag = "  REGRESIÓN"
+                regressions += 1
+            elif -worse > threshold:
+                flag = "  mejora"
+            print(f"  {metric:<14} {before:>12} -> {after:<12} {change:+.1%}{flag}")
+    print(f"\n{regressions} regresiones (umbral {threshold:.0%})")
+    return 1 if regressions else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compara dos resultados de bench_suite.py")
+    parser.add_argument("base")
+    parser.add_argument("new")
+    parser.add_argument("--threshold", type=float, default=0.10, help="Cambio relativo tolerado (0.10 = 10%%)")
+    args = parser.parse_args()
+    with open(args.base, encoding="utf-8") as f:
+        base = json.load(f)
+    with open(args.new, encoding="utf-8") as f:
+        new = json.load(f)
+    sys.exit(compare(base, new, args.threshold))
+
+
+if __name__ == "__main__":
+    main()
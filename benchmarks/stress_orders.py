@@ -0,0 +1,148 @@
+# ferremas_api/benchmarks/stress_orders.py
+"""
+Prueba de estrés del motor de pedidos contra el stub de la API de Ferremas.
+
+Muchos clientes concurrentes piden los mismos productos (más demanda que stock),
+confirman, cancelan o abandonan sus reservas. Al final se verifica que:
+  - nunca se confirmaron más unidades que el stock inicial (sin sobreventa),
+  - no quedan unidades reservadas tras vencer las reservas abandonadas,
+  - el stock en la API de Ferremas coincide con el del libro tras sincronizar.
+
+Uso:
+    python benchmarks/stress_orders.py --orders 20000 --clients 200 --hot-products 20
+"""
+import argparse
+import asyncio
+import os
+import random
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_http_client import free_port, wait_for_port
+
+
+async def run(args) -> int:
+    from database import init_http_client, close_http_client, fetch_products_by_id
+    from catalog import catalog_cache
+    from models import OrderItem, SingleOrder
+    from orders import order_engine, InsufficientStockError, OrderStateError
+
+    await init_http_client()
+    order_engine.start()
+    rnd = random.Random(args.seed)
+    product_ids = list(range(1, args.hot_products + 1))
+    index = await catalog_cache.product_index()
+    initial = {pid: index.get(pid).stock for pid in product_ids}
+    confirmed_units = {pid: 0 for pid in product_ids}
+    counts = {"placed": 0, "rejected": 0, "confirmed": 0, "cancelled": 0, "abandoned": 0, "expired_before_confirm": 0}
+    remaining = [args.orders]
+
+    async def client(number: int):
+        while remaining[0] > 0:
+            remaining[0] -= 1
+            chosen = rnd.sample(product_ids, rnd.randint(1, 3))
+            order = SingleOrder(
+                client_username=f"cliente_{number}",
+                branch_id=1,
+                items=[OrderItem(product_id=pid, quantity=rnd.randint(1, 5)) for pid in chosen],
+            )
+            try:
+                reservation = await order_engine.place(order)
+            except InsufficientStockError:
+                counts["rejected"] += 1
+                continue
+            counts["placed"] += 1
+            for pid in chosen:
+                assert order_engine.available(pid) >= 0, f"Stock disponible negativo en producto {pid}"
+            # Otros pedidos se intercalan entre la reserva y la decisión
+            await asyncio.sleep(0)
+            action = rnd.random()
+            try:
+                if action < 0.6:
+                    order_engine.confirm(reservation.order_id)
+                    counts["confirmed"] += 1
+                    for item in reservation.items:
+                        confirmed_units[item.product_id] += item.quantity
+                elif action < 0.8:
+                    order_engine.cancel(reservation.order_id)
+                    counts["cancelled"] += 1
+                else:
+                    counts["abandoned"] += 1
+            except OrderStateError:
+                counts["expired_before_confirm"] += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client(i) for i in range(args.clients)))
+    elapsed = time.perf_counter() - start
+
+    # Se espera a que venzan las reservas abandonadas
+    await asyncio.sleep(order_engine.ttl + order_engine.sweep_interval * 2)
+    order_engine.sweep()
+    await order_engine.close()
+
+    upstream = {product.id: product.stock for product in await fetch_products_by_id(product_ids)}
+    await catalog_cache.close()
+    await close_http_client()
+
+    errors = []
+    for pid in product_ids:
+        entry = order_engine.ledger.get(pid)
+        expected = initial[pid] - confirmed_units[pid]
+        if confirmed_units[pid] > initial[pid]:
+            errors.append(f"producto {pid}: sobreventa ({confirmed_units[pid]} confirmadas, stock inicial {initial[pid]})")
+        if entry.reserved != 0:
+            errors.append(f"producto {pid}: quedan {entry.reserved} unidades reservadas")
+        if entry.on_hand != expected:
+            errors.append(f"producto {pid}: libro={entry.on_hand}, esperado={expected}")
+        if upstream.get(pid) != expected:
+            errors.append(f"producto {pid}: API={upstream.get(pid)}, esperado={expected}")
+
+    print(f"{args.orders} pedidos en {elapsed:.2f}s ({args.orders / elapsed:,.0f} pedidos/s)")
+    print("  " + ", ".join(f"{key}={value}" for key, value in counts.items()))
+    print(f"  unidades confirmadas={sum(confirmed_units.values())} de {sum(initial.values())} en stock")
+    print(f"  motor: {order_engine.stats()}")
+    if errors:
+        print("FALLÓ:")
+        for error in errors:
+            print("  " + error)
+        return 1
+    print("OK: sin sobreventa y stock sincronizado con la API")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prueba de estrés del motor de pedidos")
+    parser.add_argument("--orders", type=int, default=20000)
+    parser.add_argument("--clients", type=int, default=200)
+    parser.add_argument("--hot-products", type=int, default=20)
+    parser.add_argument("--ttl", type=float, default=0.5, help="Vencimiento de las reservas (s)")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    port = free_port()
+    stub = subprocess.Popen([
+        sys.executable, os.path.join(ROOT, "benchmarks", "stub_upstream.py"),
+        "--port", str(port), "--products", str(max(args.hot_products, 100)),
+    ])
+    try:
+        wait_for_port(port)
+        os.environ.update(
+            FERREMAS_DB_API_URL=f"http://127.0.0.1:{port}",
+            ORDER_RESERVATION_TTL_SECONDS=str(args.ttl),
+            ORDER_SWEEP_INTERVAL_SECONDS="0.05",
+            ORDER_SYNC_INTERVAL_SECONDS="0.05",
+        )
+        os.environ.setdefault("FERREMAS_DB_API_TOKEN", "bench")
+        os.environ.setdefault("SECRET_KEY", "bench")
+        sys.exit(asyncio.run(run(args)))
+    finally:
+        stub.terminate()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+# ferremas_api/benchmarks/stub_upstream.py
+"""
+Stub local de la API de base de datos de Ferremas para benchmarks.
+
+Cuenta las peticiones recibidas por método y forma de ruta; GET /__stats las
+devuelve y POST /__stats/reset las pone en cero.
+
+Uso:
+    python benchmarks/stub_upstream.py --port 8900 --products 1000 --latency-ms 20 --jitter-ms 5
+"""
+import argparse
+import asyncio
+import random
+import re
+from collections import Counter
+
+import uvicorn
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+
+CATEGORIES = ["herramientas", "electricidad", "pinturas", "gasfiteria", "jardin", "seguridad"]
+BRANDS = ["Bosch", "Makita", "DeWalt", "Stanley", "Sherwin", "Truper", "Black&Decker"]
+_ID_SEGMENT = re.compile(r"/\d+")
+
+
+def make_products(n: int, seed: int = 42) -> list:
+    rnd = random.Random(seed)
+    return [
+        {
+            "id": i,
+            "name": f"Producto {i} {rnd.choice(['taladro', 'martillo', 'sierra', 'pintura', 'cable', 'llave'])}",
+            "description": f"Descripción del producto {i}",
+            "price": round(rnd.uniform(990, 250000), 2),
+            "stock": rnd.randint(0, 500),
+            "category": rnd.choice(CATEGORIES),
+            "brand": rnd.choice(BRANDS),
+            "is_promotion": rnd.random() < 0.1,
+            "is_new_product": rnd.random() < 0.05,
+        }
+        for i in range(1, n + 1)
+    ]
+
+
+def make_branches(n: int, seed: int = 42) -> list:
+    rnd = random.Random(seed)
+    return [
+        {
+            "id": i,
+            "name": f"Sucursal {i}",
+            "address": f"Calle {i} #{rnd.randint(100, 9999)}",
+            "city": rnd.choice(["Santiago", "Valparaíso", "Concepción", "La Serena"]),
+            "phone": f"+5622{rnd.randint(1000000, 9999999)}",
+            "latitude": round(rnd.uniform(-41.0, -29.0), 6),
+            "longitude": round(rnd.uniform(-73.5, -70.0), 6),
+        }
+        for i in range(1, n + 1)
+    ]
+
+
+def make_sellers(n: int, n_branches: int, seed: int = 42) -> list:
+    rnd = random.Random(seed)
+    return [
+        {
+            "id": i,
+            "name": f"Vendedor {i}",
+            "email": f"vendedor{i}@ferremas.cl",
+            "branch_id": rnd.randint(1, max(n_branches, 1)),
+        }
+        for i in range(1, n + 1)
+    ]
+
+
+class CallCounter:
+    """
+    Middleware ASGI que cuenta las peticiones por "MÉTODO /ruta/{id}".
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.calls = Counter()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and not scope["path"].startswith("/__stats"):
+            self.calls[f"{scope['method']} {_ID_SEGMENT.sub('/{id}', scope['path'])}"] += 1
+        await self.app(scope, receive, send)
+
+
+def create_app(products: int = 1000, branches: int = 20, sellers: int = 200, latency_ms: float = 0.0, jitter_ms: float = 0.0):
+    data = {
+        "products": make_products(products),
+        "branches": make_branches(branches),
+        "sellers": make_sellers(sellers, branches),
+    }
+    by_id = {kind: {item["id"]: item for item in items} for kind, items in data.items()}
+
+    async def delay():
+        if latency_ms or jitter_ms:
+            await asyncio.sleep(max(0.0, latency_ms + random.uniform(-jitter_ms, jitter_ms)) / 1000)
+
+    async def list_items(request: Request):
+        await delay()
+        return JSONResponse(data[request.path_params["kind"]])
+
+    async def get_item(request: Request):
+        await delay()
+        item = by_id[request.path_params["kind"]].get(request.path_params["item_id"])
+        if item is None:
+            return JSONResponse({"detail": "not found"}, status_code=404)
+        return JSONResponse(item)
+
+    async def branch_sellers(request: Request):
+        await delay()
+        branch_id = request.path_params["branch_id"]
+        return JSONResponse([s for s in data["sellers"] if s["branch_id"] == branch_id])
+
+    async def write_product(request: Request):
+        await delay()
+        body = await request.json()
+        if request.method == "POST":
+            body.setdefault("id", len(data["products"]) + 1)
+            data["products"].append(body)
+            by_id["products"][body["id"]] = body
+            return JSONResponse(body, status_code=201)
+        item = by_id["products"].get(request.path_params["item_id"])
+        if item is None:
+            return JSONResponse({"detail": "not found"}, status_code=404)
+        item.update(body)
+        return JSONResponse(item)
+
+    async def get_stats(request: Request):
+        return JSONResponse({"calls": dict(counter.calls), "total": sum(counter.calls.values())})
+
+    async def reset_stats(request: Request):
+        counter.calls.clear()
+        return JSONResponse({"calls": {}, "total": 0})
+
+    counter = CallCounter(Starlette(routes=[
+        Route("/__stats", get_stats),
+        Route("/__stats/reset", reset_stats, methods=["POST"]),
+        Route("/products", write_product, methods=["POST"]),
+        Route("/products/{item_id:int}", write_product, methods=["PUT"]),
+        Route("/branches/{branch_id:int}/sellers", branch_sellers),
+        Route("/{kind:str}", list_items),
+        Route("/{kind:str}/{item_id:int}", get_item),
+    ]))
+    return counter
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stub de la API de base de datos de Ferremas")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--products", type=int, default=1000)
+    parser.add_argument("--branches", type=int, default=20)
+    parser.add_argument("--sellers", type=int, default=200)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0, help="Variación uniforme de la latencia (±ms)")
+    args = parser.parse_args()
+    app = create_app(args.products, args.branches, args.sellers, args.latency_ms, args.jitter_ms)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,390 @@
+# ferremas_api/catalog.py
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+
+from config import settings
+from pydantic import TypeAdapter
+
+from compression import compress
+from http_cache import make_etag
+from database import (
+    fetch_product_data,
+    fetch_branch_data,
+    fetch_seller_data,
+    PRODUCT_LIST_ADAPTER,
+    BRANCH_LIST_ADAPTER,
+    SELLER_LIST_ADAPTER,
+)
+from models import Product, Seller
+from product_index import ProductIndex
+from geo import BranchLocator
+from seller_directory import SellerDirectory
+from search import SearchIndex
+
+logger = logging.getLogger(__name__)
+
+class SnapshotCache:
+    """
+    Guarda en memoria la última copia válida de un listado de la API de Ferremas.
+
+    - Dentro del TTL se sirve directamente desde memoria (hit).
+    - Pasado el TTL, y hasta TTL + max_stale, se sirve la copia vieja mientras
+      una tarea en segundo plano la refresca (stale-while-revalidate).
+    - Sin copia, o demasiado vieja, se espera la recarga (miss). Si la recarga
+      falla se conserva la última copia válida.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        loader: Callable[[], Awaitable[Optional[List[Any]]]],
+        adapter: TypeAdapter,
+        ttl: float,
+        max_stale: float,
+    ):
+        self.name = name
+        self.adapter = adapter
+        self.ttl = ttl
+        self.max_stale = max_stale
+        self.version = 0
+        # False en los workers que reciben las copias desde disco (ver snapshot_store.py):
+        # teniendo una copia, no consultan la API de Ferremas al leer
+        self.refresh_on_read = True
+        # Se llaman con (anteriores, nuevos, completo) tras cada cambio de la copia;
+        # con completo=False solo se pasan los elementos escritos
+        self._listeners: List[Callable[[List[Any], List[Any], bool], None]] = []
+        self._loader = loader
+        self._data: Optional[List[Any]] = None
+        self._positions: Dict[Any, int] = {}
+        self._loaded_at = 0.0
+        self._refresh_task: Optional[asyncio.Task] = None
+        self._json: Optional[bytes] = None
+        self._etag: Optional[str] = None
+        self._serialized_version = -1
+        # (codificación, versión) -> bytes comprimidos, o la tarea que los calcula
+        self._compressed: Dict[Tuple[str, int], "asyncio.Future[bytes]"] = {}
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.refresh_errors = 0
+
+    async def get(self) -> Optional[List[Any]]:
+        if self._data is not None:
+            age = time.monotonic() - self._loaded_at
+            if age < self.ttl or not self.refresh_on_read:
+                self.hits += 1
+                return self._data
+            if age < self.ttl + self.max_stale:
+                self.stale_hits += 1
+                self._start_refresh()
+                return self._data
+        self.misses += 1
+        # shield: si el cliente que espera se cancela, la recarga continúa para los demás
+        await asyncio.shield(self._start_refresh())
+        return self._data
+
+    def peek(self) -> Optional[List[Any]]:
+        """
+        Devuelve la copia actual sin contar accesos ni disparar recargas.
+        """
+        return self._data
+
+    def json_bytes(self) -> Optional[bytes]:
+        """
+        La copia actual ya serializada a JSON; se calcula una vez por versión
+        y las rutas la devuelven tal cual, sin volver a validar ni serializar.
+        """
+        if self._data is None:
+            return None
+        if self._serialized_version != self.version:
+            self._json = self.adapter.dump_json(self._data)
+            self._etag = make_etag(self._json)
+            self._serialized_version = self.version
+        return self._json
+
+    async def compressed_bytes(self, encoding: str) -> bytes:
+        """
+        json_bytes() comprimido con gzip o brotli. Se comprime en un hilo una
+        vez por versión y codificación; las peticiones concurrentes esperan la
+        misma tarea. Devuelve la versión vigente al momento de la llamada.
+        """
+        body = self.json_bytes()
+        key = (encoding, self._serialized_version)
+        future = self._compressed.get(key)
+        if future is None:
+            # Solo se conserva la versión actual
+            self._compressed = {k: f for k, f in self._compressed.items() if k[1] == key[1]}
+            future = self._compressed[key] = asyncio.ensure_future(asyncio.to_thread(compress, body, encoding))
+        return await asyncio.shield(future)
+
+    def etag(self) -> Optional[str]:
+        """
+        Hash del contenido de la copia actual; se calcula una vez por versión.
+        """
+        if self.json_bytes() is None:
+            return None
+        return self._etag
+
+    def find(self, item_id: Any) -> Optional[Any]:
+        """
+        Elemento de la copia actual por id, sin contar accesos.
+        """
+        position = self._positions.get(item_id)
+        return self._data[position] if position is not None else None
+
+    @property
+    def age(self) -> float:
+        return time.monotonic() - self._loaded_at if self._data is not None else float("inf")
+
+    def set(self, data: List[Any], age: float = 0.0, json_body: Optional[bytes] = None) -> None:
+        """
+        Reemplaza la copia. `age` permite cargar una copia que ya tenía esa
+        antigüedad (desde disco) y `json_body` su JSON ya serializado.
+        """
+        previous = self._data
+        self._data = data
+        self._positions = {item.id: i for i, item in enumerate(data)}
+        self._loaded_at = time.monotonic() - age
+        self.version += 1
+        if json_body is not None:
+            self._json = json_body
+            self._etag = make_etag(json_body)
+            self._serialized_version = self.version
+        if previous is not None:
+            self._notify(previous, data, True)
+
+    def upsert(self, item: Any) -> None:
+        """
+        Reemplaza (o agrega) un elemento por su id tras una escritura exitosa.
+        """
+        self.upsert_many([item])
+
+    def upsert_many(self, items: Iterable[Any]) -> None:
+        """
+        Reemplaza (o agrega) varios elementos por id como una sola versión: la
+        lista se copia una vez (para no alterar la que otros estén recorriendo)
+        y el JSON se vuelve a serializar una vez para todo el lote.
+        """
+        if self._data is None:
+            return
+        data = list(self._data)
+        start = len(data)
+        # Posición -> elemento que había antes del lote (solo los que ya existían)
+        replaced: Dict[int, Any] = {}
+        touched: Dict[int, None] = {}
+        for item in items:
+            position = self._positions.get(item.id)
+            if position is None:
+                position = self._positions[item.id] = len(data)
+                data.append(item)
+            else:
+                if position < start and position not in replaced:
+                    replaced[position] = data[position]
+                data[position] = item
+            touched[position] = None
+        if not touched:
+            return
+        self._data = data
+        self.version += 1
+        self._notify(list(replaced.values()), [data[position] for position in touched], False)
+
+    def add_listener(self, listener: Callable[[List[Any], List[Any], bool], None]) -> None:
+        self._listeners.append(listener)
+
+    def _notify(self, previous: List[Any], current: List[Any], complete: bool) -> None:
+        for listener in self._listeners:
+            try:
+                listener(previous, current, complete)
+            except Exception:
+                logger.exception(f"Error en un suscriptor de cambios de {self.name}")
+
+    def invalidate(self) -> None:
+        """
+        Fuerza una recarga bloqueante en la próxima lectura.
+        """
+        self._loaded_at = float("-inf")
+
+    async def refresh(self) -> None:
+        """
+        Recarga desde la API de Ferremas (o espera la recarga en curso).
+        """
+        await asyncio.shield(self._start_refresh())
+
+    def _start_refresh(self) -> asyncio.Task:
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = asyncio.create_task(self._refresh())
+        return self._refresh_task
+
+    async def _refresh(self) -> None:
+        self.refreshes += 1
+        try:
+            data = await self._loader()
+        except Exception:
+            logger.exception(f"Error inesperado al refrescar la caché de {self.name}")
+            data = None
+        if data is None:
+            self.refresh_errors += 1
+            logger.warning(f"No se pudo refrescar la caché de {self.name}; se mantiene la última copia válida")
+            return
+        self.set(data)
+
+    async def close(self) -> None:
+        if self._refresh_task is not None and not self._refresh_task.done():
+            self._refresh_task.cancel()
+            try:
+                await self._refresh_task
+            except asyncio.CancelledError:
+                pass
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "version": self.version,
+            "size": len(self._data) if self._data is not None else 0,
+            "age_seconds": round(time.monotonic() - self._loaded_at, 3) if self._data is not None else None,
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "refreshes": self.refreshes,
+            "refresh_errors": self.refresh_errors,
+        }
+
+class CatalogCache:
+    """
+    Copias en memoria del catálogo de productos, sucursales y vendedores.
+    """
+
+    def __init__(self, ttl: float, max_stale: float):
+        self.products = SnapshotCache("products", fetch_product_data, PRODUCT_LIST_ADAPTER, ttl, max_stale)
+        self.branches = SnapshotCache("branches", fetch_branch_data, BRANCH_LIST_ADAPTER, ttl, max_stale)
+        self.sellers = SnapshotCache("sellers", fetch_seller_data, SELLER_LIST_ADAPTER, ttl, max_stale)
+        # Índices derivados de las copias: nombre -> (versión de la copia, índice)
+        self._indexes: Dict[str, Tuple[int, Any]] = {}
+        self._index_sources: Dict[str, SnapshotCache] = {}
+        self._index_builds: Dict[str, asyncio.Task] = {}
+
+    async def product_index(self) -> Optional[ProductIndex]:
+        """
+        Índice de filtros/orden del catálogo vigente.
+        """
+        return await self._derived_index("products", ProductIndex, self.products)
+
+    async def search_index(self) -> Optional[SearchIndex]:
+        """
+        Índice de búsqueda de texto del catálogo vigente.
+        """
+        return await self._derived_index("search", SearchIndex, self.products)
+
+    async def branch_locator(self) -> Optional[BranchLocator]:
+        """
+        Índice geográfico de las sucursales vigentes.
+        """
+        return await self._derived_index("branches", BranchLocator, self.branches)
+
+    async def seller_directory(self) -> Optional[SellerDirectory]:
+        """
+        Vendedores vigentes indexados por id, sucursal y email.
+        """
+        return await self._derived_index("sellers", SellerDirectory, self.sellers)
+
+    async def _derived_index(self, name: str, factory: Callable[[List[Any]], Any], source: SnapshotCache) -> Any:
+        """
+        Los índices se reconstruyen una vez por refresco del catálogo, no en cada
+        petición, y en un hilo para no bloquear el event loop. Mientras se
+        reconstruye se sigue respondiendo con el índice anterior.
+        """
+        self._index_sources[name] = source
+        data = await source.get()
+        if data is None:
+            return None
+        version, index = self._indexes.get(name, (-1, None))
+        if version == source.version:
+            return index
+        task = self._index_builds.get(name)
+        if task is None or task.done():
+            task = asyncio.create_task(self._build_index(name, factory, source))
+            self._index_builds[name] = task
+        if index is not None:
+            return index
+        return await asyncio.shield(task)
+
+    async def _build_index(self, name: str, factory: Callable[[List[Any]], Any], source: SnapshotCache) -> Any:
+        while True:
+            version = source.version
+            index = await asyncio.to_thread(factory, source.peek())
+            # Si hubo escrituras durante la construcción, se vuelve a construir
+            if version == source.version:
+                self._indexes[name] = (version, index)
+                return index
+
+    def products_etag(self, *index_names: str) -> Optional[str]:
+        """
+        ETag del catálogo, solo si los índices indicados corresponden a la copia
+        vigente (mientras se reconstruyen responden con una versión anterior).
+        """
+        for name in index_names:
+            version, _ = self._indexes.get(name, (-1, None))
+            if version != self.products.version:
+                return None
+        return self.products.etag()
+
+    def branches_etag(self, *index_names: str) -> Optional[str]:
+        """
+        Igual que products_etag, para los índices derivados de las sucursales.
+        """
+        for name in index_names:
+            version, _ = self._indexes.get(name, (-1, None))
+            if version != self.branches.version:
+                return None
+        return self.branches.etag()
+
+    def upsert_product(self, product: Product) -> None:
+        """
+        Aplica una escritura exitosa a la copia del catálogo y a sus índices.
+        """
+        self._upsert(self.products, [product])
+
+    def upsert_products(self, products: List[Product]) -> None:
+        """
+        Igual que upsert_product para un lote (p. ej. PATCH /products/batch): la
+        copia y cada índice se actualizan una sola vez.
+        """
+        self._upsert(self.products, products)
+
+    def upsert_seller(self, seller: Seller) -> None:
+        """
+        Agrega a la copia (y al directorio) un vendedor obtenido aparte de la API,
+        p. ej. uno creado después del último refresco.
+        """
+        self._upsert(self.sellers, [seller])
+
+    def _upsert(self, source: SnapshotCache, items: List[Any]) -> None:
+        previous_version = source.version
+        source.upsert_many(items)
+        if source.version == previous_version:
+            return
+        for name, (version, index) in list(self._indexes.items()):
+            if self._index_sources[name] is not source:
+                continue
+            index.upsert_many(items)
+            if version == previous_version:
+                self._indexes[name] = (source.version, index)
+
+    def _caches(self) -> List[SnapshotCache]:
+        return [self.products, self.branches, self.sellers]
+
+    async def close(self) -> None:
+        for task in self._index_builds.values():
+            task.cancel()
+        for cache in self._caches():
+            await cache.close()
+
+    def stats(self) -> Dict[str, Any]:
+        return {cache.name: cache.stats() for cache in self._caches()}
+
+catalog_cache = CatalogCache(
+    ttl=settings.CATALOG_CACHE_TTL_SECONDS,
+    max_stale=settings.CATALOG_CACHE_MAX_STALE_SECONDS,
+)
@@ -0,0 +1,317 @@
+# ferremas_api/change_feed.py
+import asyncio
+import itertools
+import logging
+from collections import deque
+from typing import Any, Deque, Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+
+from catalog import catalog_cache
+from config import settings
+from http_cache import dumps_json
+from orders import order_engine
+
+logger = logging.getLogger(__name__)
+
+# Un tópico es ("product", id), ("category", nombre en minúsculas) o ("branch", id);
+# las categorías se comparan sin distinguir mayúsculas, igual que en /products?category=
+Topic = Tuple[str, Any]
+
+class FeedEvent(NamedTuple):
+    seq: int
+    type: str
+    topics: Tuple[Topic, ...]
+    # Serializado una sola vez, sin importar cuántas conexiones lo reciban
+    data: str
+    sse: bytes
+
+class FeedFullError(Exception):
+    pass
+
+class SubscriptionClosed(Exception):
+    def __init__(self, reason: str):
+        self.reason = reason
+        super().__init__(reason)
+
+class Subscription:
+    """
+    Conexión suscrita al canal. Una conexión inactiva solo ocupa este objeto y
+    su entrada en el índice de tópicos; los eventos se encolan ya serializados.
+    """
+
+    __slots__ = ("topics", "everything", "max_pending", "_pending", "_ready", "closed_reason")
+
+    def __init__(self, max_pending: int):
+        self.topics: Set[Topic] = set()
+        # Recibe todos los cambios. Es independiente de `topics`: quitar el
+        # último tópico deja la suscripción sin eventos, no con todos
+        self.everything = False
+        self.max_pending = max_pending
+        self._pending: Deque[FeedEvent] = deque()
+        self._ready = asyncio.Event()
+        self.closed_reason: Optional[str] = None
+
+    def matches(self, event: FeedEvent) -> bool:
+        return self.everything or not self.topics.isdisjoint(event.topics)
+
+    def push(self, event: FeedEvent) -> bool:
+        if len(self._pending) >= self.max_pending:
+            # Cliente demasiado lento: se desconecta y debe volver a pedir el catálogo
+            self.close("lagging")
+            return False
+        self._pending.append(event)
+        self._ready.set()
+        return True
+
+    def close(self, reason: str) -> None:
+        if self.closed_reason is None:
+            self.closed_reason = reason
+        self._ready.set()
+
+    async def next(self, timeout: Optional[float] = None) -> Optional[FeedEvent]:
+        """
+        Siguiente evento; None si pasó `timeout` sin eventos. Lanza
+        SubscriptionClosed si la suscripción se cerró.
+        """
+        if self.closed_reason is not None:
+            raise SubscriptionClosed(self.closed_reason)
+        if not self._pending:
+            self._ready.clear()
+            try:
+                await asyncio.wait_for(self._ready.wait(), timeout)
+            except asyncio.TimeoutError:
+                return None
+            if self.closed_reason is not None:
+                raise SubscriptionClosed(self.closed_reason)
+        return self._pending.popleft()
+
+def diff_items(previous: List[Any], current: List[Any], complete: bool) -> List[Tuple[str, Any, Any, Dict[str, Any]]]:
+    """
+    Compara dos listas de modelos por id. Devuelve (tipo, anterior, nuevo, cambios)
+    con tipo created/updated/removed; en updated, cambios trae solo los campos
+    modificados. Las eliminaciones solo se detectan con la lista completa.
+    """
+    before = {item.id: item for item in previous}
+    changes = []
+    for item in current:
+        old = before.pop(item.id, None)
+        if old is None:
+            changes.append(("created", None, item, item.model_dump(mode="json")))
+        elif old is not item and old != item:
+            fields = {
+                name: getattr(item, name)
+                for name in type(item).model_fields
+                if getattr(old, name) != getattr(item, name)
+            }
+            changes.append(("updated", old, item, fields))
+    if complete:
+        changes.extend(("removed", old, None, {}) for old in before.values())
+    return changes
+
+class ChangeFeed:
+    """
+    Canal de cambios del catálogo para WebSocket y SSE.
+
+    Los cambios llegan de las escrituras de productos, de cada refresco del
+    catálogo y de las sucursales (comparando con la copia anterior, en un hilo)
+    y de los pedidos (stock disponible). Cada evento se serializa una vez y se
+    entrega solo a las conexiones suscritas a alguno de sus tópicos.
+    """
+
+    def __init__(self, max_connections: int, max_pending: int, replay_size: int):
+        self.max_connections = max_connections
+        self.max_pending = max_pending
+        self._seq = itertools.count(1)
+        self.last_seq = 0
+        self._subscriptions: Set[Subscription] = set()
+        self._everything: Set[Subscription] = set()
+        self._by_topic: Dict[Topic, Set[Subscription]] = {}
+        self._replay: Deque[FeedEvent] = deque(maxlen=replay_size)
+        # Las comparaciones se procesan en orden, una a la vez
+        self._diffs: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._attached = False
+        self.stats_counters = {
+            "published": 0,
+            "delivered": 0,
+            "lagging_disconnects": 0,
+            "rejected_connections": 0,
+        }
+
+    def start(self) -> None:
+        if not self._attached:
+            catalog_cache.products.add_listener(self._on_products)
+            catalog_cache.branches.add_listener(self._on_branches)
+            order_engine.add_listener(self._on_stock)
+            self._attached = True
+        if self._worker is None:
+            self._diffs = asyncio.Queue()
+            self._worker = asyncio.create_task(self._diff_loop())
+
+    async def close(self) -> None:
+        for subscription in list(self._subscriptions):
+            subscription.close("shutdown")
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+            self._diffs = None
+
+    # --- Suscripciones ---
+
+    def subscribe(self, product_ids: Iterable[int] = (), categories: Iterable[str] = (), branch_ids: Iterable[int] = ()) -> Subscription:
+        if len(self._subscriptions) >= self.max_connections:
+            self.stats_counters["rejected_connections"] += 1
+            raise FeedFullError("Demasiadas conexiones al canal de cambios")
+        subscription = Subscription(self.max_pending)
+        self._subscriptions.add(subscription)
+        self.update(subscription, True, product_ids, categories, branch_ids)
+        return subscription
+
+    def update(
+        self,
+        subscription: Subscription,
+        add: bool,
+        product_ids: Iterable[int] = (),
+        categories: Iterable[str] = (),
+        branch_ids: Iterable[int] = (),
+    ) -> None:
+        """
+        Agrega (add=True) o quita tópicos de una suscripción existente.
+
+        Suscribirse sin filtros pide todos los cambios y suscribirse a algún
+        tópico deja de recibirlos todos. Desuscribirse sin filtros deja de
+        recibir todos los cambios; quitar tópicos nunca vuelve a activarlo.
+        """
+        topics = _topics(product_ids, categories, branch_ids)
+        for topic in topics:
+            if add:
+                subscription.topics.add(topic)
+                self._by_topic.setdefault(topic, set()).add(subscription)
+            else:
+                subscription.topics.discard(topic)
+                self._remove_from_topic(topic, subscription)
+        if not topics:
+            subscription.everything = add
+        elif add:
+            subscription.everything = False
+        if subscription.everything:
+            self._everything.add(subscription)
+        else:
+            self._everything.discard(subscription)
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        self._subscriptions.discard(subscription)
+        self._everything.discard(subscription)
+        for topic in subscription.topics:
+            self._remove_from_topic(topic, subscription)
+
+    def _remove_from_topic(self, topic: Topic, subscription: Subscription) -> None:
+        subscribers = self._by_topic.get(topic)
+        if subscribers is not None:
+            subscribers.discard(subscription)
+            if not subscribers:
+                del self._by_topic[topic]
+
+    def replay(self, subscription: Subscription, last_seq: int) -> Tuple[List[FeedEvent], bool]:
+        """
+        Eventos posteriores a last_seq que le corresponden a la suscripción, y
+        si están completos (False si algunos ya salieron del búfer).
+        """
+        if last_seq > self.last_seq:
+            # ID de otro proceso (reinicio u otro worker): no se puede continuar
+            return [], False
+        oldest = self._replay[0].seq if self._replay else self.last_seq + 1
+        complete = last_seq >= oldest - 1
+        return [event for event in self._replay if event.seq > last_seq and subscription.matches(event)], complete
+
+    # --- Publicación ---
+
+    def publish(self, event_type: str, topics: Tuple[Topic, ...], payload: Dict[str, Any]) -> FeedEvent:
+        seq = next(self._seq)
+        self.last_seq = seq
+        data = dumps_json({"seq": seq, "type": event_type, **payload}).decode()
+        event = FeedEvent(seq, event_type, topics, data, f"id: {seq}\nevent: {event_type}\ndata: {data}\n\n".encode())
+        self._replay.append(event)
+        self.stats_counters["published"] += 1
+        targets = set(self._everything)
+        for topic in topics:
+            subscribers = self._by_topic.get(topic)
+            if subscribers:
+                targets |= subscribers
+        for subscription in targets:
+            if subscription.push(event):
+                self.stats_counters["delivered"] += 1
+            else:
+                self.stats_counters["lagging_disconnects"] += 1
+                self.unsubscribe(subscription)
+        return event
+
+    # --- Fuentes de cambios ---
+
+    def _on_products(self, previous: List[Any], current: List[Any], complete: bool) -> None:
+        if self._diffs is not None:
+            self._diffs.put_nowait(("product", previous, current, complete))
+
+    def _on_branches(self, previous: List[Any], current: List[Any], complete: bool) -> None:
+        if self._diffs is not None:
+            self._diffs.put_nowait(("branch", previous, current, complete))
+
+    def _on_stock(self, branch_id: int, available: Dict[int, int]) -> None:
+        for product_id, units in available.items():
+            product = catalog_cache.products.find(product_id)
+            topics: Tuple[Topic, ...] = (("product", product_id), ("branch", branch_id))
+            if product is not None:
+                topics += (("category", product.category.lower()),)
+            self.publish("product.stock", topics, {"id": product_id, "branch_id": branch_id, "available": units})
+
+    async def _diff_loop(self) -> None:
+        while True:
+            kind, previous, current, complete = await self._diffs.get()
+            try:
+                if complete:
+                    # Un refresco compara el catálogo completo: se hace en un hilo
+                    changes = await asyncio.to_thread(diff_items, previous, current, complete)
+                else:
+                    changes = diff_items(previous, current, complete)
+                for change, old, new, fields in changes:
+                    self._publish_change(kind, change, old, new, fields)
+            except Exception:
+                logger.exception(f"Error al calcular los cambios de {kind}")
+
+    def _publish_change(self, kind: str, change: str, old: Any, new: Any, fields: Dict[str, Any]) -> None:
+        item = new if new is not None else old
+        topics: Tuple[Topic, ...] = ((kind, item.id),)
+        payload: Dict[str, Any] = {"id": item.id}
+        if kind == "product":
+            categories = {product.category.lower() for product in (old, new) if product is not None}
+            topics += tuple(("category", category) for category in categories)
+            payload["category"] = item.category
+        if change != "removed":
+            payload["changes"] = fields
+        self.publish(f"{kind}.{change}", topics, payload)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self.stats_counters,
+            "connections": len(self._subscriptions),
+            "unfiltered_connections": len(self._everything),
+            "topics": len(self._by_topic),
+            "last_seq": self.last_seq,
+            "pending_diffs": self._diffs.qsize() if self._diffs is not None else 0,
+        }
+
+def _topics(product_ids: Iterable[int], categories: Iterable[str], branch_ids: Iterable[int]) -> List[Topic]:
+    return (
+        [("product", int(pid)) for pid in product_ids]
+        + [("category", str(category).lower()) for category in categories]
+        + [("branch", int(bid)) for bid in branch_ids]
+    )
+
+change_feed = ChangeFeed(
+    max_connections=settings.CHANGE_FEED_MAX_CONNECTIONS,
+    max_pending=settings.CHANGE_FEED_MAX_PENDING,
+    replay_size=settings.CHANGE_FEED_REPLAY_SIZE,
+)
@@ -0,0 +1,217 @@
+# ferremas_api/compression.py
+import gzip
+import logging
+import zlib
+from typing import Dict, List, Optional
+
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers, MutableHeaders
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+def _brotli_module():
+    try:
+        import brotli
+    except ImportError:
+        return None
+    return brotli
+
+brotli = _brotli_module()
+if brotli is None:
+    logger.info("Compresión brotli no disponible (falta el paquete 'brotli'); se usará gzip")
+
+# Tipos que vale la pena comprimir; imágenes o archivos ya comprimidos no
+COMPRESSIBLE_TYPES = ("application/json", "application/x-ndjson", "text/")
+
+def supported_encodings() -> List[str]:
+    """
+    Codificaciones que ofrece el servidor, en orden de preferencia.
+    """
+    return ["br", "gzip"] if brotli is not None else ["gzip"]
+
+def negotiate_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """
+    Elige la codificación según Accept-Encoding (con valores q). Ante un empate
+    se prefiere brotli, que comprime más el JSON del catálogo.
+    """
+    if not accept_encoding or not settings.COMPRESSION_ENABLED:
+        return None
+    weights: Dict[str, float] = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        weights[name.strip().lower()] = quality
+    best, best_quality = None, 0.0
+    for encoding in supported_encodings():
+        quality = weights.get(encoding, weights.get("*", 0.0))
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+def is_compressible(content_type: Optional[str]) -> bool:
+    # SSE no: cada conexión abierta mantendría su propio compresor en memoria
+    return (
+        content_type is not None
+        and content_type.startswith(COMPRESSIBLE_TYPES)
+        and not content_type.startswith("text/event-stream")
+    )
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=settings.COMPRESSION_BROTLI_QUALITY)
+    # mtime=0: mismo contenido, mismos bytes
+    return gzip.compress(body, compresslevel=settings.COMPRESSION_GZIP_LEVEL, mtime=0)
+
+async def compress_off_loop(body: bytes, encoding: str) -> bytes:
+    """
+    compress() en el threadpool para cuerpos grandes; los chicos se comprimen
+    en el event loop, donde es más barato que pasar a otro hilo.
+    """
+    if len(body) >= settings.COMPRESSION_THREADPOOL_MIN_SIZE:
+        return await run_in_threadpool(compress, body, encoding)
+    return compress(body, encoding)
+
+def encoded_etag(etag: str, encoding: str) -> str:
+    """
+    ETag de la representación comprimida: '"abc"' -> '"abc-gzip"'. Los bytes
+    difieren de los sin comprimir, así que un ETag fuerte no puede ser el mismo.
+    """
+    if not etag.endswith('"'):
+        return etag
+    return f'{etag[:-1]}-{encoding}"'
+
+def decoded_etag(etag: str) -> str:
+    """
+    Inverso de encoded_etag: el ETag de la representación sin comprimir.
+    """
+    for encoding in ("gzip", "br"):
+        suffix = f'-{encoding}"'
+        if etag.endswith(suffix):
+            return etag[:-len(suffix)] + '"'
+    return etag
+
+class _StreamCompressor:
+    """
+    Compresión incremental para respuestas en streaming: cada fragmento se
+    entrega de inmediato (flush) para no retener el NDJSON en el servidor.
+    """
+
+    def __init__(self, encoding: str):
+        self.encoding = encoding
+        if encoding == "br":
+            self._brotli = brotli.Compressor(quality=settings.COMPRESSION_BROTLI_QUALITY)
+        else:
+            self._zlib = zlib.compressobj(settings.COMPRESSION_GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def chunk(self, data: bytes) -> bytes:
+        if self.encoding == "br":
+            return self._brotli.process(data) + self._brotli.flush()
+        return self._zlib.compress(data) + self._zlib.flush(zlib.Z_SYNC_FLUSH)
+
+    async def chunk_off_loop(self, data: bytes) -> bytes:
+        # Los fragmentos se procesan en orden: nunca hay dos hilos sobre el mismo compresor
+        if len(data) >= settings.COMPRESSION_THREADPOOL_MIN_SIZE:
+            return await run_in_threadpool(self.chunk, data)
+        return self.chunk(data)
+
+    def finish(self) -> bytes:
+        if self.encoding == "br":
+            return self._brotli.finish()
+        return self._zlib.flush(zlib.Z_FINISH)
+
+class CompressionMiddleware:
+    """
+    Middleware ASGI que comprime con gzip o brotli las respuestas de texto/JSON
+    a partir de COMPRESSION_MIN_SIZE bytes. Las respuestas que ya traen
+    Content-Encoding (p. ej. las copias del catálogo precomprimidas) pasan tal cual.
+
+    Toda respuesta comprimible lleva Vary: Accept-Encoding, se comprima o no, y
+    la comprimida recibe su propio ETag (ver encoded_etag). Los cuerpos grandes
+    se comprimen en el threadpool.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = negotiate_encoding(Headers(scope=scope).get("accept-encoding"))
+        if encoding is None:
+            await self.app(scope, receive, _with_vary(send))
+            return
+
+        start_message = None
+        compressor: Optional[_StreamCompressor] = None
+        passthrough = False
+
+        async def send_compressed(message):
+            nonlocal start_message, compressor, passthrough
+            if message["type"] == "http.response.start":
+                start_message = message
+                return
+            if message["type"] != "http.response.body" or passthrough:
+                await send(message)
+                return
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if compressor is None:
+                headers = MutableHeaders(raw=start_message["headers"])
+                if "content-encoding" in headers or not is_compressible(headers.get("content-type")):
+                    passthrough = True
+                    await send(start_message)
+                    await send(message)
+                    return
+                _add_vary(headers)
+                if not more_body and len(body) < settings.COMPRESSION_MIN_SIZE:
+                    passthrough = True
+                    await send(start_message)
+                    await send(message)
+                    return
+                headers["Content-Encoding"] = encoding
+                if "etag" in headers:
+                    headers["ETag"] = encoded_etag(headers["etag"], encoding)
+                if not more_body:
+                    # Respuesta completa en un solo mensaje: se comprime de una vez
+                    body = await compress_off_loop(body, encoding)
+                    headers["Content-Length"] = str(len(body))
+                    await send(start_message)
+                    await send({"type": "http.response.body", "body": body})
+                    return
+                del headers["Content-Length"]
+                compressor = _StreamCompressor(encoding)
+                await send(start_message)
+            data = await compressor.chunk_off_loop(body) if body else b""
+            if not more_body:
+                data += compressor.finish()
+            await send({"type": "http.response.body", "body": data, "more_body": more_body})
+
+        await self.app(scope, receive, send_compressed)
+
+def _add_vary(headers: MutableHeaders) -> None:
+    # Las rutas con ETag ya lo agregan (check_not_modified); no se repite
+    vary = headers.get("vary", "")
+    if "accept-encoding" not in vary.lower():
+        headers.add_vary_header("Accept-Encoding")
+
+def _with_vary(send):
+    """
+    Para clientes que no piden compresión: la respuesta sale igual, pero una
+    caché intermedia debe saber que otros clientes pueden recibirla comprimida.
+    """
+    async def send_with_vary(message):
+        if message["type"] == "http.response.start":
+            headers = MutableHeaders(raw=message["headers"])
+            if "content-encoding" not in headers and is_compressible(headers.get("content-type")):
+                _add_vary(headers)
+        await send(message)
+    return send_with_vary
@@ -1,6 +1,8 @@
 # ferremas_api/config.py
 # ferremas_api/config.py
 
+from typing import Optional
+
 from pydantic_settings import BaseSettings
 from pydantic import HttpUrl, field_validator
 
@@ -10,6 +12,115 @@ class Settings(BaseSettings):
     SECRET_KEY: str
     ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 30
+    # Cantidad máxima de tokens verificados que se mantienen en caché
+    TOKEN_CACHE_SIZE: int = 10000
+
+    # Hash de contraseñas (bcrypt)
+    BCRYPT_ROUNDS: int = 12
+    PASSWORD_HASH_WORKERS: int = 4
+    PASSWORD_HASH_MAX_PENDING: int = 64
+    PASSWORD_REHASH_ENABLED: bool = False
+
+    # Cliente HTTP compartido hacia la API de la base de datos de Ferremas
+    HTTP_MAX_CONNECTIONS: int = 100
+    HTTP_MAX_KEEPALIVE_CONNECTIONS: int = 20
+    HTTP_KEEPALIVE_EXPIRY: float = 30.0
+    HTTP2_ENABLED: bool = True
+    # Timeouts por operación (segundos)
+    HTTP_CONNECT_TIMEOUT: float = 5.0
+    HTTP_READ_TIMEOUT: float = 10.0
+    HTTP_WRITE_TIMEOUT: float = 10.0
+    HTTP_POOL_TIMEOUT: float = 5.0
+
+    # Resiliencia frente a la API de Ferremas
+    # Plazo total de cada petición, incluidos reintentos (segundos)
+    UPSTREAM_DEADLINE_SECONDS: float = 12.0
+    UPSTREAM_RETRY_ATTEMPTS: int = 3
+    UPSTREAM_RETRY_BASE_DELAY_SECONDS: float = 0.1
+    UPSTREAM_RETRY_MAX_DELAY_SECONDS: float = 2.0
+    # Fallos seguidos que abren el circuito y tiempo hasta la petición de prueba
+    CIRCUIT_FAILURE_THRESHOLD: int = 5
+    CIRCUIT_RESET_SECONDS: float = 30.0
+    # Peticiones duplicadas cuando un GET supera el p95 reciente de su endpoint
+    UPSTREAM_HEDGE_ENABLED: bool = True
+    UPSTREAM_HEDGE_MIN_DELAY_SECONDS: float = 0.05
+    # Fracción máxima de peticiones que se pueden duplicar
+    UPSTREAM_HEDGE_MAX_RATIO: float = 0.1
+
+    # Métricas (/metrics) y perfilador por muestreo
+    METRICS_ENABLED: bool = True
+    PROFILER_ENABLED: bool = False
+    PROFILER_INTERVAL_MS: float = 10.0
+
+    # Caché en memoria del catálogo, sucursales y vendedores (segundos)
+    CATALOG_CACHE_TTL_SECONDS: float = 60.0
+    CATALOG_CACHE_MAX_STALE_SECONDS: float = 300.0
+
+    # Copia del catálogo en disco compartida por los workers del mismo host.
+    # Por defecto se usa un directorio temporal propio de FERREMAS_DB_API_URL.
+    SNAPSHOT_ENABLED: bool = True
+    SNAPSHOT_DIR: Optional[str] = None
+    SNAPSHOT_POLL_SECONDS: float = 1.0
+
+    # Operaciones masivas de productos
+    BATCH_MAX_ITEMS: int = 5000
+    BATCH_MAX_CONCURRENCY: int = 32
+
+    # Serialización de respuestas: "orjson" (si está instalado) o "json" (stdlib)
+    JSON_RESPONSE_CLASS: str = "orjson"
+    # Compresión negociada (gzip, o brotli si está instalado) desde este tamaño en bytes
+    COMPRESSION_ENABLED: bool = True
+    COMPRESSION_MIN_SIZE: int = 1024
+    COMPRESSION_GZIP_LEVEL: int = 6
+    COMPRESSION_BROTLI_QUALITY: int = 5
+    # Desde este tamaño se comprime en el threadpool para no bloquear el event loop
+    COMPRESSION_THREADPOOL_MIN_SIZE: int = 64 * 1024
+
+    # Cache-Control para respuestas públicas de catálogo y sucursales (segundos)
+    CACHE_CONTROL_MAX_AGE: int = 30
+    CACHE_CONTROL_STALE_WHILE_REVALIDATE: int = 60
+
+    # Pedidos: reservas de stock en memoria
+    ORDER_RESERVATION_TTL_SECONDS: float = 900.0
+    ORDER_SWEEP_INTERVAL_SECONDS: float = 1.0
+    # Ventana para agrupar las actualizaciones de stock hacia la API de Ferremas
+    ORDER_SYNC_INTERVAL_SECONDS: float = 0.5
+    ORDER_SYNC_RETRY_SECONDS: float = 5.0
+    # Pedidos terminados que se conservan para consultarlos por ID
+    ORDER_HISTORY_SIZE: int = 10000
+
+    # Canal de cambios del catálogo (WebSocket /ws/products y SSE /products/changes)
+    CHANGE_FEED_MAX_CONNECTIONS: int = 10000
+    # Eventos sin enviar por conexión; una conexión más lenta se cierra y debe resincronizar
+    CHANGE_FEED_MAX_PENDING: int = 256
+    # Eventos recientes que se reenvían al reconectar (Last-Event-ID)
+    CHANGE_FEED_REPLAY_SIZE: int = 1000
+    CHANGE_FEED_HEARTBEAT_SECONDS: float = 15.0
+
+    # Ingesta en segundo plano de escrituras sin respuesta inmediata (mensajes de contacto)
+    # Destino: "jsonl" o "sqlite"; sin INGEST_SINK_PATH se usa INGEST_DATA_DIR/contact.<ext>
+    INGEST_SINK: str = "jsonl"
+    INGEST_SINK_PATH: Optional[str] = None
+    INGEST_DATA_DIR: str = "data"
+    # "buffered" (sin fsync), "fsync" (fsync por tanda) o "sync" (la petición espera el fsync)
+    INGEST_DURABILITY: str = "fsync"
+    INGEST_QUEUE_SIZE: int = 10000
+    # Una tanda se escribe al juntar INGEST_BATCH_SIZE registros o al cumplirse la ventana
+    INGEST_BATCH_SIZE: int = 200
+    INGEST_FLUSH_INTERVAL_SECONDS: float = 0.5
+    # Espera máxima por lugar en la cola llena antes de responder 503
+    INGEST_ENQUEUE_TIMEOUT_SECONDS: float = 0.25
+    INGEST_RETRY_SECONDS: float = 5.0
+
+    # Conversión de divisas: archivo del BCE (por defecto el incluido en CurrencyConverter)
+    CURRENCY_RATES_FILE: Optional[str] = None
+    CURRENCY_REFRESH_SECONDS: float = 3600.0
+    # Monedas que el BCE no publica (p. ej. CLP): archivo JSON
+    # {"date": "AAAA-MM-DD", "rates_per_eur": {"CLP": 1050.0}} que un proceso externo
+    # mantiene al día; se recarga igual que el del BCE. Sin él no hay tasa para CLP
+    CURRENCY_EXTRA_RATES_FILE: Optional[str] = None
+    # Moneda en que la API de Ferremas informa los precios
+    CATALOG_CURRENCY: str = "CLP"
 
     @field_validator("ACCESS_TOKEN_EXPIRE_MINUTES")
     @classmethod
@@ -18,6 +129,41 @@ class Settings(BaseSettings):
             raise ValueError("ACCESS_TOKEN_EXPIRE_MINUTES debe ser mayor que 0")
         return v
 
+    @field_validator("BCRYPT_ROUNDS")
+    @classmethod
+    def check_bcrypt_rounds(cls, v):
+        if not 4 <= v <= 31:
+            raise ValueError("BCRYPT_ROUNDS debe estar entre 4 y 31")
+        return v
+
+    @field_validator("HTTP_MAX_CONNECTIONS", "HTTP_MAX_KEEPALIVE_CONNECTIONS")
+    @classmethod
+    def check_pool_limits(cls, v):
+        if v <= 0:
+            raise ValueError("Los límites del pool de conexiones deben ser mayores que 0")
+        return v
+
+    @field_validator("INGEST_SINK")
+    @classmethod
+    def check_ingest_sink(cls, v):
+        if v not in ("jsonl", "sqlite"):
+            raise ValueError("INGEST_SINK debe ser jsonl o sqlite")
+        return v
+
+    @field_validator("INGEST_DURABILITY")
+    @classmethod
+    def check_ingest_durability(cls, v):
+        if v not in ("buffered", "fsync", "sync"):
+            raise ValueError("INGEST_DURABILITY debe ser buffered, fsync o sync")
+        return v
+
+    @field_validator("INGEST_QUEUE_SIZE", "INGEST_BATCH_SIZE")
+    @classmethod
+    def check_ingest_sizes(cls, v):
+        if v <= 0:
+            raise ValueError("Los tamaños de la cola de ingesta deben ser mayores que 0")
+        return v
+
     class Config:
         env_file = ".env"
         env_file_encoding = "utf-8"
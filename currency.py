@@ -0,0 +1,187 @@
+# ferremas_api/currency.py
+import asyncio
+import json
+import logging
+import os
+from datetime import date
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+import currency_converter
+from currency_converter import CurrencyConverter
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+# Archivo del BCE incluido en el paquete CurrencyConverter (solo el último día publicado)
+BUNDLED_RATES_FILE = os.path.join(os.path.dirname(currency_converter.__file__), "eurofxref.csv")
+
+class UnsupportedCurrencyError(ValueError):
+    def __init__(self, currency: str):
+        self.currency = currency
+        super().__init__(f"Moneda no soportada: {currency}")
+
+class RateTable(NamedTuple):
+    """
+    Tasas vigentes expresadas como unidades de cada moneda por 1 EUR, con la
+    fecha de publicación de cada una (las del BCE y las externas pueden diferir).
+    """
+    rates: Dict[str, float]
+    dates: Dict[str, date]
+    as_of: date
+    version: int
+
+    def rate_date(self, *currencies: str) -> date:
+        """
+        Fecha de la tasa más antigua entre las monedas indicadas.
+        """
+        try:
+            return min(self.dates[code.upper()] for code in currencies)
+        except KeyError as e:
+            raise UnsupportedCurrencyError(e.args[0]) from None
+
+    def factor(self, from_currency: str, to_currency: str) -> float:
+        """
+        Multiplicador para pasar un monto de from_currency a to_currency.
+        """
+        try:
+            return self.rates[to_currency.upper()] / self.rates[from_currency.upper()]
+        except KeyError as e:
+            raise UnsupportedCurrencyError(e.args[0]) from None
+
+def load_extra_rates(path: str) -> Tuple[Dict[str, float], date]:
+    """
+    Lee el archivo JSON con las tasas que el BCE no publica:
+    {"date": "AAAA-MM-DD", "rates_per_eur": {"CLP": 1050.0}}.
+    """
+    with open(path, "rb") as f:
+        data = json.load(f)
+    rates = {str(code).upper(): float(rate) for code, rate in data["rates_per_eur"].items()}
+    if any(rate <= 0 for rate in rates.values()):
+        raise ValueError(f"Tasa no positiva en {path}")
+    return rates, date.fromisoformat(data["date"])
+
+def load_rate_table(path: str, extra_path: Optional[str], version: int) -> RateTable:
+    """
+    Lee un archivo del BCE (csv o zip histórico) y se queda solo con las tasas
+    del último día publicado. Las monedas que el BCE no publica (p. ej. CLP) se
+    agregan desde extra_path, con su propia fecha.
+    """
+    converter = CurrencyConverter(path)
+    as_of = max(bounds.last_date for bounds in converter.bounds.values())
+    rates = {"EUR": 1.0}
+    for code, bounds in converter.bounds.items():
+        # Monedas que el BCE dejó de publicar no se ofrecen con una tasa antigua
+        if code != "EUR" and bounds.last_date == as_of:
+            rates[code] = float(converter.convert(1, "EUR", code, date=as_of))
+    dates = dict.fromkeys(rates, as_of)
+    if extra_path is not None:
+        extra_rates, extra_as_of = load_extra_rates(extra_path)
+        rates.update(extra_rates)
+        dates.update(dict.fromkeys(extra_rates, extra_as_of))
+    return RateTable(rates=rates, dates=dates, as_of=as_of, version=version)
+
+class CurrencyService:
+    """
+    Conversión de divisas con las tasas cargadas en memoria una sola vez. Los
+    archivos se vuelven a leer periódicamente solo si cambiaron en disco, así un
+    proceso externo puede dejar tasas nuevas sin reiniciar la API.
+    """
+
+    def __init__(self, path: Optional[str], extra_path: Optional[str], refresh_interval: float):
+        self.path = path or BUNDLED_RATES_FILE
+        self.extra_path = extra_path
+        self.refresh_interval = refresh_interval
+        self._table: Optional[RateTable] = None
+        self._mtimes: Optional[Tuple[float, ...]] = None
+        self._refresh_task: Optional[asyncio.Task] = None
+        self.reloads = 0
+        self.reload_errors = 0
+
+    @property
+    def table(self) -> RateTable:
+        if self._table is None:
+            # Uso fuera del ciclo de vida de la app (scripts, pruebas)
+            self._load()
+        return self._table
+
+    def _file_mtimes(self) -> Tuple[float, ...]:
+        paths = (self.path,) if self.extra_path is None else (self.path, self.extra_path)
+        return tuple(os.path.getmtime(path) for path in paths)
+
+    def _load(self) -> None:
+        mtimes = self._file_mtimes()
+        version = self._table.version + 1 if self._table is not None else 1
+        self._table = load_rate_table(self.path, self.extra_path, version)
+        self._mtimes = mtimes
+        self.reloads += 1
+        logger.info(f"Tasas de cambio cargadas ({len(self._table.rates)} monedas, fecha {self._table.as_of})")
+        if settings.CATALOG_CURRENCY.upper() not in self._table.rates:
+            logger.warning(
+                f"Sin tasa para {settings.CATALOG_CURRENCY}, la moneda del catálogo: "
+                "configure CURRENCY_EXTRA_RATES_FILE para convertir precios"
+            )
+
+    async def start(self) -> None:
+        # El histórico del BCE tarda en parsearse: se carga en un hilo
+        await asyncio.to_thread(self._load)
+        if self._refresh_task is None:
+            self._refresh_task = asyncio.create_task(self._refresh_loop())
+
+    async def close(self) -> None:
+        if self._refresh_task is not None:
+            self._refresh_task.cancel()
+            try:
+                await self._refresh_task
+            except asyncio.CancelledError:
+                pass
+            self._refresh_task = None
+
+    async def _refresh_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.refresh_interval)
+            try:
+                if self._file_mtimes() != self._mtimes:
+                    await asyncio.to_thread(self._load)
+            except Exception:
+                self.reload_errors += 1
+                logger.exception("No se pudieron recargar las tasas de cambio; se mantienen las anteriores")
+
+    def currencies(self) -> List[str]:
+        return sorted(self.table.rates)
+
+    def convert(self, amount: float, from_currency: str, to_currency: str) -> float:
+        return amount * self.table.factor(from_currency, to_currency)
+
+    def convert_many(self, amounts: Iterable[float], from_currency: str, to_currencies: Iterable[str]) -> Dict[str, List[float]]:
+        """
+        Convierte una lista completa de montos a varias monedas calculando cada
+        tasa una sola vez. Los montos se redondean a 2 decimales.
+        """
+        table = self.table
+        amounts = list(amounts)
+        converted = {}
+        for code in to_currencies:
+            factor = table.factor(from_currency, code)
+            converted[code.upper()] = [round(amount * factor, 2) for amount in amounts]
+        return converted
+
+    def stats(self) -> Dict[str, object]:
+        table = self._table
+        return {
+            "currencies": len(table.rates) if table else 0,
+            "as_of": table.as_of.isoformat() if table else None,
+            "catalog_rate_as_of": (
+                table.dates[settings.CATALOG_CURRENCY.upper()].isoformat()
+                if table and settings.CATALOG_CURRENCY.upper() in table.dates else None
+            ),
+            "version": table.version if table else 0,
+            "reloads": self.reloads,
+            "reload_errors": self.reload_errors,
+        }
+
+currency_service = CurrencyService(
+    path=settings.CURRENCY_RATES_FILE,
+    extra_path=settings.CURRENCY_EXTRA_RATES_FILE,
+    refresh_interval=settings.CURRENCY_REFRESH_SECONDS,
+)
@@ -1,26 +1,153 @@
 # ferremas_api/database.py
+import asyncio
+import codecs
+import json
 import logging
-from typing import List, Dict, Any, Optional
+import re
+from typing import List, Dict, Any, Optional, AsyncIterator, Awaitable, Callable, Tuple, TypeVar, Union
 
 import httpx
+from pydantic import TypeAdapter
 
 from config import settings
 from models import Product, Branch, Seller
+from metrics import VALIDATION_DURATION
+from resilience import CircuitBreaker, CircuitOpenError, UpstreamGuard
 
 # Configurar logging
 logger = logging.getLogger(__name__)
 
+T = TypeVar("T")
+
+# Los datos de la API de Ferremas se validan en un solo paso desde los bytes de
+# la respuesta (validate_json), sin json.loads + Product(**item) por elemento.
+# Los mismos adaptadores serializan las listas en caché (dump_json).
+PRODUCT_LIST_ADAPTER = TypeAdapter(List[Product])
+BRANCH_LIST_ADAPTER = TypeAdapter(List[Branch])
+SELLER_LIST_ADAPTER = TypeAdapter(List[Seller])
+_SELLER_OR_LIST_ADAPTER = TypeAdapter(Union[List[Seller], Seller])
+
+# Cliente HTTP compartido por todas las rutas. Se crea en el lifespan de la
+# aplicación (ver main.py) para reutilizar conexiones keep-alive en lugar de
+# abrir un handshake TCP+TLS nuevo por cada petición a la API de Ferremas.
+_client: Optional[httpx.AsyncClient] = None
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+def _build_client() -> httpx.AsyncClient:
+    http2 = settings.HTTP2_ENABLED and _http2_available()
+    if settings.HTTP2_ENABLED and not http2:
+        logger.info("HTTP/2 no disponible (falta el paquete 'h2'); se usará HTTP/1.1")
+    return httpx.AsyncClient(
+        base_url=str(settings.FERREMAS_DB_API_URL),
+        headers={"token": settings.FERREMAS_DB_API_TOKEN},
+        http2=http2,
+        limits=httpx.Limits(
+            max_connections=settings.HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.HTTP_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=settings.HTTP_KEEPALIVE_EXPIRY,
+        ),
+        timeout=httpx.Timeout(
+            connect=settings.HTTP_CONNECT_TIMEOUT,
+            read=settings.HTTP_READ_TIMEOUT,
+            write=settings.HTTP_WRITE_TIMEOUT,
+            pool=settings.HTTP_POOL_TIMEOUT,
+        ),
+    )
+
+async def init_http_client() -> httpx.AsyncClient:
+    """
+    Crea el cliente HTTP compartido. Se llama al iniciar la aplicación.
+    """
+    return get_http_client()
+
+async def close_http_client() -> None:
+    """
+    Cierra el cliente HTTP compartido y libera el pool de conexiones.
+    """
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+def get_http_client() -> httpx.AsyncClient:
+    """
+    Devuelve el cliente compartido. Si la aplicación no pasó por el lifespan
+    (scripts, consola) se crea de forma perezosa.
+    """
+    global _client
+    if _client is None or _client.is_closed:
+        _client = _build_client()
+    return _client
+
+# Plazo, reintentos, circuit breaker y hedging para todas las peticiones a la API de Ferremas
+upstream_guard = UpstreamGuard(
+    get_client=get_http_client,
+    deadline=settings.UPSTREAM_DEADLINE_SECONDS,
+    retry_attempts=settings.UPSTREAM_RETRY_ATTEMPTS,
+    retry_base_delay=settings.UPSTREAM_RETRY_BASE_DELAY_SECONDS,
+    retry_max_delay=settings.UPSTREAM_RETRY_MAX_DELAY_SECONDS,
+    breaker=CircuitBreaker(
+        failure_threshold=settings.CIRCUIT_FAILURE_THRESHOLD,
+        reset_timeout=settings.CIRCUIT_RESET_SECONDS,
+    ),
+    hedge_enabled=settings.UPSTREAM_HEDGE_ENABLED,
+    hedge_min_delay=settings.UPSTREAM_HEDGE_MIN_DELAY_SECONDS,
+    hedge_max_ratio=settings.UPSTREAM_HEDGE_MAX_RATIO,
+)
+
+def get_resilience_stats() -> Dict[str, Any]:
+    return upstream_guard.stats()
+
+# Peticiones GET en vuelo por endpoint (single-flight): mientras una está en
+# curso, las llamadas concurrentes al mismo endpoint esperan su resultado en
+# lugar de repetir la petición hacia la API de Ferremas.
+_inflight: Dict[str, asyncio.Task] = {}
+_coalescing_stats = {"upstream_calls": 0, "coalesced_calls": 0}
+
+def get_coalescing_stats() -> Dict[str, int]:
+    return {**_coalescing_stats, "in_flight": len(_inflight)}
+
 async def fetch_from_ferremas_api(endpoint: str) -> Optional[List[Dict[str, Any]]]:
     """
     Función genérica para hacer peticiones GET a la API de Ferremas.
     """
-    url = f"{settings.FERREMAS_DB_API_URL}/{endpoint}"
-    headers = {"token": settings.FERREMAS_DB_API_TOKEN}
+    raw = await fetch_raw_from_ferremas_api(endpoint)
+    if raw is None:
+        return None
+    return json.loads(raw)
+
+async def fetch_raw_from_ferremas_api(endpoint: str) -> Optional[bytes]:
+    """
+    Petición GET a la API de Ferremas que devuelve el cuerpo sin interpretar.
+    Las llamadas concurrentes al mismo endpoint comparten una sola petición
+    (y su resultado o excepción).
+    """
+    task = _inflight.get(endpoint)
+    if task is None or task.done():
+        _coalescing_stats["upstream_calls"] += 1
+        task = asyncio.create_task(_get_from_ferremas_api(endpoint))
+        _inflight[endpoint] = task
+        task.add_done_callback(lambda t: _forget_inflight(endpoint, t))
+    else:
+        _coalescing_stats["coalesced_calls"] += 1
+    # shield: cancelar a un solicitante no cancela la petición compartida
+    return await asyncio.shield(task)
+
+def _forget_inflight(endpoint: str, task: asyncio.Task) -> None:
+    if _inflight.get(endpoint) is task:
+        del _inflight[endpoint]
+
+async def _get_from_ferremas_api(endpoint: str) -> Optional[bytes]:
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.get(url, headers=headers)
-            response.raise_for_status()
-            return response.json()
+        response = await upstream_guard.get(endpoint)
+        response.raise_for_status()
+        return response.content
     except httpx.HTTPStatusError as e:
         logger.error(f"Error HTTP al obtener {endpoint}: {e.response.status_code} - {e.response.text}")
         return None
@@ -34,12 +161,95 @@ async def fetch_product_data(product_id: Optional[int] = None) -> Optional[List[
     """
     endpoint = f"products/{product_id}" if product_id else "products"
     
-    data = await fetch_from_ferremas_api(endpoint)
-    if data:
+    raw = await fetch_raw_from_ferremas_api(endpoint)
+    if raw is None:
+        return None
+    with VALIDATION_DURATION.time("product"):
         if product_id:
-            return [Product(**data)]
-        return [Product(**item) for item in data]
-    return None
+            return [Product.model_validate_json(raw)]
+        return PRODUCT_LIST_ADAPTER.validate_json(raw) or None
+
+class JsonArrayStream:
+    """
+    Separa de forma incremental los elementos de un arreglo JSON de nivel superior,
+    a medida que llegan los bytes, sin cargar el documento completo en memoria.
+    """
+
+    _SEPARATORS = re.compile(r"[\s,]*")
+
+    def __init__(self):
+        self._decoder = json.JSONDecoder()
+        self._utf8 = codecs.getincrementaldecoder("utf-8")()
+        self._buffer = ""
+        self._started = False
+        self._finished = False
+
+    def feed(self, chunk: bytes) -> List[Any]:
+        buffer = self._buffer + self._utf8.decode(chunk)
+        items: List[Any] = []
+        pos = 0
+        while not self._finished:
+            pos = self._SEPARATORS.match(buffer, pos).end()
+            if pos >= len(buffer):
+                break
+            if not self._started:
+                if buffer[pos] != "[":
+                    raise ValueError("La respuesta no es un arreglo JSON")
+                self._started = True
+                pos += 1
+                continue
+            if buffer[pos] == "]":
+                self._finished = True
+                pos += 1
+                break
+            try:
+                item, pos = self._decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                # Elemento incompleto: se espera el siguiente bloque
+                break
+            items.append(item)
+        self._buffer = buffer[pos:]
+        return items
+
+    def close(self) -> None:
+        if not self._finished:
+            raise ValueError("El arreglo JSON terminó de forma inesperada")
+
+async def stream_product_data() -> AsyncIterator[Product]:
+    """
+    Recorre el catálogo completo producto a producto, interpretando la respuesta
+    de la API de Ferremas a medida que llega. La memoria usada no depende del
+    tamaño del catálogo. Los errores de la API se registran y se propagan.
+    """
+    client = get_http_client()
+    breaker = upstream_guard.breaker
+    try:
+        # Sin reintentos (ya se pueden haber enviado productos), pero con circuit breaker
+        breaker.before_call()
+        async with client.stream("GET", "products") as response:
+            if response.status_code >= 500:
+                breaker.record_failure()
+            else:
+                breaker.record_success()
+            response.raise_for_status()
+            parser = JsonArrayStream()
+            async for chunk in response.aiter_bytes():
+                for item in parser.feed(chunk):
+                    yield Product(**item)
+            parser.close()
+    except httpx.HTTPStatusError as e:
+        logger.error(f"Error HTTP al exportar productos: {e.response.status_code}")
+        raise
+    except CircuitOpenError as e:
+        logger.error(f"Exportación de productos rechazada: {e}")
+        raise
+    except asyncio.CancelledError:
+        breaker.record_cancelled()
+        raise
+    except httpx.RequestError as e:
+        breaker.record_failure()
+        logger.error(f"Error de red o conexión al exportar productos: {e}")
+        raise
 
 async def fetch_branch_data(branch_id: Optional[int] = None) -> Optional[List[Branch]]:
     """
@@ -47,12 +257,13 @@ async def fetch_branch_data(branch_id: Optional[int] = None) -> Optional[List[Br
     """
     endpoint = f"branches/{branch_id}" if branch_id else "branches"
 
-    data = await fetch_from_ferremas_api(endpoint)
-    if data:
+    raw = await fetch_raw_from_ferremas_api(endpoint)
+    if raw is None:
+        return None
+    with VALIDATION_DURATION.time("branch"):
         if branch_id:
-            return [Branch(**data)]
-        return [Branch(**item) for item in data]
-    return None
+            return [Branch.model_validate_json(raw)]
+        return BRANCH_LIST_ADAPTER.validate_json(raw) or None
 
 async def fetch_seller_data(branch_id: Optional[int] = None, seller_id: Optional[int] = None) -> Optional[List[Seller]]:
     """
@@ -65,27 +276,24 @@ async def fetch_seller_data(branch_id: Optional[int] = None, seller_id: Optional
     else:
         endpoint = "sellers"
 
-    data = await fetch_from_ferremas_api(endpoint)
-    if data:
-        if seller_id and not isinstance(data, list):
-            return [Seller(**data)]
-        return [Seller(**item) for item in data]
-    return None
+    raw = await fetch_raw_from_ferremas_api(endpoint)
+    if raw is None:
+        return None
+    with VALIDATION_DURATION.time("seller"):
+        data = _SELLER_OR_LIST_ADAPTER.validate_json(raw)
+    if isinstance(data, Seller):
+        return [data]
+    return data or None
 
 async def add_product_to_ferremas_api(product: Product) -> Optional[Product]:
     """
     Agrega un nuevo producto a la API de Ferremas.
     """
-    url = f"{settings.FERREMAS_DB_API_URL}/products"
-    headers = {
-        "token": settings.FERREMAS_DB_API_TOKEN,
-        "Content-Type": "application/json"
-    }
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.post(url, headers=headers, json=product.model_dump())
-            response.raise_for_status()
-            return Product(**response.json())
+        client = get_http_client()
+        response = await upstream_guard.send("products", lambda: client.post("products", json=product.model_dump()))
+        response.raise_for_status()
+        return Product(**response.json())
     except httpx.HTTPStatusError as e:
         logger.error(f"Error HTTP al agregar producto: {e.response.status_code} - {e.response.text}")
         return None
@@ -97,19 +305,49 @@ async def update_product_in_ferremas_api(product_id: int, product_update: dict)
     """
     Actualiza un producto existente en la API de Ferremas.
     """
-    url = f"{settings.FERREMAS_DB_API_URL}/products/{product_id}"
-    headers = {
-        "token": settings.FERREMAS_DB_API_TOKEN,
-        "Content-Type": "application/json"
-    }
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.put(url, headers=headers, json=product_update)
-            response.raise_for_status()
-            return Product(**response.json())
+        client = get_http_client()
+        response = await upstream_guard.send(f"products/{product_id}", lambda: client.put(f"products/{product_id}", json=product_update))
+        response.raise_for_status()
+        return Product(**response.json())
     except httpx.HTTPStatusError as e:
         logger.error(f"Error HTTP al actualizar producto: {e.response.status_code} - {e.response.text}")
         return None
     except httpx.RequestError as e:
         logger.error(f"Error de red o conexión al actualizar producto: {e}")
         return None
+
+async def _gather_bounded(calls: List[Callable[[], Awaitable[T]]], concurrency: Optional[int] = None) -> List[T]:
+    """
+    Ejecuta las llamadas con a lo sumo `concurrency` en curso a la vez, sobre el
+    mismo pool de conexiones, y devuelve los resultados en el mismo orden.
+    """
+    limit = min(concurrency or settings.BATCH_MAX_CONCURRENCY, settings.HTTP_MAX_CONNECTIONS)
+    semaphore = asyncio.Semaphore(limit)
+
+    async def run(call: Callable[[], Awaitable[T]]) -> T:
+        async with semaphore:
+            return await call()
+
+    return await asyncio.gather(*(run(call) for call in calls))
+
+async def fetch_products_by_id(product_ids: List[int], concurrency: Optional[int] = None) -> List[Optional[Product]]:
+    """
+    Obtiene varios productos por ID con concurrencia acotada. None donde no se pudo obtener.
+    """
+    async def fetch_one(product_id: int) -> Optional[Product]:
+        products = await fetch_product_data(product_id=product_id)
+        return products[0] if products else None
+
+    return await _gather_bounded([lambda pid=pid: fetch_one(pid) for pid in product_ids], concurrency)
+
+async def update_products_in_ferremas_api(
+    updates: List[Tuple[int, dict]], concurrency: Optional[int] = None
+) -> List[Optional[Product]]:
+    """
+    Aplica varias actualizaciones con concurrencia acotada. None donde la actualización falló.
+    """
+    return await _gather_bounded(
+        [lambda pid=pid, changes=changes: update_product_in_ferremas_api(pid, changes) for pid, changes in updates],
+        concurrency,
+    )
@@ -0,0 +1,105 @@
+# ferremas_api/geo.py
+import heapq
+import math
+from typing import Iterable, List, Optional, Tuple
+
+from models import Branch
+
+# Radio medio de la Tierra (km)
+EARTH_RADIUS_KM = 6371.0088
+
+Point = Tuple[float, float, float]
+
+def to_unit_vector(latitude: float, longitude: float) -> Point:
+    """
+    Coordenadas geográficas a un punto de la esfera unitaria. La distancia
+    euclidiana (cuerda) entre dos puntos crece igual que la distancia sobre la
+    superficie, así que el árbol puede ordenar por cuerda sin trigonometría.
+    """
+    lat, lon = math.radians(latitude), math.radians(longitude)
+    cos_lat = math.cos(lat)
+    return (cos_lat * math.cos(lon), cos_lat * math.sin(lon), math.sin(lat))
+
+def chord_to_km(chord: float) -> float:
+    return 2 * EARTH_RADIUS_KM * math.asin(min(chord / 2, 1.0))
+
+def km_to_chord(km: float) -> float:
+    if km >= math.pi * EARTH_RADIUS_KM:
+        return 2.0
+    return 2 * math.sin(km / (2 * EARTH_RADIUS_KM))
+
+# Nodo del árbol: (posición de la sucursal, eje, hijo izquierdo, hijo derecho)
+_Node = Tuple[int, int, Optional[tuple], Optional[tuple]]
+
+class BranchLocator:
+    """
+    Árbol k-d sobre las sucursales (como puntos 3D de la esfera unitaria) para
+    responder "las k más cercanas" y "las que están a menos de X km" sin
+    calcular la distancia a todas.
+    """
+
+    def __init__(self, branches: Iterable[Branch] = ()):
+        self._branches: List[Branch] = list(branches)
+        self._points: List[Point] = [to_unit_vector(b.latitude, b.longitude) for b in self._branches]
+        self._root = self._build(list(range(len(self._branches))), 0)
+
+    def __len__(self) -> int:
+        return len(self._branches)
+
+    def _build(self, positions: List[int], depth: int) -> Optional[_Node]:
+        if not positions:
+            return None
+        axis = depth % 3
+        positions.sort(key=lambda i: self._points[i][axis])
+        middle = len(positions) // 2
+        return (
+            positions[middle],
+            axis,
+            self._build(positions[:middle], depth + 1),
+            self._build(positions[middle + 1:], depth + 1),
+        )
+
+    def nearest(
+        self,
+        latitude: float,
+        longitude: float,
+        limit: int = 5,
+        radius_km: Optional[float] = None,
+    ) -> List[Tuple[Branch, float]]:
+        """
+        Devuelve [(sucursal, distancia_km)] de la más cercana a la más lejana.
+        Con radius_km solo se consideran sucursales dentro de ese radio.
+        """
+        if limit <= 0 or self._root is None:
+            return []
+        target = to_unit_vector(latitude, longitude)
+        # Se compara con el cuadrado de la cuerda para evitar raíces
+        radius_sq = km_to_chord(radius_km) ** 2 if radius_km is not None else math.inf
+        points = self._points
+        # Max-heap (por distancia negada) con las mejores `limit` candidatas
+        best: List[Tuple[float, int]] = []
+        # Pila de (nodo, distancia² mínima posible a su región)
+        stack = [(self._root, 0.0)]
+        while stack:
+            node, bound_sq = stack.pop()
+            worst = -best[0][0] if len(best) == limit else radius_sq
+            if bound_sq > worst:
+                continue
+            position, axis, left, right = node
+            point = points[position]
+            dx, dy, dz = point[0] - target[0], point[1] - target[1], point[2] - target[2]
+            dist_sq = dx * dx + dy * dy + dz * dz
+            if dist_sq <= worst:
+                if len(best) == limit:
+                    heapq.heapreplace(best, (-dist_sq, position))
+                else:
+                    heapq.heappush(best, (-dist_sq, position))
+                worst = -best[0][0] if len(best) == limit else radius_sq
+            diff = target[axis] - point[axis]
+            near, far = (left, right) if diff < 0 else (right, left)
+            # El lado lejano solo se visita si el plano de corte está más cerca que la peor candidata
+            if far is not None and diff * diff <= worst:
+                stack.append((far, diff * diff))
+            if near is not None:
+                stack.append((near, bound_sq))
+        return [(self._branches[position], chord_to_km(math.sqrt(-neg))) for neg, position in sorted(best, reverse=True)]
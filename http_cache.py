@@ -0,0 +1,108 @@
+# ferremas_api/http_cache.py
+import hashlib
+import json
+import logging
+from typing import Any, Optional, Type, Union
+
+from fastapi import Request, Response
+from fastapi.responses import JSONResponse, ORJSONResponse
+
+from compression import decoded_etag, encoded_etag, negotiate_encoding
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+def default_response_class() -> Type[Response]:
+    """
+    Clase de respuesta por defecto de la app, según JSON_RESPONSE_CLASS.
+    orjson serializa varias veces más rápido que el módulo json de la stdlib.
+    """
+    if settings.JSON_RESPONSE_CLASS == "orjson":
+        if orjson is not None:
+            return ORJSONResponse
+        logger.warning("JSON_RESPONSE_CLASS=orjson pero el paquete 'orjson' no está instalado; se usará json")
+    return JSONResponse
+
+def dumps_json(content: Any) -> bytes:
+    """
+    Serializa dicts/listas simples con el mismo motor que las respuestas por defecto.
+    """
+    if orjson is not None and settings.JSON_RESPONSE_CLASS == "orjson":
+        return orjson.dumps(content)
+    return json.dumps(content, ensure_ascii=False, separators=(",", ":")).encode()
+
+def make_etag(*parts: Union[str, bytes, memoryview]) -> str:
+    """
+    ETag fuerte a partir de contenido (o de otros ETags + parámetros de la consulta).
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    for part in parts:
+        digest.update(part.encode() if isinstance(part, str) else part)
+        digest.update(b"\0")
+    return f'"{digest.hexdigest()}"'
+
+def cache_control() -> str:
+    return (
+        f"public, max-age={settings.CACHE_CONTROL_MAX_AGE}, "
+        f"stale-while-revalidate={settings.CACHE_CONTROL_STALE_WHILE_REVALIDATE}"
+    )
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> Optional[str]:
+    """
+    ETag de If-None-Match que corresponde a `etag` (o a una de sus versiones
+    comprimidas, ver encoded_etag); None si ninguno.
+    """
+    if not if_none_match:
+        return None
+    if if_none_match.strip() == "*":
+        return etag
+    # Comparación débil (RFC 9110): se ignora el prefijo W/
+    for tag in if_none_match.split(","):
+        tag = tag.strip().removeprefix("W/")
+        if decoded_etag(tag) == etag:
+            return tag
+    return None
+
+def check_not_modified(request: Request, response: Response, etag: str) -> Optional[Response]:
+    """
+    Agrega ETag y Cache-Control a la respuesta. Si el cliente ya tiene esa
+    versión (If-None-Match) devuelve un 304 sin cuerpo que la ruta debe retornar,
+    con el ETag de la representación que el cliente tiene (comprimida o no).
+    """
+    headers = {"ETag": etag, "Cache-Control": cache_control()}
+    if settings.COMPRESSION_ENABLED:
+        headers["Vary"] = "Accept-Encoding"
+    matched = etag_matches(request.headers.get("if-none-match"), etag)
+    if matched is not None:
+        return Response(status_code=304, headers={**headers, "ETag": matched})
+    response.headers.update(headers)
+    return None
+
+def raw_json_response(body: bytes, response: Response, status_code: int = 200) -> Response:
+    """
+    Respuesta con JSON ya serializado. Evita que FastAPI vuelva a validar y
+    serializar el contenido con el response_model. Conserva los encabezados
+    que la ruta haya agregado (ETag, Cache-Control, X-Next-Cursor...).
+    """
+    return Response(content=body, status_code=status_code, media_type="application/json", headers=dict(response.headers))
+
+async def snapshot_response(request: Request, response: Response, snapshot) -> Response:
+    """
+    Devuelve la copia serializada de una SnapshotCache. Si el cliente acepta
+    gzip o brotli se envían los bytes ya comprimidos de esa versión: cada
+    versión se comprime una sola vez y las peticiones siguientes solo copian memoria.
+    """
+    body = snapshot.json_bytes()
+    response.headers["Vary"] = "Accept-Encoding"
+    encoding = negotiate_encoding(request.headers.get("accept-encoding"))
+    if encoding is not None and len(body) >= settings.COMPRESSION_MIN_SIZE:
+        body = await snapshot.compressed_bytes(encoding)
+        response.headers["Content-Encoding"] = encoding
+        if "etag" in response.headers:
+            response.headers["ETag"] = encoded_etag(response.headers["etag"], encoding)
+    return raw_json_response(body, response)
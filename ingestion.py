@@ -0,0 +1,366 @@
+# ferremas_api/ingestion.py
+import asyncio
+import fcntl
+import json
+import logging
+import os
+import sqlite3
+import time
+import uuid
+from collections import deque
+from datetime import datetime, timezone
+from typing import Any, Deque, Dict, List, Optional
+
+from config import settings
+from metrics import INGEST_BATCH_SIZE, INGEST_FLUSH_DURATION
+
+logger = logging.getLogger(__name__)
+
+# Niveles de durabilidad (INGEST_DURABILITY):
+# - buffered: 202 de inmediato; cada tanda se escribe sin fsync (puede perderse
+#   lo último ante un corte de luz, no ante un reinicio del proceso ordenado)
+# - fsync: 202 de inmediato; cada tanda se escribe y se sincroniza a disco
+# - sync: la petición espera a que su tanda esté escrita y sincronizada
+DURABILITY_LEVELS = ("buffered", "fsync", "sync")
+
+class QueueFullError(Exception):
+    pass
+
+class IngestionError(Exception):
+    pass
+
+class JsonlSink:
+    """
+    Un registro JSON por línea. Cada tanda se agrega con una sola escritura en
+    modo append, así varios workers pueden compartir el archivo.
+
+    Si la escritura queda incompleta o falla el fsync, el archivo se trunca al
+    largo que tenía antes de la tanda: al reintentarla no quedan líneas
+    duplicadas ni una línea cortada. El lock exclusivo evita que otro worker
+    agregue en medio y que el truncado borre sus líneas.
+    """
+
+    def __init__(self, path: str, fsync: bool):
+        self.path = path
+        self.fsync = fsync
+        self._fd: Optional[int] = None
+
+    def write(self, records: List[Dict[str, Any]]) -> None:
+        if self._fd is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            self._fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o640)
+        data = "".join(json.dumps(record, ensure_ascii=False, default=str) + "\n" for record in records).encode()
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+        try:
+            offset = os.fstat(self._fd).st_size
+            try:
+                written = os.write(self._fd, data)
+                if written != len(data):
+                    raise OSError(f"Escritura incompleta en {self.path}")
+                if self.fsync:
+                    os.fsync(self._fd)
+            except OSError:
+                self._rollback(offset)
+                raise
+        finally:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def _rollback(self, offset: int) -> None:
+        try:
+            os.ftruncate(self._fd, offset)
+        except OSError:
+            # Se propaga el error original; la tanda se reintentará igual
+            logger.exception(f"No se pudo deshacer la escritura parcial en {self.path}")
+
+    def close(self) -> None:
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+class SqliteSink:
+    """
+    Tabla `records` (id, kind, received_at, payload JSON). Una transacción por tanda.
+    """
+
+    def __init__(self, path: str, fsync: bool):
+        self.path = path
+        self.fsync = fsync
+        self._connection: Optional[sqlite3.Connection] = None
+
+    def _connect(self) -> sqlite3.Connection:
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        # Se usa solo desde el hilo de escritura de la cola, pero no siempre el mismo
+        connection = sqlite3.connect(self.path, timeout=10.0, check_same_thread=False)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute(f"PRAGMA synchronous={'FULL' if self.fsync else 'NORMAL'}")
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS records ("
+            "id TEXT PRIMARY KEY, kind TEXT NOT NULL, received_at TEXT NOT NULL, payload TEXT NOT NULL)"
+        )
+        connection.commit()
+        return connection
+
+    def write(self, records: List[Dict[str, Any]]) -> None:
+        if self._connection is None:
+            self._connection = self._connect()
+        with self._connection:
+            self._connection.executemany(
+                "INSERT OR IGNORE INTO records (id, kind, received_at, payload) VALUES (?, ?, ?, ?)",
+                [
+                    (record["id"], record["kind"], record["received_at"], json.dumps(record["data"], ensure_ascii=False, default=str))
+                    for record in records
+                ],
+            )
+
+    def close(self) -> None:
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+def create_sink(kind: str, name: str, path: Optional[str], fsync: bool):
+    """
+    Destino según INGEST_SINK; sin ruta explícita, `<name>.jsonl` o
+    `<name>.sqlite3` dentro de INGEST_DATA_DIR.
+    """
+    if kind == "jsonl":
+        return JsonlSink(path or os.path.join(settings.INGEST_DATA_DIR, f"{name}.jsonl"), fsync)
+    if kind == "sqlite":
+        return SqliteSink(path or os.path.join(settings.INGEST_DATA_DIR, f"{name}.sqlite3"), fsync)
+    raise ValueError(f"Destino de ingesta desconocido: {kind}")
+
+class _Pending:
+    __slots__ = ("record", "enqueued_at", "done")
+
+    def __init__(self, record: Dict[str, Any], done: Optional[asyncio.Future]):
+        self.record = record
+        self.enqueued_at = time.monotonic()
+        self.done = done
+
+class BatchingQueue:
+    """
+    Cola en memoria, acotada, para escrituras que no necesitan respuesta inmediata
+    (mensajes de contacto y similares).
+
+    La petición solo encola el registro y responde 202; un worker en segundo
+    plano arma tandas de hasta `batch_size` registros, o lo que haya llegado en
+    `flush_interval` segundos, y las escribe en el destino (archivo o SQLite)
+    en un hilo. Con la cola llena, la petición espera hasta `enqueue_timeout`
+    y después se rechaza (503): la presión vuelve al cliente en vez de crecer
+    la memoria. Una tanda que no se pudo escribir se reintenta sin perderla,
+    salvo con durabilidad "sync": ahí la petición recibe el error y el
+    registro no se guarda.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        sink,
+        max_size: int,
+        batch_size: int,
+        flush_interval: float,
+        enqueue_timeout: float,
+        retry_interval: float,
+        durability: str,
+    ):
+        if durability not in DURABILITY_LEVELS:
+            raise ValueError(f"Durabilidad desconocida: {durability}")
+        self.name = name
+        self.sink = sink
+        self.max_size = max_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.enqueue_timeout = enqueue_timeout
+        self.retry_interval = retry_interval
+        self.durability = durability
+        # Registros en espera, del más antiguo al más nuevo
+        self._queue: Deque[_Pending] = deque()
+        self._not_empty = asyncio.Event()
+        self._not_full = asyncio.Event()
+        self._worker: Optional[asyncio.Task] = None
+        # Tanda que se está escribiendo (o reintentando); cuenta para la profundidad
+        self._in_flight: List[_Pending] = []
+        self._writing: Optional[asyncio.Future] = None
+        self._stats = {
+            "enqueued": 0,
+            "rejected": 0,
+            "written": 0,
+            "batches": 0,
+            "write_errors": 0,
+            "dropped": 0,
+        }
+        self.last_flush_ms: Optional[float] = None
+
+    @property
+    def depth(self) -> int:
+        return len(self._queue) + len(self._in_flight)
+
+    def start(self) -> None:
+        if self._worker is None:
+            self._not_empty = asyncio.Event()
+            self._not_full = asyncio.Event()
+            self._worker = asyncio.create_task(self._run())
+
+    async def close(self) -> None:
+        """
+        Detiene el worker y escribe lo que quede en la cola antes de cerrar el destino.
+        """
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+        if self._writing is not None:
+            # Una escritura en curso termina en su hilo aunque se cancele el worker:
+            # se espera su resultado para no escribir la tanda dos veces
+            if await self._writing:
+                self._resolve(self._in_flight, None)
+                self._in_flight = []
+            self._writing = None
+        remaining = self._in_flight + self._drain()
+        self._in_flight = []
+        for start in range(0, len(remaining), self.batch_size):
+            batch = remaining[start:start + self.batch_size]
+            if await self._write(batch):
+                self._resolve(batch, None)
+            else:
+                self._stats["dropped"] += len(batch)
+                logger.error(f"Se descartan {len(batch)} registros de {self.name} no escritos al apagar")
+                self._resolve(batch, IngestionError("No se pudo guardar el registro"))
+        await asyncio.to_thread(self.sink.close)
+
+    async def submit(self, kind: str, data: Dict[str, Any]) -> str:
+        """
+        Encola un registro y devuelve su ID. Con durabilidad "sync" espera a que
+        quede escrito. Lanza QueueFullError si la cola sigue llena pasado
+        enqueue_timeout, e IngestionError si el destino no está disponible.
+        """
+        if self._worker is None:
+            raise IngestionError(f"La cola {self.name} no está iniciada")
+        record = {
+            "id": uuid.uuid4().hex,
+            "kind": kind,
+            "received_at": datetime.now(timezone.utc).isoformat(),
+            "data": data,
+        }
+        done = asyncio.get_running_loop().create_future() if self.durability == "sync" else None
+        pending = _Pending(record, done)
+        deadline = time.monotonic() + self.enqueue_timeout
+        while len(self._queue) >= self.max_size:
+            self._not_full.clear()
+            try:
+                await asyncio.wait_for(self._not_full.wait(), max(0.0, deadline - time.monotonic()))
+            except asyncio.TimeoutError:
+                self._stats["rejected"] += 1
+                raise QueueFullError(f"Cola {self.name} llena")
+        self._queue.append(pending)
+        self._not_empty.set()
+        self._stats["enqueued"] += 1
+        if done is not None:
+            await done
+        return record["id"]
+
+    def _take(self) -> _Pending:
+        pending = self._queue.popleft()
+        self._not_full.set()
+        return pending
+
+    def _drain(self) -> List[_Pending]:
+        items = list(self._queue)
+        self._queue.clear()
+        self._not_full.set()
+        return items
+
+    async def _wait_not_empty(self, timeout: Optional[float]) -> bool:
+        if not self._queue:
+            self._not_empty.clear()
+            try:
+                await asyncio.wait_for(self._not_empty.wait(), timeout)
+            except asyncio.TimeoutError:
+                return False
+        return bool(self._queue)
+
+    async def _fill_batch(self) -> None:
+        # Espera el primer registro; desde ahí, hasta llenar la tanda o cumplir la
+        # ventana. Se acumula en _in_flight para no perder nada si se cancela.
+        while not await self._wait_not_empty(None):
+            pass
+        self._in_flight.append(self._take())
+        deadline = time.monotonic() + self.flush_interval
+        while len(self._in_flight) < self.batch_size:
+            if not self._queue:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not await self._wait_not_empty(remaining):
+                    break
+            self._in_flight.append(self._take())
+
+    async def _run(self) -> None:
+        while True:
+            if not self._in_flight:
+                await self._fill_batch()
+            self._writing = asyncio.ensure_future(self._write(self._in_flight))
+            written = await asyncio.shield(self._writing)
+            self._writing = None
+            if written:
+                self._resolve(self._in_flight, None)
+                self._in_flight = []
+            else:
+                # Con durabilidad "sync" la petición recibe el error y el registro se
+                # descarta: no se reintenta algo que el cliente ya sabe que falló
+                waiting = [pending for pending in self._in_flight if pending.done is not None]
+                if waiting:
+                    self._resolve(waiting, IngestionError("No se pudo guardar el registro"))
+                    self._in_flight = [pending for pending in self._in_flight if pending.done is None]
+                    self._stats["dropped"] += len(waiting)
+                await asyncio.sleep(self.retry_interval)
+
+    async def _write(self, batch: List[_Pending]) -> bool:
+        started = time.perf_counter()
+        try:
+            await asyncio.to_thread(self.sink.write, [pending.record for pending in batch])
+        except Exception:
+            self._stats["write_errors"] += 1
+            logger.exception(f"Error al escribir una tanda de {len(batch)} registros de {self.name}")
+            return False
+        elapsed = time.perf_counter() - started
+        self.last_flush_ms = elapsed * 1000
+        INGEST_FLUSH_DURATION.observe(elapsed, self.name)
+        INGEST_BATCH_SIZE.observe(len(batch), self.name)
+        self._stats["batches"] += 1
+        self._stats["written"] += len(batch)
+        return True
+
+    @staticmethod
+    def _resolve(batch: List[_Pending], error: Optional[Exception]) -> None:
+        for pending in batch:
+            if pending.done is not None and not pending.done.done():
+                if error is None:
+                    pending.done.set_result(None)
+                else:
+                    pending.done.set_exception(error)
+
+    def stats(self) -> Dict[str, Any]:
+        oldest = None
+        if self._in_flight:
+            oldest = self._in_flight[0].enqueued_at
+        elif self._queue:
+            oldest = self._queue[0].enqueued_at
+        return {
+            **self._stats,
+            "depth": self.depth,
+            "max_depth": self.max_size,
+            "oldest_age_seconds": round(time.monotonic() - oldest, 3) if oldest is not None else 0.0,
+            "last_flush_ms": round(self.last_flush_ms, 3) if self.last_flush_ms is not None else None,
+        }
+
+contact_queue = BatchingQueue(
+    name="contact",
+    sink=create_sink(settings.INGEST_SINK, "contact", settings.INGEST_SINK_PATH, fsync=settings.INGEST_DURABILITY != "buffered"),
+    max_size=settings.INGEST_QUEUE_SIZE,
+    batch_size=settings.INGEST_BATCH_SIZE,
+    flush_interval=settings.INGEST_FLUSH_INTERVAL_SECONDS,
+    enqueue_timeout=settings.INGEST_ENQUEUE_TIMEOUT_SECONDS,
+    retry_interval=settings.INGEST_RETRY_SECONDS,
+    durability=settings.INGEST_DURABILITY,
+)
@@ -1,82 +1,163 @@
 # ferremas_api/main.py
 # ferremas_api/main.py
-from fastapi import FastAPI, HTTPException
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Depends, Query, Request, Response, status
+from fastapi.responses import PlainTextResponse
+from fastapi.security import OAuth2PasswordRequestForm
 from typing import List
 import logging
 import os
 import uvicorn
-import httpx
 
 from config import settings
-from models import Product, Branch, Seller
-
-app = FastAPI()
+from models import Seller, Token, UserInDB
+from database import init_http_client, close_http_client, get_coalescing_stats, get_resilience_stats
+from catalog import catalog_cache
+from orders import order_engine
+from currency import currency_service
+from auth import (
+    authenticate_user,
+    create_access_token,
+    has_roles,
+    get_token_cache_stats,
+    shutdown_password_executor,
+)
+from compression import CompressionMiddleware
+from http_cache import default_response_class, snapshot_response
+from metrics import MetricsMiddleware, profiler, registry, stats_collector
+from snapshot_store import snapshot_store
+from routes import products, branches, orders, currency, changes, contact
+from change_feed import change_feed
+from ingestion import contact_queue
 
 logger = logging.getLogger("ferremas_api")
 logging.basicConfig(level=logging.INFO)
 
-async def fetch_from_ferremas_api(endpoint: str):
-    url = f"{settings.FERREMAS_DB_API_URL}/{endpoint}"
-    headers = {"token": settings.FERREMAS_DB_API_TOKEN}
-    try:
-        async with httpx.AsyncClient() as client:
-            response = await client.get(url, headers=headers)
-            response.raise_for_status()
-            return response.json()
-    except httpx.HTTPStatusError as e:
-        logger.error(f"Error HTTP al obtener {endpoint}: {e.response.status_code} - {e.response.text}")
-    except httpx.RequestError as e:
-        logger.error(f"Error de red o conexión al obtener {endpoint}: {e}")
-    return None
-
-@app.get("/products", response_model=List[Product])
-async def get_products():
-    data = await fetch_from_ferremas_api("products")
-    if data is None:
-        raise HTTPException(status_code=500, detail="Error al obtener productos")
-    return [Product(**item) for item in data]
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Un único cliente HTTP (con pool de conexiones) compartido por todas las rutas
+    await init_http_client()
+    if settings.SNAPSHOT_ENABLED:
+        # Carga la última copia del catálogo en disco antes de atender peticiones
+        await snapshot_store.start()
+    order_engine.start()
+    change_feed.start()
+    contact_queue.start()
+    await currency_service.start()
+    if settings.PROFILER_ENABLED:
+        profiler.start(settings.PROFILER_INTERVAL_MS / 1000)
+    yield
+    profiler.stop()
+    # Escribe los mensajes que sigan en la cola antes de apagar
+    await contact_queue.close()
+    await currency_service.close()
+    # Cierra las conexiones del canal de cambios (WebSocket y SSE)
+    await change_feed.close()
+    # Antes de cerrar el cliente HTTP, para enviar el stock pendiente
+    await order_engine.close()
+    await snapshot_store.close()
+    await catalog_cache.close()
+    await close_http_client()
+    shutdown_password_executor()
 
-@app.get("/products/{product_id}", response_model=Product)
-async def get_product(product_id: int):
-    data = await fetch_from_ferremas_api(f"products/{product_id}")
-    if data is None:
-        raise HTTPException(status_code=404, detail="Producto no encontrado")
-    return Product(**data)
+app = FastAPI(lifespan=lifespan, default_response_class=default_response_class())
 
-@app.get("/branches", response_model=List[Branch])
-async def get_branches():
-    data = await fetch_from_ferremas_api("branches")
-    if data is None:
-        raise HTTPException(status_code=500, detail="Error al obtener sucursales")
-    return [Branch(**item) for item in data]
+if settings.COMPRESSION_ENABLED:
+    app.add_middleware(CompressionMiddleware)
+# Se agrega después de la compresión para quedar por fuera y medir los bytes enviados
+if settings.METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware)
+    # Los mismos contadores de /internal/stats, en formato Prometheus
+    registry.add_collector(stats_collector("ferremas_catalog_cache", "Caché del catálogo", catalog_cache.stats, label="cache"))
+    registry.add_collector(stats_collector("ferremas_upstream_coalescing", "Peticiones agrupadas hacia la API", get_coalescing_stats))
+    registry.add_collector(stats_collector("ferremas_upstream", "Resiliencia frente a la API de Ferremas", get_resilience_stats))
+    registry.add_collector(stats_collector("ferremas_token_cache", "Caché de tokens verificados", get_token_cache_stats))
+    registry.add_collector(stats_collector("ferremas_orders", "Motor de pedidos", order_engine.stats))
+    registry.add_collector(stats_collector("ferremas_currency", "Tasas de cambio", currency_service.stats))
+    registry.add_collector(stats_collector("ferremas_snapshot", "Copias del catálogo en disco", snapshot_store.stats))
+    registry.add_collector(stats_collector("ferremas_change_feed", "Canal de cambios del catálogo", change_feed.stats))
+    registry.add_collector(stats_collector("ferremas_ingest_contact", "Cola de mensajes de contacto", contact_queue.stats))
 
-@app.get("/branches/{branch_id}", response_model=Branch)
-async def get_branch(branch_id: int):
-    data = await fetch_from_ferremas_api(f"branches/{branch_id}")
-    if data is None:
-        raise HTTPException(status_code=404, detail="Sucursal no encontrada")
-    return Branch(**data)
+# Antes de products: /products/changes no debe tomarse como /products/{product_id}
+app.include_router(changes.router)
+app.include_router(products.router)
+app.include_router(branches.router)
+app.include_router(orders.router)
+app.include_router(currency.router)
+app.include_router(contact.router)
 
-@app.get("/branches/{branch_id}/sellers", response_model=List[Seller])
-async def get_sellers_by_branch(branch_id: int):
-    data = await fetch_from_ferremas_api(f"branches/{branch_id}/sellers")
-    if data is None:
-        raise HTTPException(status_code=500, detail="Error al obtener vendedores")
-    return [Seller(**item) for item in data]
+@app.post("/token", response_model=Token, summary="Obtener token de acceso")
+async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends()):
+    """
+    Autentica con usuario y contraseña y devuelve un JWT con el usuario y sus roles.
+    La verificación de bcrypt se hace fuera del event loop.
+    """
+    user = await authenticate_user(form_data.username, form_data.password)
+    if not user:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Usuario o contraseña incorrectos",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    access_token = create_access_token(data={"sub": user.username, "roles": user.roles})
+    return Token(access_token=access_token, token_type="bearer")
 
 @app.get("/sellers", response_model=List[Seller])
-async def get_sellers():
-    data = await fetch_from_ferremas_api("sellers")
-    if data is None:
+async def get_sellers(request: Request, response: Response):
+    sellers = await catalog_cache.sellers.get()
+    if sellers is None:
         raise HTTPException(status_code=500, detail="Error al obtener vendedores")
-    return [Seller(**item) for item in data]
+    return await snapshot_response(request, response, catalog_cache.sellers)
+
+@app.get("/internal/stats", summary="Estadísticas internas de caché")
+async def get_internal_stats(current_user: UserInDB = Depends(has_roles(["admin"]))):
+    """
+    Contadores de hits/misses/refrescos para medir cuánto tráfico se evita hacia la API de Ferremas.
+    """
+    return {
+        "catalog_cache": catalog_cache.stats(),
+        "upstream_coalescing": get_coalescing_stats(),
+        "upstream_resilience": get_resilience_stats(),
+        "token_cache": get_token_cache_stats(),
+        "orders": order_engine.stats(),
+        "currency": currency_service.stats(),
+        "profiler": profiler.stats(),
+        "snapshots": snapshot_store.stats(),
+        "change_feed": change_feed.stats(),
+        "contact_queue": contact_queue.stats(),
+    }
+
+@app.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+async def get_metrics():
+    """
+    Métricas en formato de texto de Prometheus.
+    """
+    if not settings.METRICS_ENABLED:
+        raise HTTPException(status_code=404, detail="Métricas deshabilitadas")
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
+@app.post("/internal/profiler", summary="Encender o apagar el perfilador por muestreo")
+async def toggle_profiler(
+    enabled: bool = Query(..., description="true para encender, false para apagar"),
+    interval_ms: float = Query(10.0, ge=1, le=1000, description="Intervalo de muestreo"),
+    current_user: UserInDB = Depends(has_roles(["admin"]))
+):
+    if enabled:
+        # Se llama desde el hilo del event loop: es el hilo que se muestrea
+        profiler.start(interval_ms / 1000)
+    else:
+        profiler.stop()
+    return profiler.stats()
 
-@app.get("/sellers/{seller_id}", response_model=Seller)
-async def get_seller(seller_id: int):
-    data = await fetch_from_ferremas_api(f"sellers/{seller_id}")
-    if data is None:
-        raise HTTPException(status_code=404, detail="Vendedor no encontrado")
-    return Seller(**data)
+@app.get("/internal/profiler", response_class=PlainTextResponse, summary="Pilas más frecuentes del perfilador")
+async def get_profiler_report(
+    limit: int = Query(200, ge=1, le=10000),
+    current_user: UserInDB = Depends(has_roles(["admin"]))
+):
+    """
+    Pilas en formato "collapsed" (flamegraph.pl / speedscope), de la más frecuente a la menos.
+    """
+    return PlainTextResponse(profiler.collapsed(limit))
 
 @app.get("/")
 async def root():
@@ -0,0 +1,288 @@
+# ferremas_api/metrics.py
+import sys
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter as _StackCounter
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+# Métricas en memoria expuestas en formato de texto de Prometheus (ver /metrics).
+# Registrar un valor es una búsqueda en un dict y un bisect, sin locks: todo
+# se actualiza desde el event loop.
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+FAST_LATENCY_BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.05)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216, 67108864)
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help_text: str, label_names: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(label_names)
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, label_names: Tuple[str, ...] = ()):
+        super().__init__(name, help_text, label_names)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *label_values: str, amount: float = 1) -> None:
+        self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self) -> List[str]:
+        return self.header() + [
+            f"{self.name}{_format_labels(self.label_names, labels)} {_format_value(value)}"
+            for labels, value in self._values.items()
+        ]
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, *label_values: str, amount: float = 1) -> None:
+        self.inc(*label_values, amount=-amount)
+
+    def set(self, value: float, *label_values: str) -> None:
+        self._values[label_values] = value
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, label_names: Tuple[str, ...] = (), buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        super().__init__(name, help_text, label_names)
+        self.buckets = tuple(buckets)
+        # labels -> [conteo por bucket (+Inf al final), suma]
+        self._series: Dict[Tuple[str, ...], List[Any]] = {}
+
+    def observe(self, value: float, *label_values: str) -> None:
+        series = self._series.get(label_values)
+        if series is None:
+            series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+
+    @contextmanager
+    def time(self, *label_values: str) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, *label_values)
+
+    def render(self) -> List[str]:
+        lines = self.header()
+        for labels, (counts, total) in self._series.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = 'le="' + _format_value(bound) + '"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.label_names, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.label_names, labels)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.label_names, labels)} {cumulative}")
+        return lines
+
+# Un colector devuelve [(nombre, ayuda, [(etiquetas, valor)])] al momento de exponer
+Collector = Callable[[], List[Tuple[str, str, List[Tuple[Dict[str, str], float]]]]]
+
+class Registry:
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+        self._collectors: List[Collector] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector: Collector) -> None:
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for collector in self._collectors:
+            for name, help_text, samples in collector():
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} gauge")
+                for labels, value in samples:
+                    names = tuple(labels)
+                    lines.append(f"{name}{_format_labels(names, tuple(labels[n] for n in names))} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+registry = Registry()
+
+HTTP_IN_FLIGHT = registry.register(Gauge(
+    "ferremas_http_requests_in_flight", "Peticiones HTTP en curso"))
+HTTP_REQUEST_DURATION = registry.register(Histogram(
+    "ferremas_http_request_duration_seconds", "Duración de las peticiones HTTP por ruta",
+    ("method", "route", "status")))
+HTTP_RESPONSE_SIZE = registry.register(Histogram(
+    "ferremas_http_response_size_bytes", "Tamaño del cuerpo de las respuestas por ruta",
+    ("method", "route"), buckets=SIZE_BUCKETS))
+UPSTREAM_REQUEST_DURATION = registry.register(Histogram(
+    "ferremas_upstream_request_duration_seconds", "Duración de cada intento hacia la API de Ferremas",
+    ("endpoint", "status", "attempt")))
+VALIDATION_DURATION = registry.register(Histogram(
+    "ferremas_validation_duration_seconds", "Validación con Pydantic de las respuestas de la API de Ferremas",
+    ("model",)))
+JWT_VERIFY_DURATION = registry.register(Histogram(
+    "ferremas_jwt_verify_duration_seconds", "Verificación de JWT (solo las que no están en caché)",
+    buckets=FAST_LATENCY_BUCKETS))
+INGEST_FLUSH_DURATION = registry.register(Histogram(
+    "ferremas_ingest_flush_duration_seconds", "Escritura de cada tanda de la cola de ingesta en su destino",
+    ("queue",)))
+INGEST_BATCH_SIZE = registry.register(Histogram(
+    "ferremas_ingest_batch_size", "Registros por tanda escrita de la cola de ingesta",
+    ("queue",), buckets=(1, 5, 10, 25, 50, 100, 250, 500, 1000)))
+
+def stats_collector(name: str, help_text: str, stats: Callable[[], Dict[str, Any]], label: Optional[str] = None) -> Collector:
+    """
+    Expone los contadores numéricos de una función de estadísticas (las mismas
+    de /internal/stats) como métricas `<name>_<clave>`. Con `label`, el primer
+    nivel del dict se usa como etiqueta (p. ej. cache="products").
+    """
+    def collect():
+        groups = stats().items() if label else [(None, stats())]
+        series: Dict[str, List[Tuple[Dict[str, str], float]]] = {}
+        for group, values in groups:
+            labels = {label: group} if label else {}
+            for key, value in values.items():
+                if isinstance(value, bool) or not isinstance(value, (int, float)):
+                    continue
+                series.setdefault(f"{name}_{key}", []).append((labels, value))
+        return [(metric, help_text, samples) for metric, samples in series.items()]
+    return collect
+
+class MetricsMiddleware:
+    """
+    Middleware ASGI: peticiones en curso, duración y tamaño de respuesta por
+    ruta. Se etiqueta con la plantilla de la ruta ("/products/{product_id}"),
+    no con la URL, para no crear una serie por ID.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        started = time.perf_counter()
+        status_code = 500
+        size = 0
+
+        async def send_with_metrics(message):
+            nonlocal status_code, size
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            elif message["type"] == "http.response.body":
+                size += len(message.get("body", b""))
+            await send(message)
+
+        HTTP_IN_FLIGHT.inc()
+        try:
+            await self.app(scope, receive, send_with_metrics)
+        finally:
+            HTTP_IN_FLIGHT.dec()
+            route = scope.get("route")
+            path = getattr(route, "path", "unmatched")
+            method = scope["method"]
+            HTTP_REQUEST_DURATION.observe(time.perf_counter() - started, method, path, str(status_code))
+            HTTP_RESPONSE_SIZE.observe(size, method, path)
+
+class SamplingProfiler:
+    """
+    Perfilador por muestreo para producción: un hilo toma cada `interval`
+    segundos la pila del hilo del event loop y cuenta las pilas repetidas.
+    Apagado no tiene costo; encendido, el costo depende del intervalo.
+    El reporte usa el formato "collapsed" (flamegraph.pl, speedscope).
+    """
+
+    MAX_DEPTH = 64
+
+    def __init__(self):
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._stacks: _StackCounter = _StackCounter()
+        # El hilo de muestreo escribe y el event loop lee el reporte
+        self._lock = threading.Lock()
+        self.interval = 0.01
+        self.samples = 0
+        self.started_at: Optional[float] = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, interval: float, thread_id: Optional[int] = None) -> None:
+        """
+        Empieza a muestrear el hilo indicado (por defecto, el que llama: el del event loop).
+        """
+        if self.running:
+            return
+        self.interval = interval
+        with self._lock:
+            self._stacks.clear()
+        self.samples = 0
+        self.started_at = time.time()
+        self._stop.clear()
+        target = thread_id if thread_id is not None else threading.get_ident()
+        self._thread = threading.Thread(target=self._run, args=(target,), name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+
+    def _run(self, thread_id: int) -> None:
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(thread_id)
+            if frame is None:
+                continue
+            names = []
+            while frame is not None and len(names) < self.MAX_DEPTH:
+                code = frame.f_code
+                module = frame.f_globals.get("__name__", "?")
+                names.append(f"{module}:{code.co_name}")
+                frame = frame.f_back
+            with self._lock:
+                self._stacks[";".join(reversed(names))] += 1
+            self.samples += 1
+
+    def collapsed(self, limit: Optional[int] = None) -> str:
+        with self._lock:
+            top = self._stacks.most_common(limit)
+        return "".join(f"{stack} {count}\n" for stack, count in top)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "running": self.running,
+            "interval_ms": round(self.interval * 1000, 3),
+            "samples": self.samples,
+            "distinct_stacks": len(self._stacks),
+            "started_at": self.started_at,
+        }
+
+profiler = SamplingProfiler()
@@ -1,6 +1,7 @@
 # ferremas_api/models.py
-from pydantic import BaseModel, EmailStr
-from typing import Optional, List
+from pydantic import BaseModel, EmailStr, Field
+from typing import Dict, Optional, List
+from datetime import date, datetime
 
 # --- Modelos de usuario y autenticación ---
 
@@ -35,6 +36,17 @@ class Product(BaseModel):
     is_promotion: bool = False
     is_new_product: bool = False
 
+class ProductUpdate(BaseModel):
+    # Actualización parcial: solo se envían a la API los campos presentes
+    name: Optional[str] = None
+    description: Optional[str] = None
+    price: Optional[float] = None
+    stock: Optional[int] = None
+    category: Optional[str] = None
+    brand: Optional[str] = None
+    is_promotion: Optional[bool] = None
+    is_new_product: Optional[bool] = None
+
 class Branch(BaseModel):
     id: int
     name: str
@@ -44,30 +56,84 @@ class Branch(BaseModel):
     latitude: float
     longitude: float
 
+class BranchDistance(Branch):
+    distance_km: float
+
 class Seller(BaseModel):
     id: Optional[int] = None
     name: str
     email: EmailStr
     branch_id: int
 
+class BranchStockSummary(BaseModel):
+    # La API de Ferremas lleva el stock por producto, no por sucursal: los
+    # totales son del catálogo y las reservas son las de los pedidos de la sucursal
+    products: int
+    in_stock: int
+    out_of_stock: int
+    total_units: int
+    pending_orders: int
+    reserved_units: int
+
+class BranchOverview(BaseModel):
+    branch: Branch
+    sellers: List[Seller]
+    stock: BranchStockSummary
+
+# --- Modelos para operaciones masivas de productos ---
+
+class ProductBatchRequest(BaseModel):
+    ids: List[int] = Field(..., min_length=1)
+
+class ProductBatchUpdateItem(BaseModel):
+    id: int
+    changes: ProductUpdate
+
+class ProductBatchUpdateRequest(BaseModel):
+    updates: List[ProductBatchUpdateItem] = Field(..., min_length=1)
+
+class BatchItemResult(BaseModel):
+    id: int
+    success: bool
+    product: Optional[Product] = None
+    error: Optional[str] = None
+
+class ProductBatchResult(BaseModel):
+    succeeded: int
+    failed: int
+    results: List[BatchItemResult]
+
 # --- Modelos para pedidos y contacto ---
 
 class OrderItem(BaseModel):
     product_id: int
-    quantity: int
+    quantity: int = Field(..., gt=0)
 
 class SingleOrder(BaseModel):
     client_username: str
-    items: List[OrderItem]
+    items: List[OrderItem] = Field(..., min_length=1)
+    branch_id: int
+
+class OrderReservation(BaseModel):
+    order_id: str
+    status: str
+    client_username: str
     branch_id: int
+    items: List[OrderItem]
+    expires_at: datetime
 
 class ContactMessage(BaseModel):
-    client_name: str
+    # Largos acotados: los mensajes esperan en una cola en memoria antes de guardarse
+    client_name: str = Field(..., max_length=200)
     client_email: EmailStr
-    subject: str
-    message: str
+    subject: str = Field(..., max_length=200)
+    message: str = Field(..., max_length=5000)
     seller_id: Optional[int] = None
 
+class ContactReceipt(BaseModel):
+    id: str
+    status: str
+
 # --- Modelos para integración externa ---
 
 class StripePayment(BaseModel):
@@ -80,3 +146,16 @@ class CurrencyConversion(BaseModel):
     from_currency: str
     to_currency: str
     converted_amount: float
+    # Fecha de publicación de la tasa más antigua usada
+    rate_date: date
+
+class CurrencyConversionRequest(BaseModel):
+    amount: float = Field(..., ge=0)
+    from_currency: str = Field(..., min_length=3, max_length=3)
+    to_currency: str = Field(..., min_length=3, max_length=3)
+
+class ProductPrices(BaseModel):
+    id: int
+    price: float
+    currency: str
+    converted: Dict[str, float]
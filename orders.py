@@ -0,0 +1,471 @@
+# ferremas_api/orders.py
+import asyncio
+import heapq
+import logging
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+from config import settings
+from models import OrderItem, OrderReservation, SingleOrder
+from database import fetch_products_by_id, update_products_in_ferremas_api
+from catalog import catalog_cache
+
+logger = logging.getLogger(__name__)
+
+PENDING = "pending"
+CONFIRMED = "confirmed"
+CANCELLED = "cancelled"
+EXPIRED = "expired"
+
+class OrderError(Exception):
+    pass
+
+class UnknownProductError(OrderError):
+    def __init__(self, product_ids: List[int]):
+        self.product_ids = product_ids
+        super().__init__(f"Productos no encontrados: {product_ids}")
+
+class InsufficientStockError(OrderError):
+    def __init__(self, shortages: Dict[int, int]):
+        # product_id -> unidades disponibles
+        self.shortages = shortages
+        super().__init__(f"Stock insuficiente: {shortages}")
+
+class OrderNotFoundError(OrderError):
+    pass
+
+class OrderStateError(OrderError):
+    def __init__(self, order_id: str, status: str):
+        self.status = status
+        super().__init__(f"El pedido {order_id} está {status}")
+
+class StockEntry:
+    __slots__ = ("on_hand", "reserved")
+
+    def __init__(self, on_hand: int):
+        self.on_hand = on_hand
+        self.reserved = 0
+
+    @property
+    def available(self) -> int:
+        return self.on_hand - self.reserved
+
+class StockLedger:
+    """
+    Existencias por producto (on_hand) y unidades apartadas por pedidos pendientes (reserved).
+
+    Ninguna operación hace await: dentro del event loop cada una se ejecuta
+    completa sin intercalarse con otra, así una reserva de varios productos es
+    atómica (todo o nada) sin locks.
+    """
+
+    def __init__(self):
+        self._entries: Dict[int, StockEntry] = {}
+
+    def __contains__(self, product_id: int) -> bool:
+        return product_id in self._entries
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def seed(self, product_id: int, stock: int) -> None:
+        """
+        Registra el stock inicial de un producto; no pisa uno ya registrado.
+        """
+        if product_id not in self._entries:
+            self._entries[product_id] = StockEntry(stock)
+
+    def set_on_hand(self, product_id: int, stock: int) -> None:
+        entry = self._entries.get(product_id)
+        if entry is None:
+            self._entries[product_id] = StockEntry(stock)
+        else:
+            entry.on_hand = stock
+
+    def get(self, product_id: int) -> Optional[StockEntry]:
+        return self._entries.get(product_id)
+
+    def reserve(self, items: Dict[int, int]) -> None:
+        shortages = {
+            pid: max(self._entries[pid].available, 0)
+            for pid, quantity in items.items()
+            if self._entries[pid].available < quantity
+        }
+        if shortages:
+            raise InsufficientStockError(shortages)
+        for pid, quantity in items.items():
+            self._entries[pid].reserved += quantity
+
+    def release(self, items: Dict[int, int]) -> None:
+        for pid, quantity in items.items():
+            self._entries[pid].reserved -= quantity
+
+    def commit(self, items: Dict[int, int]) -> Dict[int, int]:
+        """
+        Descuenta definitivamente lo reservado. Devuelve el nuevo stock de cada producto.
+        """
+        new_stock = {}
+        for pid, quantity in items.items():
+            entry = self._entries[pid]
+            entry.reserved -= quantity
+            entry.on_hand -= quantity
+            new_stock[pid] = entry.on_hand
+        return new_stock
+
+class _Reservation:
+    __slots__ = ("order_id", "client_username", "branch_id", "items", "status", "deadline", "expires_at")
+
+    def __init__(self, order: SingleOrder, items: Dict[int, int], ttl: float):
+        self.order_id = uuid.uuid4().hex
+        self.client_username = order.client_username
+        # La API de Ferremas solo lleva stock total por producto: la sucursal queda
+        # registrada en el pedido, no en el libro de stock
+        self.branch_id = order.branch_id
+        self.items = items
+        self.status = PENDING
+        self.deadline = time.monotonic() + ttl
+        self.expires_at = datetime.now(timezone.utc) + timedelta(seconds=ttl)
+
+    def to_model(self) -> OrderReservation:
+        return OrderReservation(
+            order_id=self.order_id,
+            status=self.status,
+            client_username=self.client_username,
+            branch_id=self.branch_id,
+            items=[OrderItem(product_id=pid, quantity=quantity) for pid, quantity in self.items.items()],
+            expires_at=self.expires_at,
+        )
+
+class OrderEngine:
+    """
+    Reserva stock al crear un pedido, lo descuenta al confirmarlo y lo libera al
+    cancelarlo o cuando vence la reserva.
+
+    El stock se lleva en memoria (StockLedger), inicializado desde el catálogo la
+    primera vez que se pide cada producto. Los descuentos confirmados se envían a
+    la API de Ferremas en segundo plano, agrupados, sin bloquear los pedidos.
+
+    Se envían como diferencias: en cada sincronización se lee el stock actual de
+    la API, se le restan las unidades vendidas en este proceso y se escribe el
+    resultado, que pasa a ser el on_hand del libro. Así las ventas de otros
+    workers (cada uno tiene su propio libro) se incorporan en cada sincronización
+    en vez de pisarse. Entre dos sincronizaciones un worker no ve las ventas de
+    los demás: la garantía de no sobrevender es exacta solo con un worker.
+    """
+
+    def __init__(
+        self,
+        load_stock: Callable[[List[int]], Awaitable[Dict[int, int]]],
+        push_stock: Callable[[Dict[int, int], Dict[int, int]], Awaitable[Dict[int, Optional[int]]]],
+        ttl: float,
+        sweep_interval: float,
+        sync_interval: float,
+        sync_retry: float,
+        history_size: int,
+    ):
+        self.ledger = StockLedger()
+        self.ttl = ttl
+        self.sweep_interval = sweep_interval
+        self.sync_interval = sync_interval
+        self.sync_retry = sync_retry
+        self.history_size = history_size
+        self._load_stock = load_stock
+        self._push_stock = push_stock
+        self._pending: Dict[str, _Reservation] = {}
+        self._finished: "OrderedDict[str, _Reservation]" = OrderedDict()
+        # (vencimiento, order_id); puede tener entradas de pedidos ya terminados
+        self._deadlines: List[Tuple[float, str]] = []
+        # product_id -> unidades confirmadas aún no descontadas en la API de Ferremas
+        self._dirty: Dict[int, int] = {}
+        # Productos cuyo on_hand debe escribirse tal cual en la API (ver set_stock)
+        self._restore: Set[int] = set()
+        # Cambios de stock externos por producto, para detectar los que ocurren durante un envío
+        self._resets: Dict[int, int] = {}
+        self._sync_event = asyncio.Event()
+        self._tasks: List[asyncio.Task] = []
+        # Se llaman con (branch_id, {product_id: unidades disponibles}) cada vez
+        # que un pedido cambia el stock disponible
+        self._listeners: List[Callable[[int, Dict[int, int]], None]] = []
+        self._stats = {
+            "placed": 0,
+            "confirmed": 0,
+            "cancelled": 0,
+            "expired": 0,
+            "rejected": 0,
+            "syncs": 0,
+            "sync_errors": 0,
+        }
+
+    def start(self) -> None:
+        if not self._tasks:
+            self._sync_event = asyncio.Event()
+            if self._dirty or self._restore:
+                self._sync_event.set()
+            self._tasks = [asyncio.create_task(self._sweep_loop()), asyncio.create_task(self._sync_loop())]
+
+    def add_listener(self, listener: Callable[[int, Dict[int, int]], None]) -> None:
+        self._listeners.append(listener)
+
+    def _notify(self, reservation: _Reservation) -> None:
+        if not self._listeners:
+            return
+        available = {pid: self.ledger.get(pid).available for pid in reservation.items}
+        for listener in self._listeners:
+            try:
+                listener(reservation.branch_id, available)
+            except Exception:
+                logger.exception("Error en un suscriptor de cambios de stock")
+
+    async def close(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        for task in self._tasks:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._tasks = []
+        # Último intento de enviar los descuentos pendientes antes de apagar
+        if self._dirty or self._restore:
+            await self._flush()
+
+    async def place(self, order: SingleOrder) -> OrderReservation:
+        """
+        Reserva todas las unidades del pedido o ninguna.
+        Lanza UnknownProductError o InsufficientStockError.
+        """
+        items: Dict[int, int] = {}
+        for item in order.items:
+            items[item.product_id] = items.get(item.product_id, 0) + item.quantity
+        missing = [pid for pid in items if pid not in self.ledger]
+        if missing:
+            stocks = await self._load_stock(missing)
+            unknown = [pid for pid in missing if pid not in stocks]
+            if unknown:
+                raise UnknownProductError(unknown)
+            for pid in missing:
+                self.ledger.seed(pid, stocks[pid])
+        # Desde aquí no hay awaits: la reserva no se intercala con otros pedidos
+        try:
+            self.ledger.reserve(items)
+        except InsufficientStockError:
+            self._stats["rejected"] += 1
+            raise
+        reservation = _Reservation(order, items, self.ttl)
+        self._pending[reservation.order_id] = reservation
+        heapq.heappush(self._deadlines, (reservation.deadline, reservation.order_id))
+        self._stats["placed"] += 1
+        self._notify(reservation)
+        return reservation.to_model()
+
+    def get(self, order_id: str) -> OrderReservation:
+        reservation = self._pending.get(order_id) or self._finished.get(order_id)
+        if reservation is None:
+            raise OrderNotFoundError(order_id)
+        return reservation.to_model()
+
+    def confirm(self, order_id: str) -> OrderReservation:
+        reservation = self._take_pending(order_id)
+        self.ledger.commit(reservation.items)
+        self._finish(reservation, CONFIRMED)
+        for pid, quantity in reservation.items.items():
+            self._dirty[pid] = self._dirty.get(pid, 0) + quantity
+        self._sync_event.set()
+        return reservation.to_model()
+
+    def cancel(self, order_id: str) -> OrderReservation:
+        reservation = self._take_pending(order_id)
+        self.ledger.release(reservation.items)
+        self._finish(reservation, CANCELLED)
+        self._notify(reservation)
+        return reservation.to_model()
+
+    def available(self, product_id: int) -> Optional[int]:
+        """
+        Unidades que aún se pueden reservar, o None si el producto no está en el libro.
+        """
+        entry = self.ledger.get(product_id)
+        return entry.available if entry is not None else None
+
+    def branch_reservations(self, branch_id: int) -> Tuple[int, int]:
+        """
+        Pedidos pendientes de la sucursal y unidades que tienen reservadas.
+        """
+        orders = units = 0
+        for reservation in self._pending.values():
+            if reservation.branch_id == branch_id:
+                orders += 1
+                units += sum(reservation.items.values())
+        return orders, units
+
+    def set_stock(self, product_id: int, stock: int) -> None:
+        """
+        Aplica un cambio de stock ya escrito en la API fuera de los pedidos (p. ej.
+        reposición). El valor nuevo es absoluto: reemplaza las ventas aún no
+        sincronizadas, que no deben volver a descontarse sobre él.
+        """
+        self._resets[product_id] = self._resets.get(product_id, 0) + 1
+        self._dirty.pop(product_id, None)
+        self._restore.discard(product_id)
+        if product_id in self.ledger:
+            self.ledger.set_on_hand(product_id, stock)
+
+    def _take_pending(self, order_id: str) -> _Reservation:
+        reservation = self._pending.get(order_id)
+        if reservation is None:
+            finished = self._finished.get(order_id)
+            if finished is None:
+                raise OrderNotFoundError(order_id)
+            raise OrderStateError(order_id, finished.status)
+        if reservation.deadline <= time.monotonic():
+            self._expire(reservation)
+            raise OrderStateError(order_id, EXPIRED)
+        return reservation
+
+    def _finish(self, reservation: _Reservation, status: str) -> None:
+        reservation.status = status
+        self._stats[status] += 1
+        del self._pending[reservation.order_id]
+        self._finished[reservation.order_id] = reservation
+        while len(self._finished) > self.history_size:
+            self._finished.popitem(last=False)
+
+    def _expire(self, reservation: _Reservation) -> None:
+        self.ledger.release(reservation.items)
+        self._finish(reservation, EXPIRED)
+        self._notify(reservation)
+
+    def sweep(self) -> int:
+        """
+        Libera las reservas vencidas. Devuelve cuántas se liberaron.
+        """
+        now = time.monotonic()
+        expired = 0
+        while self._deadlines and self._deadlines[0][0] <= now:
+            _, order_id = heapq.heappop(self._deadlines)
+            reservation = self._pending.get(order_id)
+            if reservation is not None:
+                self._expire(reservation)
+                expired += 1
+        return expired
+
+    async def _sweep_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            self.sweep()
+
+    async def _sync_loop(self) -> None:
+        while True:
+            await self._sync_event.wait()
+            self._sync_event.clear()
+            # Se espera un poco para enviar en una sola tanda los descuentos de varios pedidos
+            await asyncio.sleep(self.sync_interval)
+            if not await self._flush():
+                await asyncio.sleep(self.sync_retry)
+                self._sync_event.set()
+
+    async def _flush(self) -> bool:
+        if not self._dirty and not self._restore:
+            return True
+        # Los productos a restaurar se escriben con su on_hand, que ya incluye las ventas locales
+        absolute = {pid: self.ledger.get(pid).on_hand for pid in self._restore if pid in self.ledger}
+        self._restore.clear()
+        for pid in absolute:
+            self._dirty.pop(pid, None)
+        deltas = dict(self._dirty)
+        resets = {pid: self._resets.get(pid, 0) for pid in (*deltas, *absolute)}
+        try:
+            results = await self._push_stock(deltas, absolute)
+        except Exception:
+            logger.exception("Error inesperado al sincronizar stock con la API de Ferremas")
+            results = {}
+        self._stats["syncs"] += 1
+        failed = 0
+        for pid in (*deltas, *absolute):
+            stock = results.get(pid)
+            if self._resets.get(pid, 0) != resets[pid]:
+                # set_stock durante el envío: lo escrito pudo pisar el valor nuevo, se vuelve a escribir
+                self._restore.add(pid)
+                continue
+            if stock is None:
+                failed += 1
+                if pid in absolute:
+                    self._restore.add(pid)
+                continue
+            if pid in deltas:
+                left = self._dirty.get(pid, 0) - deltas[pid]
+                if left > 0:
+                    self._dirty[pid] = left
+                else:
+                    self._dirty.pop(pid, None)
+            # El valor de la API incluye las ventas de otros workers; las confirmadas
+            # aquí durante el envío siguen pendientes
+            self.ledger.set_on_hand(pid, stock - self._dirty.get(pid, 0))
+        if failed:
+            self._stats["sync_errors"] += failed
+            logger.warning(f"No se pudo sincronizar el stock de {failed} productos; se reintentará")
+        return failed == 0
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self._stats,
+            "pending_orders": len(self._pending),
+            "tracked_products": len(self.ledger),
+            "sync_pending": len(self._dirty) + len(self._restore),
+        }
+
+async def _load_catalog_stock(product_ids: List[int]) -> Dict[int, int]:
+    """
+    Stock de los productos según el catálogo en caché; los que no estén se piden a la API.
+    """
+    index = await catalog_cache.product_index()
+    stocks: Dict[int, int] = {}
+    missing = []
+    for pid in product_ids:
+        product = index.get(pid) if index is not None else None
+        if product is None:
+            missing.append(pid)
+        else:
+            stocks[pid] = product.stock
+    if missing:
+        for product in await fetch_products_by_id(missing):
+            if product is not None:
+                stocks[product.id] = product.stock
+    return stocks
+
+async def _push_catalog_stock(deltas: Dict[int, int], absolute: Dict[int, int]) -> Dict[int, Optional[int]]:
+    """
+    Descuenta `deltas` del stock actual de la API (leído justo antes) y escribe
+    `absolute` tal cual. Devuelve el stock resultante por producto, None si falló.
+    """
+    targets = dict(absolute)
+    if deltas:
+        current = await fetch_products_by_id(list(deltas))
+        for (pid, sold), product in zip(deltas.items(), current):
+            if product is None:
+                continue
+            target = product.stock - sold
+            if target < 0:
+                logger.warning(f"Stock negativo del producto {pid} al sincronizar ({target}); se deja en 0")
+                target = 0
+            targets[pid] = target
+    results: Dict[int, Optional[int]] = {pid: None for pid in (*deltas, *absolute)}
+    updated = await update_products_in_ferremas_api([(pid, {"stock": stock}) for pid, stock in targets.items()])
+    written = [product for product in updated if product is not None]
+    catalog_cache.upsert_products(written)
+    for product in written:
+        results[product.id] = product.stock
+    return results
+
+order_engine = OrderEngine(
+    load_stock=_load_catalog_stock,
+    push_stock=_push_catalog_stock,
+    ttl=settings.ORDER_RESERVATION_TTL_SECONDS,
+    sweep_interval=settings.ORDER_SWEEP_INTERVAL_SECONDS,
+    sync_interval=settings.ORDER_SYNC_INTERVAL_SECONDS,
+    sync_retry=settings.ORDER_SYNC_RETRY_SECONDS,
+    history_size=settings.ORDER_HISTORY_SIZE,
+)
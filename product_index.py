@@ -0,0 +1,232 @@
+# ferremas_api/product_index.py
+import base64
+import json
+import math
+from bisect import bisect_left, bisect_right, insort
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from models import Product
+
+# Claves de orden: cada una termina en el id para que sean únicas y el cursor sea estable
+SORT_KEYS: Dict[str, Callable[[Product], tuple]] = {
+    "id": lambda p: (p.id,),
+    "price": lambda p: (p.price, p.id),
+    "name": lambda p: (p.name.lower(), p.id),
+}
+SORT_OPTIONS = sorted(list(SORT_KEYS) + [f"-{field}" for field in SORT_KEYS])
+
+class InvalidCursorError(ValueError):
+    pass
+
+def encode_cursor(sort: str, key: tuple) -> str:
+    return base64.urlsafe_b64encode(json.dumps([sort, *key]).encode()).decode().rstrip("=")
+
+def decode_cursor(sort: str, cursor: str) -> tuple:
+    """
+    Devuelve la clave de orden guardada en el cursor, validando que pertenezca al mismo orden.
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        value = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, TypeError) as e:
+        raise InvalidCursorError("Cursor inválido") from e
+    if not isinstance(value, list) or len(value) < 2 or value[0] != sort:
+        raise InvalidCursorError("El cursor no corresponde al orden solicitado")
+    return tuple(value[1:])
+
+class ProductIndex:
+    """
+    Índices en memoria sobre el catálogo: por id, categoría, marca, promoción,
+    novedad y listas ordenadas (precio, nombre, id) para rangos y paginación
+    por cursor sin recorrer el catálogo completo.
+    """
+
+    def __init__(self, products: Iterable[Product] = ()):
+        self.by_id: Dict[int, Product] = {}
+        self.by_category: Dict[str, Set[int]] = {}
+        self.by_brand: Dict[str, Set[int]] = {}
+        self.promotions: Set[int] = set()
+        self.new_products: Set[int] = set()
+        # Totales de stock del catálogo, mantenidos en cada alta/baja
+        self.out_of_stock: Set[int] = set()
+        self.total_units = 0
+        self._orders: Dict[str, List[tuple]] = {field: [] for field in SORT_KEYS}
+        for product in products:
+            self._add(product, sort=False)
+        for keys in self._orders.values():
+            keys.sort()
+
+    def __len__(self) -> int:
+        return len(self.by_id)
+
+    def get(self, product_id: int) -> Optional[Product]:
+        return self.by_id.get(product_id)
+
+    def upsert(self, product: Product) -> None:
+        old = self.by_id.get(product.id)
+        if old is not None:
+            self._remove(old)
+        self._add(product, sort=True)
+
+    def upsert_many(self, products: Iterable[Product]) -> None:
+        """
+        Aplica un lote: las listas ordenadas se filtran y reordenan una vez en
+        lugar de un insort (y un borrado) por producto.
+        """
+        latest = {product.id: product for product in products}
+        if len(latest) == 1:
+            self.upsert(next(iter(latest.values())))
+            return
+        old = [self.by_id[pid] for pid in latest if pid in self.by_id]
+        for product in old:
+            self._remove(product, orders=False)
+        for field, key_of in SORT_KEYS.items():
+            stale = {key_of(product) for product in old}
+            if stale:
+                self._orders[field] = [key for key in self._orders[field] if key not in stale]
+        for product in latest.values():
+            self._add(product, sort=False)
+        # Lista ya ordenada más un tramo al final: timsort lo resuelve casi en tiempo lineal
+        for keys in self._orders.values():
+            keys.sort()
+
+    def _add(self, product: Product, sort: bool) -> None:
+        self.by_id[product.id] = product
+        self.by_category.setdefault(product.category.lower(), set()).add(product.id)
+        self.by_brand.setdefault(product.brand.lower(), set()).add(product.id)
+        if product.is_promotion:
+            self.promotions.add(product.id)
+        if product.is_new_product:
+            self.new_products.add(product.id)
+        if product.stock <= 0:
+            self.out_of_stock.add(product.id)
+        self.total_units += max(product.stock, 0)
+        for field, key_of in SORT_KEYS.items():
+            if sort:
+                insort(self._orders[field], key_of(product))
+            else:
+                self._orders[field].append(key_of(product))
+
+    def _remove(self, product: Product, orders: bool = True) -> None:
+        del self.by_id[product.id]
+        for index, value in ((self.by_category, product.category.lower()), (self.by_brand, product.brand.lower())):
+            ids = index[value]
+            ids.discard(product.id)
+            if not ids:
+                del index[value]
+        self.promotions.discard(product.id)
+        self.new_products.discard(product.id)
+        self.out_of_stock.discard(product.id)
+        self.total_units -= max(product.stock, 0)
+        if not orders:
+            return
+        for field, key_of in SORT_KEYS.items():
+            keys = self._orders[field]
+            del keys[bisect_left(keys, key_of(product))]
+
+    def query(
+        self,
+        category: Optional[str] = None,
+        brand: Optional[str] = None,
+        is_promotion: Optional[bool] = None,
+        is_new_product: Optional[bool] = None,
+        min_price: Optional[float] = None,
+        max_price: Optional[float] = None,
+        sort: str = "id",
+        cursor: Optional[str] = None,
+        limit: Optional[int] = None,
+    ) -> Tuple[List[Product], Optional[str]]:
+        """
+        Devuelve una página de productos y el cursor de la página siguiente (o None).
+        Lanza InvalidCursorError si el cursor no corresponde a un orden válido.
+        """
+        descending = sort.startswith("-")
+        field = sort.lstrip("-")
+        key_of = SORT_KEYS[field]
+        after = decode_cursor(sort, cursor) if cursor else None
+
+        # Filtros por igualdad: se parte del conjunto más pequeño
+        candidate_sets: List[Set[int]] = []
+        if category is not None:
+            candidate_sets.append(self.by_category.get(category.lower(), set()))
+        if brand is not None:
+            candidate_sets.append(self.by_brand.get(brand.lower(), set()))
+        if is_promotion:
+            candidate_sets.append(self.promotions)
+        if is_new_product:
+            candidate_sets.append(self.new_products)
+
+        def matches(product: Product) -> bool:
+            if min_price is not None and product.price < min_price:
+                return False
+            if max_price is not None and product.price > max_price:
+                return False
+            if is_promotion is False and product.is_promotion:
+                return False
+            if is_new_product is False and product.is_new_product:
+                return False
+            return True
+
+        if candidate_sets:
+            candidate_sets.sort(key=len)
+            smallest, others = candidate_sets[0], candidate_sets[1:]
+            keys = sorted(
+                key_of(self.by_id[pid])
+                for pid in smallest
+                if all(pid in other for other in others) and matches(self.by_id[pid])
+            )
+            ids = _walk(keys, *_bounds(keys, 0, len(keys), descending, after), descending)
+        else:
+            keys = self._orders[field]
+            start, stop = 0, len(keys)
+            if min_price is not None or max_price is not None:
+                # El rango de precios se resuelve con búsqueda binaria sobre el orden por precio
+                prices = self._orders["price"]
+                low = bisect_left(prices, (min_price,)) if min_price is not None else 0
+                high = bisect_right(prices, (max_price, float("inf"))) if max_price is not None else len(prices)
+                if field == "price":
+                    start, stop = low, high
+                elif _sort_range_first(high - low, len(keys), limit):
+                    # Rango angosto con otro orden: se ordena solo el rango
+                    keys = sorted(key_of(self.by_id[pid]) for pid in _walk(prices, low, high, False) if matches(self.by_id[pid]))
+                    start, stop = 0, len(keys)
+                # Si no, se recorre el orden pedido filtrando por precio: es lineal en el
+                # peor caso, pero con un rango amplio la página se llena pronto
+            start, stop = _bounds(keys, start, stop, descending, after)
+            ids = (pid for pid in _walk(keys, start, stop, descending) if matches(self.by_id[pid]))
+
+        page: List[Product] = []
+        for pid in ids:
+            if limit is not None and len(page) == limit:
+                return page, encode_cursor(sort, key_of(page[-1]))
+            page.append(self.by_id[pid])
+        return page, None
+
+def _sort_range_first(in_range: int, total: int, limit: Optional[int]) -> bool:
+    """
+    Con un rango de precios y otro orden, decide si conviene ordenar el rango
+    (~r·log r) en lugar de recorrer el orden completo filtrando: para llenar
+    una página de `limit` se esperan ~limit·total/r pasos (total sin límite).
+    """
+    if in_range == 0:
+        return True
+    walk = total if limit is None else min(total, limit * total / in_range)
+    return in_range * math.log2(in_range + 1) <= walk
+
+def _bounds(keys: List[tuple], start: int, stop: int, descending: bool, after: Optional[tuple]) -> Tuple[int, int]:
+    """
+    Recorta keys[start:stop] a los elementos posteriores al cursor, según el sentido del orden.
+    """
+    if after is None:
+        return start, stop
+    try:
+        if descending:
+            return start, bisect_left(keys, after, start, stop)
+        return bisect_right(keys, after, start, stop), stop
+    except TypeError as e:
+        raise InvalidCursorError("Cursor inválido") from e
+
+def _walk(keys: List[tuple], start: int, stop: int, descending: bool) -> Iterator[int]:
+    positions = range(stop - 1, start - 1, -1) if descending else range(start, stop)
+    for i in positions:
+        yield keys[i][-1]
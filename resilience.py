@@ -0,0 +1,278 @@
+# ferremas_api/resilience.py
+import asyncio
+import logging
+import random
+import re
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional, Set
+
+import httpx
+
+from metrics import UPSTREAM_REQUEST_DURATION
+
+logger = logging.getLogger(__name__)
+
+# Respuestas que vale la pena reintentar en un GET
+RETRYABLE_STATUS = frozenset({429, 500, 502, 503, 504})
+# Muestras de latencia por endpoint para calcular el retardo de las peticiones duplicadas
+LATENCY_WINDOW = 200
+MIN_LATENCY_SAMPLES = 20
+
+_ID_SEGMENT = re.compile(r"/\d+")
+
+def endpoint_label(endpoint: str) -> str:
+    """
+    Agrupa endpoints por forma: "products/15" -> "products/{id}".
+    """
+    return _ID_SEGMENT.sub("/{id}", endpoint.strip("/"))
+
+class CircuitOpenError(httpx.RequestError):
+    """
+    La API de Ferremas está marcada como caída; la petición se rechaza sin enviarla.
+    """
+    def __init__(self, retry_after: float):
+        self.retry_after = retry_after
+        super().__init__(f"Circuito abierto hacia la API de Ferremas (reintento en {retry_after:.1f}s)")
+
+class UpstreamDeadlineError(httpx.TimeoutException):
+    pass
+
+class CircuitBreaker:
+    """
+    Tras `failure_threshold` fallos seguidos se abre y rechaza las peticiones
+    durante `reset_timeout` segundos. Luego deja pasar una sola de prueba
+    (semiabierto): si responde se cierra, si falla se vuelve a abrir.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.opens = 0
+        self.rejected = 0
+        self._probe_in_flight = False
+
+    def before_call(self) -> None:
+        if self.state == self.OPEN:
+            remaining = self.opened_at + self.reset_timeout - time.monotonic()
+            if remaining > 0:
+                self.rejected += 1
+                raise CircuitOpenError(remaining)
+            self.state = self.HALF_OPEN
+            self._probe_in_flight = False
+        if self.state == self.HALF_OPEN:
+            if self._probe_in_flight:
+                self.rejected += 1
+                raise CircuitOpenError(0.0)
+            self._probe_in_flight = True
+
+    def record_success(self) -> None:
+        self.consecutive_failures = 0
+        self._probe_in_flight = False
+        if self.state != self.CLOSED:
+            logger.info("La API de Ferremas volvió a responder; circuito cerrado")
+            self.state = self.CLOSED
+
+    def record_failure(self) -> None:
+        self.consecutive_failures += 1
+        self._probe_in_flight = False
+        if self.state == self.HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                self.opens += 1
+                logger.warning(
+                    f"Circuito abierto hacia la API de Ferremas tras {self.consecutive_failures} fallos; "
+                    f"se reintentará en {self.reset_timeout}s"
+                )
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+
+    def record_cancelled(self) -> None:
+        # Una prueba cancelada no dice nada sobre la salud de la API
+        self._probe_in_flight = False
+
+class UpstreamGuard:
+    """
+    Capa de resiliencia para las peticiones a la API de Ferremas:
+
+    - plazo total por petición (incluye reintentos y duplicados),
+    - reintentos de GET con backoff exponencial y jitter,
+    - circuit breaker compartido para fallar rápido cuando la API está caída,
+    - peticiones duplicadas (hedging): si un GET tarda más que el p95 reciente
+      de su endpoint se envía otro igual y se usa el primero que responda.
+    """
+
+    def __init__(
+        self,
+        get_client: Callable[[], httpx.AsyncClient],
+        deadline: float,
+        retry_attempts: int,
+        retry_base_delay: float,
+        retry_max_delay: float,
+        breaker: CircuitBreaker,
+        hedge_enabled: bool,
+        hedge_min_delay: float,
+        hedge_max_ratio: float,
+    ):
+        self._get_client = get_client
+        self.deadline = deadline
+        self.retry_attempts = max(retry_attempts, 1)
+        self.retry_base_delay = retry_base_delay
+        self.retry_max_delay = retry_max_delay
+        self.breaker = breaker
+        self.hedge_enabled = hedge_enabled
+        self.hedge_min_delay = hedge_min_delay
+        self.hedge_max_ratio = hedge_max_ratio
+        self._latencies: Dict[str, Deque[float]] = {}
+        self._latency_counts: Dict[str, int] = {}
+        self._hedge_delays: Dict[str, float] = {}
+        self.stats_counters = {
+            "requests": 0,
+            "retries": 0,
+            "hedges": 0,
+            "hedge_wins": 0,
+            "deadline_exceeded": 0,
+        }
+
+    async def get(self, endpoint: str) -> httpx.Response:
+        """
+        GET con plazo, reintentos, circuit breaker y hedging. Devuelve la
+        respuesta (también 4xx, o el último 5xx si se agotaron los reintentos);
+        lanza httpx.RequestError si no se obtuvo ninguna.
+        """
+        self.stats_counters["requests"] += 1
+        try:
+            async with asyncio.timeout(self.deadline):
+                return await self._get_with_retries(endpoint)
+        except TimeoutError:
+            self.stats_counters["deadline_exceeded"] += 1
+            raise UpstreamDeadlineError(f"Se superó el plazo de {self.deadline}s para {endpoint}")
+
+    async def send(self, endpoint: str, request: Callable[[], Awaitable[httpx.Response]]) -> httpx.Response:
+        """
+        Escrituras: plazo y circuit breaker, sin reintentos ni duplicados.
+        """
+        self.stats_counters["requests"] += 1
+        try:
+            async with asyncio.timeout(self.deadline):
+                return await self._guarded(request, endpoint_label(endpoint), 0)
+        except TimeoutError:
+            self.stats_counters["deadline_exceeded"] += 1
+            raise UpstreamDeadlineError(f"Se superó el plazo de {self.deadline}s para {endpoint}")
+
+    async def _get_with_retries(self, endpoint: str) -> httpx.Response:
+        last_error: Optional[httpx.RequestError] = None
+        for attempt in range(self.retry_attempts):
+            if attempt:
+                self.stats_counters["retries"] += 1
+                await asyncio.sleep(self._backoff(attempt))
+            try:
+                response = await self._guarded(lambda: self._hedged_get(endpoint), endpoint_label(endpoint), attempt)
+            except CircuitOpenError:
+                raise
+            except httpx.RequestError as e:
+                last_error = e
+                continue
+            if response.status_code in RETRYABLE_STATUS and attempt + 1 < self.retry_attempts:
+                continue
+            return response
+        raise last_error
+
+    def _backoff(self, attempt: int) -> float:
+        # Full jitter: evita que todos los reintentos lleguen a la vez
+        return random.uniform(0, min(self.retry_max_delay, self.retry_base_delay * 2 ** (attempt - 1)))
+
+    async def _guarded(self, request: Callable[[], Awaitable[httpx.Response]], label: str, attempt: int) -> httpx.Response:
+        self.breaker.before_call()
+        started = time.perf_counter()
+        try:
+            response = await request()
+        except httpx.RequestError:
+            UPSTREAM_REQUEST_DURATION.observe(time.perf_counter() - started, label, "error", str(attempt))
+            self.breaker.record_failure()
+            raise
+        except BaseException:
+            self.breaker.record_cancelled()
+            raise
+        UPSTREAM_REQUEST_DURATION.observe(time.perf_counter() - started, label, str(response.status_code), str(attempt))
+        if response.status_code >= 500:
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+        return response
+
+    async def _hedged_get(self, endpoint: str) -> httpx.Response:
+        client = self._get_client()
+        label = endpoint_label(endpoint)
+        started = time.perf_counter()
+        delay = self._hedge_delays.get(label) if self.hedge_enabled else None
+        if delay is None:
+            response = await client.get(endpoint)
+            self._record_latency(label, time.perf_counter() - started)
+            return response
+
+        primary = asyncio.create_task(client.get(endpoint))
+        tasks: Set[asyncio.Task] = {primary}
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if not done and self._hedge_allowed():
+                self.stats_counters["hedges"] += 1
+                tasks.add(asyncio.create_task(client.get(endpoint)))
+            winner, response = await _first_success(tasks)
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+        if winner is not primary:
+            self.stats_counters["hedge_wins"] += 1
+        self._record_latency(label, time.perf_counter() - started)
+        return response
+
+    def _hedge_allowed(self) -> bool:
+        # Presupuesto: a lo sumo una fracción de las peticiones se duplica
+        return self.stats_counters["hedges"] < self.hedge_max_ratio * self.stats_counters["requests"]
+
+    def _record_latency(self, label: str, seconds: float) -> None:
+        samples = self._latencies.get(label)
+        if samples is None:
+            samples = self._latencies[label] = deque(maxlen=LATENCY_WINDOW)
+        samples.append(seconds)
+        count = self._latency_counts.get(label, 0) + 1
+        self._latency_counts[label] = count
+        # El p95 se recalcula cada 16 muestras, no en cada petición
+        if count == MIN_LATENCY_SAMPLES or (count > MIN_LATENCY_SAMPLES and count % 16 == 0):
+            ordered = sorted(samples)
+            self._hedge_delays[label] = max(self.hedge_min_delay, ordered[int(len(ordered) * 0.95)])
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self.stats_counters,
+            "circuit_state": self.breaker.state,
+            # 0 cerrado, 1 semiabierto, 2 abierto (para graficar en /metrics)
+            "circuit_state_code": (CircuitBreaker.CLOSED, CircuitBreaker.HALF_OPEN, CircuitBreaker.OPEN).index(self.breaker.state),
+            "circuit_consecutive_failures": self.breaker.consecutive_failures,
+            "circuit_opens": self.breaker.opens,
+            "circuit_rejected": self.breaker.rejected,
+            "hedge_delay_ms": {label: round(delay * 1000, 2) for label, delay in self._hedge_delays.items()},
+        }
+
+async def _first_success(tasks: Set[asyncio.Task]):
+    """
+    Espera la primera respuesta sin error ni 5xx. Si todas fallan, devuelve la
+    última respuesta o relanza el último error.
+    """
+    pending = set(tasks)
+    last_task = None
+    while pending:
+        done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            last_task = task
+            if task.exception() is None and task.result().status_code < 500:
+                return task, task.result()
+    return last_task, last_task.result()
@@ -1,32 +1,135 @@
 # ferremas_api/routes/branches.py
-from fastapi import APIRouter, Depends, HTTPException, status
+import asyncio
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Request, Response
+from pydantic import TypeAdapter
 from typing import List, Optional
-from models import Branch, Seller, UserInDB
-from database import fetch_branch_data, fetch_seller_data
+from models import Branch, BranchDistance, BranchOverview, BranchStockSummary, Seller, UserInDB
+from database import fetch_branch_data, fetch_product_data, fetch_seller_data
+from catalog import catalog_cache
+from orders import order_engine
+from http_cache import make_etag, check_not_modified, raw_json_response, snapshot_response
 from auth import has_roles
 
 router = APIRouter()
 
+BRANCH_DISTANCE_LIST_ADAPTER = TypeAdapter(List[BranchDistance])
+
 @router.get("/branches", response_model=List[Branch], summary="Obtener listado de sucursales")
-async def get_branches():
+async def get_branches(request: Request, response: Response):
     """
     Recupera el listado completo de sucursales de FERREMAS.
     """
-    branches = await fetch_branch_data()
+    branches = await catalog_cache.branches.get()
     if branches is None:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="No se pudo obtener el listado de sucursales")
-    return branches
+    not_modified = check_not_modified(request, response, catalog_cache.branches.etag())
+    if not_modified:
+        return not_modified
+    return await snapshot_response(request, response, catalog_cache.branches)
+
+@router.get("/branches/nearest", response_model=List[BranchDistance], summary="Sucursales más cercanas a una ubicación")
+async def get_nearest_branches(
+    request: Request,
+    response: Response,
+    lat: float = Query(..., ge=-90, le=90, description="Latitud"),
+    lon: float = Query(..., ge=-180, le=180, description="Longitud"),
+    limit: int = Query(5, ge=1, le=100, description="Cantidad máxima de sucursales"),
+    radius_km: Optional[float] = Query(None, gt=0, description="Radio máximo de búsqueda (km)"),
+    product_id: Optional[int] = Query(None, description="Solo si el producto tiene stock (total, no por sucursal)"),
+):
+    """
+    Recupera las sucursales más cercanas a una ubicación, ordenadas por distancia.
+
+    product_id no filtra por sucursal: la API de Ferremas solo informa el stock
+    total de cada producto. Si el producto tiene stock disponible se devuelven
+    las sucursales más cercanas; si no, una lista vacía.
+    """
+    locator = await catalog_cache.branch_locator()
+    if locator is None:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="No se pudo obtener el listado de sucursales")
+    etag_parts = [catalog_cache.branches_etag("branches")]
+    if product_id is not None:
+        index = await catalog_cache.product_index()
+        product = index.get(product_id) if index is not None else None
+        if product is None:
+            fetched = await fetch_product_data(product_id=product_id)
+            if not fetched:
+                raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Producto no encontrado")
+            product = fetched[0]
+        # La API de Ferremas solo informa el stock total del producto, no por sucursal;
+        # si el producto ya tiene reservas se usa lo disponible según el libro de pedidos
+        available = order_engine.available(product_id)
+        in_stock = (available if available is not None else product.stock) > 0
+        etag_parts += [catalog_cache.products_etag("products"), str(in_stock)]
+    if None not in etag_parts:
+        query = "&".join(f"{key}={value}" for key, value in sorted(request.query_params.multi_items()))
+        not_modified = check_not_modified(request, response, make_etag(*etag_parts, request.url.path, query))
+        if not_modified:
+            return not_modified
+    if product_id is not None and not in_stock:
+        nearest = []
+    else:
+        nearest = locator.nearest(lat, lon, limit=limit, radius_km=radius_km)
+    results = [BranchDistance(**branch.model_dump(), distance_km=round(distance, 3)) for branch, distance in nearest]
+    return raw_json_response(BRANCH_DISTANCE_LIST_ADAPTER.dump_json(results), response)
+
+async def _find_branch(branch_id: int) -> Branch:
+    # get() carga o refresca la copia; find() busca por id sin recorrerla
+    await catalog_cache.branches.get()
+    branch = catalog_cache.branches.find(branch_id)
+    if branch is None:
+        fetched = await fetch_branch_data(branch_id=branch_id)
+        if not fetched:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Sucursal no encontrada")
+        branch = fetched[0] # fetch_branch_data devuelve una lista
+    return branch
+
+async def _branch_sellers(branch_id: int) -> List[Seller]:
+    directory = await catalog_cache.seller_directory()
+    if directory is not None:
+        return directory.for_branch(branch_id)
+    # Sin copia de vendedores (API caída al arrancar): se consulta la sucursal directamente
+    sellers = await fetch_seller_data(branch_id=branch_id)
+    if sellers is None:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="No se pudo obtener el listado de vendedores para la sucursal")
+    return sellers
+
+@router.get("/branches/{branch_id}/overview", response_model=BranchOverview, summary="Resumen de una sucursal")
+async def get_branch_overview(branch_id: int, current_user: UserInDB = Depends(has_roles(["admin", "jefe_tienda"]))):
+    """
+    La sucursal, sus vendedores y un resumen de stock en una sola respuesta,
+    armada desde memoria. Requiere rol de 'admin' o 'jefe_tienda'.
+    """
+    branch, sellers, index = await asyncio.gather(
+        _find_branch(branch_id),
+        _branch_sellers(branch_id),
+        catalog_cache.product_index(),
+    )
+    if index is None:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="No se pudo obtener el catálogo de productos")
+    pending_orders, reserved_units = order_engine.branch_reservations(branch_id)
+    stock = BranchStockSummary(
+        products=len(index),
+        in_stock=len(index) - len(index.out_of_stock),
+        out_of_stock=len(index.out_of_stock),
+        total_units=index.total_units,
+        pending_orders=pending_orders,
+        reserved_units=reserved_units,
+    )
+    return BranchOverview(branch=branch, sellers=sellers, stock=stock)
 
 @router.get("/branches/{branch_id}", response_model=Branch, summary="Obtener detalles de una sucursal")
-async def get_branch_by_id(branch_id: int):
+async def get_branch_by_id(branch_id: int, request: Request, response: Response):
     """
     Recupera los detalles de una sucursal específica por su ID.
     (Caso de uso: Como cliente, quiero poder mirar los detalles de una sucursal) [cite: 65]
     """
-    branch = await fetch_branch_data(branch_id=branch_id)
-    if not branch:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Sucursal no encontrada")
-    return branch[0] # fetch_branch_data devuelve una lista
+    branch = await _find_branch(branch_id)
+    body = branch.model_dump_json()
+    not_modified = check_not_modified(request, response, make_etag(body))
+    if not_modified:
+        return not_modified
+    return raw_json_response(body.encode(), response)
 
 @router.get("/branches/{branch_id}/sellers", response_model=List[Seller], summary="Obtener listado de vendedores por sucursal")
 async def get_sellers_by_branch(branch_id: int, current_user: UserInDB = Depends(has_roles(["admin", "jefe_tienda"]))):
@@ -35,10 +138,7 @@ async def get_sellers_by_branch(branch_id: int, current_user: UserInDB = Depends
     Requiere rol de 'admin' o 'jefe_tienda'.
     (Caso de uso: Como administrador de tienda, quiero poder ver mis vendedores) [cite: 65]
     """
-    sellers = await fetch_seller_data(branch_id=branch_id)
-    if sellers is None:
-        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="No se pudo obtener el listado de vendedores para la sucursal")
-    return sellers
+    return await _branch_sellers(branch_id)
 
 @router.get("/sellers/{seller_id}", response_model=Seller, summary="Obtener un vendedor identificable")
 async def get_seller_by_id(seller_id: int, current_user: UserInDB = Depends(has_roles(["admin", "jefe_tienda", "bodega", "client"]))):
@@ -46,7 +146,13 @@ async def get_seller_by_id(seller_id: int, current_user: UserInDB = Depends(has_
     Recupera los detalles de un vendedor específico por su ID.
     Accesible por admin, jefe_tienda, bodega y clientes.
     """
-    seller = await fetch_seller_data(seller_id=seller_id)
-    if not seller:
+    directory = await catalog_cache.seller_directory()
+    seller = directory.get(seller_id) if directory is not None else None
+    if seller is not None:
+        return seller
+    # Puede ser un vendedor creado después del último refresco: se pide y se agrega a la copia
+    fetched = await fetch_seller_data(seller_id=seller_id)
+    if not fetched:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Vendedor no encontrado")
-    return seller[0]
\ No newline at end of file
+    catalog_cache.upsert_seller(fetched[0])
+    return fetched[0]
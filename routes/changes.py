@@ -0,0 +1,165 @@
+# ferremas_api/routes/changes.py
+import asyncio
+from typing import List, Optional
+
+from fastapi import APIRouter, Header, HTTPException, Query, WebSocket, WebSocketDisconnect, status
+from fastapi.responses import StreamingResponse
+
+from change_feed import change_feed, FeedFullError, Subscription, SubscriptionClosed
+from config import settings
+from http_cache import dumps_json
+
+router = APIRouter()
+
+# Se envía al cerrar una suscripción atrasada o al no poder reanudarla:
+# el cliente debe volver a pedir el catálogo (o el producto) y reconectarse
+_RESYNC = {"type": "resync"}
+
+def _filters(product_id: List[int], category: List[str], branch_id: List[int]) -> dict:
+    return {"product_ids": product_id, "categories": category, "branch_ids": branch_id}
+
+def _replay_events(subscription: Subscription, last_seq: Optional[int]):
+    if last_seq is None:
+        return [], True
+    return change_feed.replay(subscription, last_seq)
+
+@router.get("/products/changes", summary="Cambios del catálogo en tiempo real (Server-Sent Events)")
+async def product_changes_stream(
+    product_id: List[int] = Query([], description="Productos a seguir"),
+    category: List[str] = Query([], description="Categorías a seguir"),
+    branch_id: List[int] = Query([], description="Sucursales a seguir (datos y stock de sus pedidos)"),
+    last_event_id: Optional[int] = Header(None, description="Último evento recibido, para reanudar"),
+):
+    """
+    Emite un evento por cada cambio: `product.created`, `product.updated` (solo
+    los campos modificados), `product.removed`, `product.stock` y `branch.*`.
+    Sin filtros se reciben todos. Un evento `resync` indica que se perdieron
+    cambios y hay que volver a pedir los datos.
+    """
+    try:
+        subscription = change_feed.subscribe(product_id, category, branch_id)
+    except FeedFullError as e:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e))
+    replay, complete = _replay_events(subscription, last_event_id)
+
+    async def events():
+        try:
+            yield b"retry: 3000\n\n"
+            if not complete:
+                yield b"event: resync\ndata: " + dumps_json(_RESYNC) + b"\n\n"
+            for event in replay:
+                yield event.sse
+            while True:
+                try:
+                    event = await subscription.next(settings.CHANGE_FEED_HEARTBEAT_SECONDS)
+                except SubscriptionClosed:
+                    yield b"event: resync\ndata: " + dumps_json(_RESYNC) + b"\n\n"
+                    return
+                # Comentario SSE: mantiene viva la conexión a través de proxies
+                yield event.sse if event is not None else b": ping\n\n"
+        finally:
+            change_feed.unsubscribe(subscription)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@router.websocket("/ws/products")
+async def product_changes_websocket(
+    websocket: WebSocket,
+    product_id: List[int] = Query([]),
+    category: List[str] = Query([]),
+    branch_id: List[int] = Query([]),
+    since: Optional[int] = Query(None, description="Último evento recibido, para reanudar"),
+):
+    """
+    Mismos eventos que /products/changes. El cliente puede cambiar los filtros
+    enviando {"action": "subscribe" | "unsubscribe", "product_ids": [...],
+    "categories": [...], "branch_ids": [...]}. "subscribe" sin filtros pide
+    todos los cambios y "unsubscribe" sin filtros deja de recibirlos todos.
+    """
+    try:
+        subscription = change_feed.subscribe(product_id, category, branch_id)
+    except FeedFullError:
+        await websocket.close(code=status.WS_1013_TRY_AGAIN_LATER)
+        return
+    try:
+        await websocket.accept()
+        replay, complete = _replay_events(subscription, since)
+        await websocket.send_text(dumps_json({
+            "type": "subscribed",
+            "seq": change_feed.last_seq,
+            **_filters(product_id, category, branch_id),
+        }).decode())
+        if not complete:
+            await websocket.send_text(dumps_json(_RESYNC).decode())
+        for event in replay:
+            await websocket.send_text(event.data)
+        # Lo que termine primero (desconexión del cliente o cierre de la suscripción) cierra ambos
+        tasks = {
+            asyncio.create_task(_send_events(websocket, subscription)),
+            asyncio.create_task(_receive_commands(websocket, subscription)),
+        }
+        done, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        for task in pending:
+            task.cancel()
+        for task in done:
+            error = task.exception()
+            if error is not None and not isinstance(error, WebSocketDisconnect):
+                raise error
+    except WebSocketDisconnect:
+        pass
+    finally:
+        change_feed.unsubscribe(subscription)
+
+async def _send_events(websocket: WebSocket, subscription: Subscription) -> None:
+    try:
+        while True:
+            event = await subscription.next()
+            await websocket.send_text(event.data)
+    except SubscriptionClosed:
+        await websocket.send_text(dumps_json(_RESYNC).decode())
+        await websocket.close(code=status.WS_1013_TRY_AGAIN_LATER)
+
+async def _receive_commands(websocket: WebSocket, subscription: Subscription) -> None:
+    while True:
+        try:
+            message = await websocket.receive_json()
+        except ValueError:
+            await websocket.send_text(dumps_json({"type": "error", "detail": "Se esperaba JSON"}).decode())
+            continue
+        action = message.get("action") if isinstance(message, dict) else None
+        if action not in ("subscribe", "unsubscribe"):
+            await websocket.send_text(dumps_json({"type": "error", "detail": "action debe ser subscribe o unsubscribe"}).decode())
+            continue
+        filters = _command_filters(message)
+        if filters is None:
+            await websocket.send_text(dumps_json({
+                "type": "error",
+                "detail": "product_ids y branch_ids deben ser listas de enteros y categories una lista de textos",
+            }).decode())
+            continue
+        change_feed.update(subscription, action == "subscribe", **filters)
+        await websocket.send_text(dumps_json({
+            "type": action + "d",
+            "everything": subscription.everything,
+            "filters": sorted(map(list, subscription.topics)),
+        }).decode())
+
+def _command_filters(message: dict) -> Optional[dict]:
+    """
+    Filtros de un comando del WebSocket; None si alguno no es una lista del
+    tipo esperado (un texto en product_ids no debe tomarse carácter por carácter).
+    """
+    filters = {}
+    for key, kind in (("product_ids", int), ("categories", str), ("branch_ids", int)):
+        values = message.get(key, [])
+        if not isinstance(values, list):
+            return None
+        # bool es subclase de int, pero true no es un id
+        if any(not isinstance(value, kind) or isinstance(value, bool) for value in values):
+            return None
+        filters[key] = values
+    return filters
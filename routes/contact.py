@@ -0,0 +1,28 @@
+# ferremas_api/routes/contact.py
+from fastapi import APIRouter, HTTPException, Response, status
+
+from config import settings
+from ingestion import contact_queue, IngestionError, QueueFullError
+from models import ContactMessage, ContactReceipt
+
+router = APIRouter()
+
+@router.post("/api/v1/contact", response_model=ContactReceipt, status_code=202, summary="Enviar un mensaje de contacto")
+async def send_contact_message(message: ContactMessage, response: Response):
+    """
+    Encola el mensaje y responde de inmediato; se guarda en segundo plano junto
+    con otros mensajes. Con la cola llena responde 503 y el cliente debe reintentar.
+    """
+    try:
+        message_id = await contact_queue.submit("contact", message.model_dump(mode="json"))
+    except QueueFullError:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Demasiados mensajes en espera, intente nuevamente",
+            headers={"Retry-After": str(max(1, round(settings.INGEST_FLUSH_INTERVAL_SECONDS)))},
+        )
+    except IngestionError:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="No se pudo guardar el mensaje")
+    if settings.INGEST_DURABILITY == "sync":
+        response.status_code = status.HTTP_201_CREATED
+    return ContactReceipt(id=message_id, status="stored" if response.status_code == 201 else "accepted")
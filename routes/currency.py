@@ -0,0 +1,27 @@
+# ferremas_api/routes/currency.py
+from fastapi import APIRouter, HTTPException, status
+from models import CurrencyConversion, CurrencyConversionRequest
+from currency import currency_service, UnsupportedCurrencyError
+
+router = APIRouter()
+
+@router.post("/api/v1/currencyConversion", response_model=CurrencyConversion, summary="Convertir un monto entre divisas")
+async def convert_currency(request: CurrencyConversionRequest):
+    """
+    Convierte un monto con las tasas del Banco Central Europeo cargadas en memoria.
+    Las monedas que el BCE no publica (p. ej. CLP) usan las de
+    CURRENCY_EXTRA_RATES_FILE; si no está configurado no se pueden convertir.
+    """
+    try:
+        rates = currency_service.table
+        converted = request.amount * rates.factor(request.from_currency, request.to_currency)
+        rate_date = rates.rate_date(request.from_currency, request.to_currency)
+    except UnsupportedCurrencyError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    return CurrencyConversion(
+        amount=request.amount,
+        from_currency=request.from_currency.upper(),
+        to_currency=request.to_currency.upper(),
+        converted_amount=round(converted, 2),
+        rate_date=rate_date,
+    )
@@ -0,0 +1,97 @@
+# ferremas_api/routes/orders.py
+from fastapi import APIRouter, Depends, HTTPException, status, Path
+from models import OrderReservation, SingleOrder, UserInDB
+from catalog import catalog_cache
+from orders import (
+    order_engine,
+    InsufficientStockError,
+    OrderNotFoundError,
+    OrderStateError,
+    UnknownProductError,
+)
+from auth import has_roles
+
+router = APIRouter()
+
+def _check_owner(username: str, current_user: UserInDB) -> None:
+    """
+    Los clientes solo pueden operar sus propios pedidos; admin puede operar cualquiera.
+    """
+    if "admin" not in current_user.roles and username != current_user.username:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="No puede operar pedidos de otro cliente")
+
+def _get_order(order_id: str) -> OrderReservation:
+    try:
+        return order_engine.get(order_id)
+    except OrderNotFoundError:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Pedido no encontrado")
+
+def _state_error(e: OrderStateError) -> HTTPException:
+    return HTTPException(status_code=status.HTTP_409_CONFLICT, detail=f"El pedido ya no está pendiente (estado: {e.status})")
+
+@router.post("/api/v1/orders", response_model=OrderReservation, status_code=201, summary="Colocar un pedido")
+async def place_order(
+    order: SingleOrder,
+    current_user: UserInDB = Depends(has_roles(["admin", "client"]))
+):
+    """
+    Reserva el stock de todos los productos del pedido (todo o nada). La reserva
+    vence si no se confirma a tiempo y el stock vuelve a quedar disponible.
+    """
+    _check_owner(order.client_username, current_user)
+    branches = await catalog_cache.branches.get()
+    if branches is None:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="No se pudo obtener el listado de sucursales")
+    if not any(branch.id == order.branch_id for branch in branches):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Sucursal no encontrada")
+    try:
+        return await order_engine.place(order)
+    except UnknownProductError as e:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Productos no encontrados: {e.product_ids}")
+    except InsufficientStockError as e:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail={"message": "Stock insuficiente", "available": e.shortages},
+        )
+
+@router.get("/api/v1/orders/{order_id}", response_model=OrderReservation, summary="Consultar un pedido")
+async def get_order(
+    order_id: str = Path(..., description="ID del pedido"),
+    current_user: UserInDB = Depends(has_roles(["admin", "client", "service_account"]))
+):
+    order = _get_order(order_id)
+    if "service_account" not in current_user.roles:
+        _check_owner(order.client_username, current_user)
+    return order
+
+@router.post("/api/v1/orders/{order_id}/confirm", response_model=OrderReservation, summary="Confirmar un pedido")
+async def confirm_order(
+    order_id: str = Path(..., description="ID del pedido"),
+    current_user: UserInDB = Depends(has_roles(["admin", "client", "service_account"]))
+):
+    """
+    Descuenta definitivamente el stock reservado (p. ej. tras el pago).
+    La actualización de stock en la API de Ferremas se hace en segundo plano.
+    """
+    order = _get_order(order_id)
+    if "service_account" not in current_user.roles:
+        _check_owner(order.client_username, current_user)
+    try:
+        return order_engine.confirm(order_id)
+    except OrderStateError as e:
+        raise _state_error(e)
+
+@router.post("/api/v1/orders/{order_id}/cancel", response_model=OrderReservation, summary="Cancelar un pedido")
+async def cancel_order(
+    order_id: str = Path(..., description="ID del pedido"),
+    current_user: UserInDB = Depends(has_roles(["admin", "client"]))
+):
+    """
+    Cancela un pedido pendiente y libera el stock reservado.
+    """
+    order = _get_order(order_id)
+    _check_owner(order.client_username, current_user)
+    try:
+        return order_engine.cancel(order_id)
+    except OrderStateError as e:
+        raise _state_error(e)
@@ -1,57 +1,271 @@
 # ferremas_api/routes/products.py
-from fastapi import APIRouter, Depends, HTTPException, status, Path, Query
-from typing import List
-from models import Product, UserInDB
+import logging
+
+import httpx
+from fastapi import APIRouter, Depends, HTTPException, status, Path, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from typing import AsyncIterator, List, Optional
+from models import (
+    Product,
+    UserInDB,
+    ProductBatchRequest,
+    ProductBatchUpdateRequest,
+    BatchItemResult,
+    ProductBatchResult,
+    ProductPrices,
+)
+from config import settings
 from database import (
     fetch_product_data,
+    fetch_products_by_id,
+    stream_product_data,
+    PRODUCT_LIST_ADAPTER,
     add_product_to_ferremas_api,
     update_product_in_ferremas_api,
+    update_products_in_ferremas_api,
 )
+from catalog import catalog_cache
+from orders import order_engine
+from currency import currency_service, UnsupportedCurrencyError
+from product_index import SORT_OPTIONS, InvalidCursorError
+from http_cache import make_etag, check_not_modified, dumps_json, raw_json_response, snapshot_response
 from auth import has_roles
 
+logger = logging.getLogger(__name__)
+
 router = APIRouter()
 
-@router.get("/products", response_model=List[Product], summary="Obtener catálogo de productos")
-async def get_products():
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+# Tamaño aproximado de cada bloque enviado al exportar
+EXPORT_CHUNK_BYTES = 64 * 1024
+
+def _check_catalog_etag(request: Request, response: Response, *index_names: str) -> Optional[Response]:
     """
-    Recupera el catálogo completo de productos disponibles en FERREMAS.
+    El ETag de un listado combina el hash del catálogo (uno por versión) con los
+    parámetros de la consulta, así no hay que serializar la respuesta para calcularlo.
     """
-    products = await fetch_product_data()
-    if products is None:
-        raise HTTPException(status_code=500, detail="No se pudo obtener el catálogo de productos")
-    return products
+    catalog_etag = catalog_cache.products_etag(*index_names)
+    if catalog_etag is None:
+        return None
+    query = "&".join(f"{key}={value}" for key, value in sorted(request.query_params.multi_items()))
+    return check_not_modified(request, response, make_etag(catalog_etag, request.url.path, query))
 
-@router.get("/products/{product_id}", response_model=Product, summary="Obtener un producto específico")
-async def get_product_by_id(product_id: int = Path(..., description="ID del producto")):
+@router.get("/products", response_model=List[Product], summary="Obtener catálogo de productos")
+async def get_products(
+    request: Request,
+    response: Response,
+    category: Optional[str] = Query(None, description="Filtrar por categoría"),
+    brand: Optional[str] = Query(None, description="Filtrar por marca"),
+    min_price: Optional[float] = Query(None, ge=0, description="Precio mínimo"),
+    max_price: Optional[float] = Query(None, ge=0, description="Precio máximo"),
+    sort: str = Query("id", enum=SORT_OPTIONS, description="Orden (prefijo '-' para descendente)"),
+    cursor: Optional[str] = Query(None, description="Cursor devuelto en X-Next-Cursor"),
+    limit: Optional[int] = Query(None, ge=1, le=1000, description="Tamaño de página"),
+):
     """
-    Recupera los detalles de un producto específico por su ID.
+    Recupera el catálogo de productos disponibles en FERREMAS.
+    Admite filtros, orden y paginación por cursor; sin parámetros devuelve el catálogo completo.
+    Si quedan más resultados, el cursor de la página siguiente se envía en el encabezado X-Next-Cursor.
+    Con `Accept: application/x-ndjson` se exporta el catálogo completo en streaming (ver /products/export).
     """
-    product = await fetch_product_data(product_id=product_id)
-    if not product:
-        raise HTTPException(status_code=404, detail="Producto no encontrado")
-    return product[0]
+    if NDJSON_MEDIA_TYPE in request.headers.get("accept", ""):
+        return await _export_ndjson()
+    if not request.query_params:
+        # Catálogo completo: se responde con la copia ya serializada, sin consultar el índice
+        products = await catalog_cache.products.get()
+        if products is None:
+            raise HTTPException(status_code=500, detail="No se pudo obtener el catálogo de productos")
+        not_modified = check_not_modified(request, response, make_etag(catalog_cache.products.etag(), request.url.path, ""))
+        if not_modified:
+            return not_modified
+        return await snapshot_response(request, response, catalog_cache.products)
+    index = await catalog_cache.product_index()
+    if index is None:
+        raise HTTPException(status_code=500, detail="No se pudo obtener el catálogo de productos")
+    not_modified = _check_catalog_etag(request, response, "products")
+    if not_modified:
+        return not_modified
+    try:
+        products, next_cursor = index.query(
+            category=category,
+            brand=brand,
+            min_price=min_price,
+            max_price=max_price,
+            sort=sort,
+            cursor=cursor,
+            limit=limit,
+        )
+    except InvalidCursorError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return raw_json_response(PRODUCT_LIST_ADAPTER.dump_json(products), response)
 
 @router.get("/products/promotions", response_model=List[Product], summary="Obtener productos en promoción")
-async def get_promotion_products():
+async def get_promotion_products(request: Request, response: Response):
     """
     Recupera una lista de productos que actualmente están en promoción.
     """
-    all_products = await fetch_product_data()
-    if all_products is None:
+    index = await catalog_cache.product_index()
+    if index is None:
         raise HTTPException(status_code=500, detail="No se pudo obtener el catálogo para promociones")
+    not_modified = _check_catalog_etag(request, response, "products")
+    if not_modified:
+        return not_modified
 
-    return [p for p in all_products if p.is_promotion]
+    return raw_json_response(PRODUCT_LIST_ADAPTER.dump_json(index.query(is_promotion=True)[0]), response)
 
 @router.get("/products/newArrivals", response_model=List[Product], summary="Obtener productos como novedades")
-async def get_new_arrival_products():
+async def get_new_arrival_products(request: Request, response: Response):
     """
     Recupera una lista de productos marcados como novedades.
     """
-    all_products = await fetch_product_data()
-    if all_products is None:
+    index = await catalog_cache.product_index()
+    if index is None:
         raise HTTPException(status_code=500, detail="No se pudo obtener el catálogo para novedades")
+    not_modified = _check_catalog_etag(request, response, "products")
+    if not_modified:
+        return not_modified
+
+    return raw_json_response(PRODUCT_LIST_ADAPTER.dump_json(index.query(is_new_product=True)[0]), response)
+
+@router.get("/products/prices", response_model=List[ProductPrices], summary="Precios del catálogo en otras monedas")
+async def get_product_prices(
+    request: Request,
+    response: Response,
+    currency: List[str] = Query(["USD", "EUR"], description="Monedas de destino"),
+    category: Optional[str] = Query(None, description="Filtrar por categoría"),
+    brand: Optional[str] = Query(None, description="Filtrar por marca"),
+    sort: str = Query("id", enum=SORT_OPTIONS, description="Orden (prefijo '-' para descendente)"),
+    cursor: Optional[str] = Query(None, description="Cursor devuelto en X-Next-Cursor"),
+    limit: Optional[int] = Query(None, ge=1, le=1000, description="Tamaño de página"),
+):
+    """
+    Lista de precios del catálogo convertida a las monedas indicadas. Cada tasa se
+    calcula una vez para toda la lista, no por producto. La fecha de la tasa más
+    antigua usada se informa en el encabezado X-Rates-Date.
+    """
+    index = await catalog_cache.product_index()
+    if index is None:
+        raise HTTPException(status_code=500, detail="No se pudo obtener el catálogo de productos")
+    rates = currency_service.table
+    source = settings.CATALOG_CURRENCY
+    if source.upper() not in rates.rates:
+        # Sin tasa configurada no se inventa una: la conversión queda deshabilitada
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=f"No hay tasa de cambio configurada para {source}, la moneda del catálogo",
+        )
+    catalog_etag = catalog_cache.products_etag("products")
+    if catalog_etag is not None:
+        # Las tasas también cambian la respuesta: su versión forma parte del ETag
+        query = "&".join(f"{key}={value}" for key, value in sorted(request.query_params.multi_items()))
+        not_modified = check_not_modified(request, response, make_etag(catalog_etag, str(rates.version), request.url.path, query))
+        if not_modified:
+            return not_modified
+    try:
+        products, next_cursor = index.query(category=category, brand=brand, sort=sort, cursor=cursor, limit=limit)
+        converted = currency_service.convert_many((p.price for p in products), source, currency)
+        rate_date = rates.rate_date(source, *currency)
+    except InvalidCursorError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except UnsupportedCurrencyError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    codes = list(converted)
+    columns = [converted[code] for code in codes]
+    body = [
+        {"id": p.id, "price": p.price, "currency": source, "converted": dict(zip(codes, values))}
+        for p, *values in zip(products, *columns)
+    ]
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    response.headers["X-Rates-Date"] = rate_date.isoformat()
+    return raw_json_response(dumps_json(body), response)
+
+@router.get("/products/search", response_model=List[Product], summary="Buscar productos")
+async def search_products(
+    request: Request,
+    response: Response,
+    q: str = Query(..., min_length=1, max_length=200, description="Texto a buscar en nombre, descripción, marca y categoría"),
+    limit: int = Query(20, ge=1, le=100, description="Cantidad máxima de resultados"),
+    prefix: bool = Query(True, description="Tratar la última palabra como prefijo (autocompletado)"),
+):
+    """
+    Búsqueda de texto sobre el catálogo, sin distinguir mayúsculas ni tildes.
+    Los resultados se devuelven ordenados por relevancia.
+    """
+    index = await catalog_cache.search_index()
+    products = await catalog_cache.product_index()
+    if index is None or products is None:
+        raise HTTPException(status_code=500, detail="No se pudo obtener el catálogo para la búsqueda")
+    not_modified = _check_catalog_etag(request, response, "products", "search")
+    if not_modified:
+        return not_modified
+    results = index.search(q, limit=limit, prefix=prefix)
+    found = [products.get(product_id) for product_id, _ in results if products.get(product_id) is not None]
+    return raw_json_response(PRODUCT_LIST_ADAPTER.dump_json(found), response)
+
+@router.get("/products/export", summary="Exportar el catálogo completo en NDJSON")
+async def export_products():
+    """
+    Exporta el catálogo completo como NDJSON (un producto por línea), en streaming:
+    los productos se leen de la API de Ferremas y se envían a medida que llegan,
+    con memoria constante sin importar el tamaño del catálogo.
+    """
+    return await _export_ndjson()
+
+async def _export_ndjson() -> StreamingResponse:
+    products = stream_product_data()
+    # Se espera el primer producto antes de responder, para que un error de la
+    # API de Ferremas se informe como 500 y no como un stream vacío.
+    try:
+        first: Optional[Product] = await products.__anext__()
+    except StopAsyncIteration:
+        first = None
+    except (httpx.HTTPError, ValueError):
+        raise HTTPException(status_code=500, detail="No se pudo exportar el catálogo de productos")
 
-    return [p for p in all_products if p.is_new_product]
+    async def body() -> AsyncIterator[bytes]:
+        if first is None:
+            return
+        chunk = bytearray(first.model_dump_json().encode() + b"\n")
+        try:
+            async for product in products:
+                chunk += product.model_dump_json().encode() + b"\n"
+                if len(chunk) >= EXPORT_CHUNK_BYTES:
+                    yield bytes(chunk)
+                    chunk.clear()
+        except (httpx.HTTPError, ValueError):
+            logger.error("Exportación de productos interrumpida por un error de la API de Ferremas")
+        finally:
+            await products.aclose()
+        if chunk:
+            yield bytes(chunk)
+
+    return StreamingResponse(body(), media_type=NDJSON_MEDIA_TYPE)
+
+@router.get("/products/{product_id}", response_model=Product, summary="Obtener un producto específico")
+async def get_product_by_id(
+    request: Request,
+    response: Response,
+    product_id: int = Path(..., description="ID del producto"),
+):
+    """
+    Recupera los detalles de un producto específico por su ID.
+    Se responde desde el índice del catálogo y, si no está, desde la API de Ferremas.
+    """
+    index = await catalog_cache.product_index()
+    product = index.get(product_id) if index is not None else None
+    if product is None:
+        fetched = await fetch_product_data(product_id=product_id)
+        if not fetched:
+            raise HTTPException(status_code=404, detail="Producto no encontrado")
+        product = fetched[0]
+    body = product.model_dump_json()
+    not_modified = check_not_modified(request, response, make_etag(body))
+    if not_modified:
+        return not_modified
+    return raw_json_response(body.encode(), response)
 
 @router.post("/products", response_model=Product, status_code=201, summary="Agregar un nuevo producto al catálogo")
 async def add_product(
@@ -64,6 +278,7 @@ async def add_product(
     created_product = await add_product_to_ferremas_api(product)
     if created_product is None:
         raise HTTPException(status_code=500, detail="No se pudo agregar el producto")
+    catalog_cache.upsert_product(created_product)
     return created_product
 
 @router.put("/products/{product_id}/markPromotion", response_model=Product, summary="Marcar/desmarcar producto como promoción")
@@ -78,6 +293,7 @@ async def mark_product_promotion(
     updated = await update_product_in_ferremas_api(product_id, {"is_promotion": is_promotion})
     if updated is None:
         raise HTTPException(status_code=500, detail="No se pudo actualizar promoción")
+    catalog_cache.upsert_product(updated)
     return updated
 
 @router.put("/products/{product_id}/markNewArrival", response_model=Product, summary="Marcar/desmarcar producto como novedad")
@@ -92,4 +308,75 @@ async def mark_product_new_arrival(
     updated = await update_product_in_ferremas_api(product_id, {"is_new_product": is_new_product})
     if updated is None:
         raise HTTPException(status_code=500, detail="No se pudo actualizar novedad")
+    catalog_cache.upsert_product(updated)
     return updated
+
+def _check_batch_size(size: int) -> None:
+    if size > settings.BATCH_MAX_ITEMS:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"El lote supera el máximo de {settings.BATCH_MAX_ITEMS} elementos",
+        )
+
+def _batch_result(results: List[BatchItemResult]) -> ProductBatchResult:
+    succeeded = sum(1 for result in results if result.success)
+    return ProductBatchResult(succeeded=succeeded, failed=len(results) - succeeded, results=results)
+
+@router.post("/products/batch", response_model=ProductBatchResult, summary="Obtener varios productos por ID")
+async def get_products_batch(request: ProductBatchRequest):
+    """
+    Recupera varios productos en una sola llamada. Se responde desde el índice del
+    catálogo y los que falten se piden a la API de Ferremas con concurrencia acotada.
+    """
+    _check_batch_size(len(request.ids))
+    index = await catalog_cache.product_index()
+    found = {}
+    if index is not None:
+        found = {pid: index.get(pid) for pid in request.ids if index.get(pid) is not None}
+    missing = [pid for pid in dict.fromkeys(request.ids) if pid not in found]
+    if missing:
+        for pid, product in zip(missing, await fetch_products_by_id(missing)):
+            if product is not None:
+                found[pid] = product
+    return _batch_result([
+        BatchItemResult(id=pid, success=True, product=found[pid])
+        if pid in found
+        else BatchItemResult(id=pid, success=False, error="Producto no encontrado")
+        for pid in request.ids
+    ])
+
+@router.patch("/products/batch", response_model=ProductBatchResult, summary="Actualizar varios productos")
+async def update_products_batch(
+    request: ProductBatchUpdateRequest,
+    current_user: UserInDB = Depends(has_roles(["admin", "mantenedor"]))
+):
+    """
+    Aplica actualizaciones parciales a varios productos (p. ej. marcar promociones en masa).
+    Las llamadas a la API de Ferremas se hacen en paralelo con concurrencia acotada y
+    se informa el resultado de cada elemento.
+    """
+    _check_batch_size(len(request.updates))
+    results: List[Optional[BatchItemResult]] = [None] * len(request.updates)
+    pending = []
+    seen = set()
+    for position, item in enumerate(request.updates):
+        changes = item.changes.model_dump(exclude_unset=True)
+        if item.id in seen:
+            results[position] = BatchItemResult(id=item.id, success=False, error="ID duplicado en el lote")
+        elif not changes:
+            results[position] = BatchItemResult(id=item.id, success=False, error="Sin cambios para aplicar")
+        else:
+            pending.append((position, item.id, changes))
+        seen.add(item.id)
+
+    updated = await update_products_in_ferremas_api([(pid, changes) for _, pid, changes in pending])
+    # Una sola versión nueva del catálogo para todo el lote
+    catalog_cache.upsert_products([product for product in updated if product is not None])
+    for (position, pid, changes), product in zip(pending, updated):
+        if product is None:
+            results[position] = BatchItemResult(id=pid, success=False, error="No se pudo actualizar el producto")
+            continue
+        if "stock" in changes:
+            order_engine.set_stock(pid, product.stock)
+        results[position] = BatchItemResult(id=pid, success=True, product=product)
+    return _batch_result(results)
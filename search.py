@@ -0,0 +1,188 @@
+# ferremas_api/search.py
+import heapq
+import math
+import re
+import unicodedata
+from bisect import bisect_left, insort
+from typing import Dict, Iterable, List, Tuple
+
+from models import Product
+
+# Peso de cada campo al puntuar una coincidencia
+FIELD_WEIGHTS = {"name": 3.0, "brand": 2.0, "category": 1.5, "description": 1.0}
+# Máximo de términos del vocabulario que puede expandir un prefijo
+MAX_PREFIX_EXPANSIONS = 64
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+def normalize(text: str) -> str:
+    """
+    Minúsculas y sin tildes ni diéresis: "Martíllo Pingüino" -> "martillo pinguino".
+    """
+    decomposed = unicodedata.normalize("NFKD", text.lower())
+    return "".join(ch for ch in decomposed if not unicodedata.combining(ch))
+
+def tokenize(text: str) -> List[str]:
+    return _TOKEN_RE.findall(normalize(text))
+
+class SearchIndex:
+    """
+    Índice invertido sobre nombre, descripción, marca y categoría de los productos.
+
+    Cada término apunta a {product_id: peso}. El vocabulario se mantiene ordenado
+    para resolver prefijos (autocompletado) con búsqueda binaria.
+    """
+
+    def __init__(self, products: Iterable[Product] = ()):
+        self._postings: Dict[str, Dict[int, float]] = {}
+        self._doc_terms: Dict[int, Dict[str, float]] = {}
+        self._vocabulary: List[str] = []
+        # Postings ordenados por peso, calculados bajo demanda para el top-k de un solo término
+        self._ranked: Dict[str, List[Tuple[float, int]]] = {}
+        for product in products:
+            self._add(product)
+        self._vocabulary = sorted(self._postings)
+
+    def __len__(self) -> int:
+        return len(self._doc_terms)
+
+    def upsert(self, product: Product) -> None:
+        self.remove(product.id)
+        new_terms = [term for term in self._add(product) if len(self._postings[term]) == 1]
+        for term in new_terms:
+            insort(self._vocabulary, term)
+
+    def upsert_many(self, products: Iterable[Product]) -> None:
+        """
+        Aplica un lote; los términos nuevos se incorporan al vocabulario una
+        vez al final, no con un insort por término.
+        """
+        latest = {product.id: product for product in products}
+        # Primero las bajas: remove() mantiene el vocabulario, que aún no tiene los términos nuevos
+        for product_id in latest:
+            self.remove(product_id)
+        new_terms = []
+        for product in latest.values():
+            new_terms.extend(term for term in self._add(product) if len(self._postings[term]) == 1)
+        if new_terms:
+            # Con el vocabulario ya ordenado, ordenar con los términos nuevos al final es casi lineal
+            self._vocabulary = sorted(self._vocabulary + new_terms)
+
+    def remove(self, product_id: int) -> None:
+        for term in self._doc_terms.pop(product_id, {}):
+            postings = self._postings[term]
+            del postings[product_id]
+            self._ranked.pop(term, None)
+            if not postings:
+                del self._postings[term]
+                del self._vocabulary[bisect_left(self._vocabulary, term)]
+
+    def _add(self, product: Product) -> Dict[str, float]:
+        weights: Dict[str, float] = {}
+        for field, weight in FIELD_WEIGHTS.items():
+            value = getattr(product, field)
+            if not value:
+                continue
+            for term in tokenize(value):
+                weights[term] = weights.get(term, 0.0) + weight
+        for term, weight in weights.items():
+            self._postings.setdefault(term, {})[product.id] = weight
+            self._ranked.pop(term, None)
+        self._doc_terms[product.id] = weights
+        return weights
+
+    def _expand_prefix(self, prefix: str) -> List[str]:
+        start = bisect_left(self._vocabulary, prefix)
+        terms = []
+        for term in self._vocabulary[start:start + MAX_PREFIX_EXPANSIONS]:
+            if not term.startswith(prefix):
+                break
+            terms.append(term)
+        return terms
+
+    def search(self, query: str, limit: int = 20, prefix: bool = True) -> List[Tuple[int, float]]:
+        """
+        Devuelve [(product_id, puntaje)] ordenado por relevancia.
+
+        Todos los términos deben coincidir (AND). Con prefix=True el último
+        término se trata como prefijo, para autocompletar mientras se escribe.
+        """
+        terms = tokenize(query)
+        if not terms:
+            return []
+        total_docs = max(len(self._doc_terms), 1)
+        # Por cada término de la consulta: [(expansión, postings, factor)]
+        groups: List[List[Tuple[str, Dict[int, float], float]]] = []
+        for position, term in enumerate(terms):
+            is_last = position == len(terms) - 1
+            expansions = self._expand_prefix(term) if prefix and is_last else [term]
+            group = []
+            for expansion in expansions:
+                postings = self._postings.get(expansion)
+                if postings:
+                    idf = math.log(1 + total_docs / len(postings))
+                    # Una coincidencia exacta vale más que una por prefijo
+                    boost = 1.0 if expansion == term else 0.5
+                    group.append((expansion, postings, idf * boost))
+            if not group:
+                return []
+            groups.append(group)
+
+        # Se parte del término más selectivo y el resto solo se consulta para esos candidatos
+        if len(groups) == 1:
+            return self._top_single(groups[0], limit)
+        groups.sort(key=lambda group: sum(len(postings) for _, postings, _ in group))
+        scores = _merge_group(groups[0])
+        for group in groups[1:]:
+            if len(group) == 1:
+                _, postings, factor = group[0]
+                scores = {pid: score + postings[pid] * factor for pid, score in scores.items() if pid in postings}
+            else:
+                # Solo se consulta el término para los candidatos que ya coinciden
+                narrowed = _merge_group(group, restrict_to=scores)
+                scores = {pid: score + narrowed[pid] for pid, score in scores.items() if pid in narrowed}
+            if not scores:
+                return []
+        return heapq.nlargest(limit, scores.items(), key=lambda item: (item[1], -item[0]))
+
+    def _top_single(self, group: List[Tuple[str, Dict[int, float], float]], limit: int) -> List[Tuple[int, float]]:
+        """
+        Top-k de una consulta de un solo término sin puntuar todos sus postings:
+        se mezclan las listas ya ordenadas por peso de cada expansión.
+        """
+        ranked_lists = []
+        for term, postings, factor in group:
+            ranked = self._ranked.get(term)
+            if ranked is None:
+                ranked = sorted(((-weight, pid) for pid, weight in postings.items()))
+                self._ranked[term] = ranked
+            ranked_lists.append(((neg_weight * factor, pid) for neg_weight, pid in ranked))
+        results: List[Tuple[int, float]] = []
+        seen = set()
+        for neg_score, pid in heapq.merge(*ranked_lists):
+            if pid in seen:
+                continue
+            seen.add(pid)
+            results.append((pid, -neg_score))
+            if len(results) == limit:
+                break
+        return results
+
+def _merge_group(group: List[Tuple[str, Dict[int, float], float]], restrict_to: Dict[int, float] = None) -> Dict[int, float]:
+    """
+    Combina las expansiones de un término quedándose con el mejor puntaje por producto.
+    """
+    if len(group) == 1 and restrict_to is None:
+        _, postings, factor = group[0]
+        return {pid: weight * factor for pid, weight in postings.items()}
+    merged: Dict[int, float] = {}
+    for _, postings, factor in group:
+        if restrict_to is not None and len(restrict_to) < len(postings):
+            items = ((pid, postings[pid]) for pid in restrict_to if pid in postings)
+        else:
+            items = postings.items()
+        for pid, weight in items:
+            score = weight * factor
+            if score > merged.get(pid, 0.0):
+                merged[pid] = score
+    return merged
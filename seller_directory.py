@@ -0,0 +1,58 @@
+# ferremas_api/seller_directory.py
+from typing import Dict, Iterable, List, Optional
+
+from models import Seller
+
+class SellerDirectory:
+    """
+    Índices en memoria sobre el listado de vendedores: por id, por sucursal y
+    por email (sin distinguir mayúsculas). Se construye una vez por cada copia
+    nueva del listado y se actualiza con upsert entre refrescos.
+    """
+
+    def __init__(self, sellers: Iterable[Seller] = ()):
+        self.by_id: Dict[int, Seller] = {}
+        self.by_email: Dict[str, Seller] = {}
+        self._by_branch: Dict[int, List[Seller]] = {}
+        for seller in sellers:
+            self._add(seller)
+
+    def __len__(self) -> int:
+        return sum(len(sellers) for sellers in self._by_branch.values())
+
+    def get(self, seller_id: int) -> Optional[Seller]:
+        return self.by_id.get(seller_id)
+
+    def find_by_email(self, email: str) -> Optional[Seller]:
+        return self.by_email.get(email.lower())
+
+    def for_branch(self, branch_id: int) -> List[Seller]:
+        """
+        Vendedores de la sucursal, en el orden del listado de la API de Ferremas.
+        """
+        return list(self._by_branch.get(branch_id, ()))
+
+    def upsert(self, seller: Seller) -> None:
+        old = self.by_id.get(seller.id) if seller.id is not None else None
+        if old is not None:
+            self._remove(old)
+        self._add(seller)
+
+    def upsert_many(self, sellers: Iterable[Seller]) -> None:
+        for seller in sellers:
+            self.upsert(seller)
+
+    def _add(self, seller: Seller) -> None:
+        if seller.id is not None:
+            self.by_id[seller.id] = seller
+        self.by_email[seller.email.lower()] = seller
+        self._by_branch.setdefault(seller.branch_id, []).append(seller)
+
+    def _remove(self, seller: Seller) -> None:
+        del self.by_id[seller.id]
+        if self.by_email.get(seller.email.lower()) is seller:
+            del self.by_email[seller.email.lower()]
+        sellers = self._by_branch[seller.branch_id]
+        sellers.remove(seller)
+        if not sellers:
+            del self._by_branch[seller.branch_id]
@@ -0,0 +1,284 @@
+# ferremas_api/snapshot_store.py
+import asyncio
+import hashlib
+import logging
+import mmap
+import os
+import stat
+import struct
+import tempfile
+import time
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+from pydantic import TypeAdapter, ValidationError
+
+from catalog import SnapshotCache, catalog_cache
+from config import settings
+
+try:
+    import fcntl
+except ImportError:
+    # Sin flock (Windows) cada proceso refresca y escribe su propia copia
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Encabezado: identificador de formato, generación, fecha de creación (epoch),
+# largo del contenido y hash del contenido. Sigue el JSON de la copia.
+_HEADER = struct.Struct("<8sQdQ16s")
+_MAGIC = b"FERRSNP1"
+
+class SnapshotFormatError(ValueError):
+    pass
+
+class UnsafeSnapshotDirError(OSError):
+    pass
+
+class SnapshotFile(NamedTuple):
+    generation: int
+    created_at: float
+    # Vista de solo lectura sobre el archivo mapeado en memoria
+    payload: memoryview
+
+def _digest(payload) -> bytes:
+    return hashlib.blake2b(payload, digest_size=16).digest()
+
+def write_snapshot(path: str, payload: bytes, generation: int, created_at: float) -> None:
+    """
+    Escribe la copia en un archivo temporal del mismo directorio y lo renombra:
+    los lectores ven el archivo anterior o el nuevo completo, nunca uno a medias.
+    """
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        # Solo el dueño puede leer la copia (el directorio ya es privado)
+        with os.fdopen(os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), "wb") as f:
+            f.write(_HEADER.pack(_MAGIC, generation, created_at, len(payload), _digest(payload)))
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
+def read_snapshot(path: str) -> SnapshotFile:
+    """
+    Mapea el archivo en memoria de solo lectura. Las páginas viven en la caché
+    del sistema operativo y se comparten entre todos los workers que lo leen.
+    """
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size < _HEADER.size:
+            raise SnapshotFormatError(f"Copia incompleta: {path}")
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    magic, generation, created_at, length, digest = _HEADER.unpack_from(mapped, 0)
+    if magic != _MAGIC:
+        raise SnapshotFormatError(f"Formato de copia desconocido: {path}")
+    if _HEADER.size + length != len(mapped):
+        raise SnapshotFormatError(f"Largo de la copia no coincide: {path}")
+    payload = memoryview(mapped)[_HEADER.size:]
+    if _digest(payload) != digest:
+        raise SnapshotFormatError(f"Copia corrupta: {path}")
+    return SnapshotFile(generation=generation, created_at=created_at, payload=payload)
+
+def ensure_private_dir(directory: str) -> None:
+    """
+    Crea el directorio con permisos 0700 o verifica uno existente. Los workers
+    sirven como catálogo lo que encuentren ahí, así que se rechaza un directorio
+    de otro usuario o en el que otros puedan escribir (p. ej. uno plantado de
+    antemano en el directorio temporal compartido).
+    """
+    os.makedirs(directory, mode=0o700, exist_ok=True)
+    info = os.stat(directory, follow_symlinks=False)
+    if not stat.S_ISDIR(info.st_mode):
+        raise UnsafeSnapshotDirError(f"{directory} no es un directorio")
+    if hasattr(os, "getuid") and info.st_uid != os.getuid():
+        raise UnsafeSnapshotDirError(f"{directory} pertenece a otro usuario (uid {info.st_uid})")
+    if info.st_mode & (stat.S_IWGRP | stat.S_IWOTH):
+        raise UnsafeSnapshotDirError(f"{directory} tiene permisos de escritura para otros usuarios")
+
+def default_snapshot_dir() -> str:
+    # Un directorio por API de origen, para que dos despliegues del mismo host no se mezclen
+    source = hashlib.blake2b(str(settings.FERREMAS_DB_API_URL).encode(), digest_size=6).hexdigest()
+    return os.path.join(tempfile.gettempdir(), f"ferremas_api-{source}")
+
+class SnapshotStore:
+    """
+    Comparte las copias del catálogo, sucursales y vendedores entre los workers
+    de un mismo host a través de archivos en disco.
+
+    - Un solo proceso (el que obtiene el flock) consulta la API de Ferremas y
+      escribe cada versión nueva de forma atómica.
+    - Los demás mapean los archivos en memoria y los recargan cuando cambian;
+      no consultan la API mientras tengan una copia.
+    - Al arrancar, todos cargan la última copia en disco: un worker nuevo
+      responde de inmediato aunque la API de Ferremas esté caída.
+
+    Si el proceso que refresca termina, otro worker toma el lock en la
+    siguiente revisión. Las escrituras hechas en un worker que no refresca se
+    ven en los demás tras el siguiente refresco desde la API.
+
+    El directorio debe ser privado del usuario del proceso (ver
+    ensure_private_dir); si no lo es, no se usan copias en disco.
+    """
+
+    def __init__(self, directory: str, caches: List[SnapshotCache], poll_interval: float):
+        self.directory = directory
+        self.caches = caches
+        self.poll_interval = poll_interval
+        self.is_refresher = False
+        self._lock_file = None
+        self._task: Optional[asyncio.Task] = None
+        # Archivo cargado por copia: (inode, mtime) para detectar reemplazos
+        self._loaded_files: Dict[str, Tuple[int, int]] = {}
+        # Versión de cada copia ya escrita en disco
+        self._written_versions: Dict[str, int] = {}
+        self._last_refresh_attempt: Dict[str, float] = {}
+        self.writes = 0
+        self.write_errors = 0
+        self.loads = 0
+        self.load_errors = 0
+        self.promotions = 0
+
+    def _path(self, cache: SnapshotCache) -> str:
+        return os.path.join(self.directory, f"{cache.name}.snap")
+
+    async def start(self) -> None:
+        try:
+            ensure_private_dir(self.directory)
+            self._try_become_refresher()
+        except UnsafeSnapshotDirError as e:
+            # Sin copias compartidas cada worker sigue con su propia copia en memoria
+            logger.error(f"Copias del catálogo en disco deshabilitadas: {e}")
+            return
+        except OSError:
+            logger.exception(f"No se pudo usar {self.directory} para las copias del catálogo")
+            return
+        for cache in self.caches:
+            # Arranque en caliente: la última copia en disco, sin importar su antigüedad
+            await self._load(cache)
+            cache.refresh_on_read = self.is_refresher
+        role = "refresca las copias" if self.is_refresher else "lee las copias de disco"
+        logger.info(f"Worker {os.getpid()} {role} en {self.directory}")
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._lock_file is not None:
+            # Cerrar el archivo libera el flock para otro worker
+            self._lock_file.close()
+            self._lock_file = None
+            self.is_refresher = False
+
+    def _try_become_refresher(self) -> bool:
+        if self.is_refresher:
+            return True
+        if fcntl is None:
+            self.is_refresher = True
+            return True
+        lock_file = os.fdopen(os.open(os.path.join(self.directory, "refresher.lock"), os.O_RDWR | os.O_CREAT, 0o600), "a+")
+        try:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        self._lock_file = lock_file
+        self.is_refresher = True
+        return True
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                await self._tick()
+            except Exception:
+                logger.exception("Error al sincronizar las copias del catálogo en disco")
+
+    async def _tick(self) -> None:
+        if not self.is_refresher and self._try_become_refresher():
+            self.promotions += 1
+            logger.info(f"Worker {os.getpid()} pasa a refrescar las copias del catálogo")
+            for cache in self.caches:
+                cache.refresh_on_read = True
+        for cache in self.caches:
+            if self.is_refresher:
+                await self._refresh_and_write(cache)
+            else:
+                await self._load(cache)
+
+    async def _refresh_and_write(self, cache: SnapshotCache) -> None:
+        # Se refresca aunque este worker no reciba tráfico, para que los demás
+        # tengan copias al día. Tras un fallo se reintenta recién pasado el TTL.
+        now = time.monotonic()
+        if cache.age >= cache.ttl and now - self._last_refresh_attempt.get(cache.name, float("-inf")) >= cache.ttl:
+            self._last_refresh_attempt[cache.name] = now
+            await cache.refresh()
+        if cache.peek() is None or self._written_versions.get(cache.name) == cache.version:
+            return
+        version = cache.version
+        payload = cache.json_bytes()
+        try:
+            await asyncio.to_thread(write_snapshot, self._path(cache), payload, time.time_ns(), time.time() - cache.age)
+        except OSError:
+            self.write_errors += 1
+            logger.exception(f"No se pudo escribir la copia de {cache.name} en disco")
+            return
+        self._written_versions[cache.name] = version
+        self._loaded_files[cache.name] = self._file_key(self._path(cache))
+        self.writes += 1
+
+    @staticmethod
+    def _file_key(path: str) -> Optional[Tuple[int, int]]:
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns
+
+    async def _load(self, cache: SnapshotCache) -> None:
+        path = self._path(cache)
+        key = self._file_key(path)
+        if key is None or self._loaded_files.get(cache.name) == key:
+            return
+        # Aunque falle, no se reintenta el mismo archivo en cada revisión
+        self._loaded_files[cache.name] = key
+        try:
+            snapshot, data = await asyncio.to_thread(_read_and_parse, path, cache.adapter)
+        except (OSError, SnapshotFormatError, ValidationError) as e:
+            self.load_errors += 1
+            logger.warning(f"No se pudo cargar la copia de {cache.name} desde disco: {e}")
+            return
+        cache.set(data, age=max(0.0, time.time() - snapshot.created_at), json_body=snapshot.payload)
+        self._written_versions[cache.name] = cache.version
+        self.loads += 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "directory": self.directory,
+            "is_refresher": self.is_refresher,
+            "writes": self.writes,
+            "write_errors": self.write_errors,
+            "loads": self.loads,
+            "load_errors": self.load_errors,
+            "promotions": self.promotions,
+        }
+
+def _read_and_parse(path: str, adapter: TypeAdapter) -> Tuple[SnapshotFile, List[Any]]:
+    snapshot = read_snapshot(path)
+    # pydantic no valida desde un memoryview: se parsea desde una copia temporal
+    return snapshot, adapter.validate_json(bytes(snapshot.payload))
+
+snapshot_store = SnapshotStore(
+    directory=settings.SNAPSHOT_DIR or default_snapshot_dir(),
+    caches=[catalog_cache.products, catalog_cache.branches, catalog_cache.sellers],
+    poll_interval=settings.SNAPSHOT_POLL_SECONDS,
+)
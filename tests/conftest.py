@@ -0,0 +1,62 @@
+# ferremas_api/tests/conftest.py
+"""
+Las pruebas usan el stub de la API de Ferremas de benchmarks/ en un proceso
+aparte y la app real (con su lifespan) a través de httpx.ASGITransport.
+La configuración se lee al importar config.py, por eso las variables de
+entorno se fijan aquí antes de importar la app.
+"""
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+
+from bench_http_client import free_port, wait_for_port
+
+_stub_port = free_port()
+_stub = subprocess.Popen([
+    sys.executable, os.path.join(ROOT, "benchmarks", "stub_upstream.py"),
+    "--port", str(_stub_port), "--products", "200", "--branches", "20", "--sellers", "200",
+], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+wait_for_port(_stub_port)
+
+os.environ.update(
+    FERREMAS_DB_API_URL=f"http://127.0.0.1:{_stub_port}",
+    FERREMAS_DB_API_TOKEN="test",
+    SECRET_KEY="test",
+    SNAPSHOT_ENABLED="false",
+    INGEST_DATA_DIR=tempfile.mkdtemp(prefix="ferremas_api-tests-"),
+    ORDER_SYNC_INTERVAL_SECONDS="0.01",
+)
+
+def pytest_unconfigure(config):
+    _stub.terminate()
+    _stub.wait()
+
+def auth_headers(username: str) -> dict:
+    from auth import FAKE_USERS_DB, create_access_token
+    token = create_access_token({"sub": username, "roles": FAKE_USERS_DB[username]["roles"]})
+    return {"Authorization": f"Bearer {token}"}
+
+@pytest.fixture
+def run_app():
+    """
+    Ejecuta `scenario(client)` con la app iniciada (lifespan completo) y un
+    cliente httpx conectado a ella.
+    """
+    import httpx
+    from main import app
+
+    def run(scenario):
+        async def main():
+            async with app.router.lifespan_context(app):
+                async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://app") as client:
+                    return await scenario(client)
+        return asyncio.run(main())
+    return run
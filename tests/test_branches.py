@@ -0,0 +1,70 @@
+# ferremas_api/tests/test_branches.py
+from conftest import auth_headers
+
+ADMIN = auth_headers("javier_thompson")
+
+async def _no_listing():
+    return None
+
+def _drop_seller_snapshot(monkeypatch):
+    # Como al arrancar con la API caída: sin copia y sin poder cargar el listado completo
+    from catalog import catalog_cache
+    monkeypatch.setattr(catalog_cache.sellers, "_data", None)
+    monkeypatch.setattr(catalog_cache.sellers, "_positions", {})
+    monkeypatch.setattr(catalog_cache.sellers, "_loader", _no_listing)
+
+def test_branch_sellers_served_from_directory(run_app):
+    async def scenario(client):
+        response = await client.get("/branches/3/sellers", headers=ADMIN)
+        assert response.status_code == 200
+        sellers = response.json()
+        assert sellers and all(seller["branch_id"] == 3 for seller in sellers)
+        response = await client.get(f"/sellers/{sellers[0]['id']}", headers=ADMIN)
+        assert response.status_code == 200
+        assert response.json() == sellers[0]
+    run_app(scenario)
+
+def test_branch_sellers_fall_back_to_upstream_without_snapshot(run_app, monkeypatch):
+    from database import fetch_seller_data
+
+    _drop_seller_snapshot(monkeypatch)
+
+    async def scenario(client):
+        from catalog import catalog_cache
+        assert await catalog_cache.seller_directory() is None
+        expected = await fetch_seller_data(branch_id=3)
+        response = await client.get("/branches/3/sellers", headers=ADMIN)
+        assert response.status_code == 200
+        assert [seller["id"] for seller in response.json()] == [seller.id for seller in expected]
+    run_app(scenario)
+
+def test_branch_sellers_500_when_upstream_is_down(run_app, monkeypatch):
+    import routes.branches as branch_routes
+
+    async def upstream_down(**kwargs):
+        return None
+
+    _drop_seller_snapshot(monkeypatch)
+    monkeypatch.setattr(branch_routes, "fetch_seller_data", upstream_down)
+
+    async def scenario(client):
+        response = await client.get("/branches/3/sellers", headers=ADMIN)
+        assert response.status_code == 500
+    run_app(scenario)
+
+def test_branch_overview(run_app):
+    async def scenario(client):
+        response = await client.get("/branches/3/overview", headers=ADMIN)
+        assert response.status_code == 200
+        body = response.json()
+        assert body["branch"]["id"] == 3
+        assert all(seller["branch_id"] == 3 for seller in body["sellers"])
+        assert body["stock"]["products"] == 200
+        assert (await client.get("/branches/999/overview", headers=ADMIN)).status_code == 404
+        assert (await client.get("/branches/3/overview")).status_code == 401
+    run_app(scenario)
+
+def test_overview_route_registered_once():
+    from main import app
+    paths = [route.path for route in app.routes if getattr(route, "path", None) == "/branches/{branch_id}/overview"]
+    assert len(paths) == 1
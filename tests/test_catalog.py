@@ -0,0 +1,48 @@
+# ferremas_api/tests/test_catalog.py
+from catalog import SnapshotCache
+from database import PRODUCT_LIST_ADAPTER
+from models import Product
+from product_index import ProductIndex
+from search import SearchIndex
+
+async def _no_upstream():
+    return None
+
+def _product(pid: int, price: float = 100.0, name: str = "Martillo") -> Product:
+    return Product(
+        id=pid, name=name, description="Herramienta", price=price, stock=5,
+        category="Herramientas", brand="Bosch", is_promotion=False, is_new_product=False,
+    )
+
+def test_upsert_many_is_one_version_and_one_notification():
+    cache = SnapshotCache("products", _no_upstream, PRODUCT_LIST_ADAPTER, ttl=60.0, max_stale=300.0)
+    cache.set([_product(1), _product(2)])
+    notified = []
+    cache.add_listener(lambda previous, current, complete: notified.append((previous, current)))
+    version = cache.version
+    cache.upsert_many([_product(2, price=50.0), _product(3), _product(3, price=70.0)])
+    assert cache.version == version + 1
+    assert [p.id for p in cache.peek()] == [1, 2, 3]
+    assert cache.find(3).price == 70.0
+    previous, current = notified[0]
+    assert len(notified) == 1
+    assert [p.price for p in previous] == [100.0]
+    assert [(p.id, p.price) for p in current] == [(2, 50.0), (3, 70.0)]
+    assert PRODUCT_LIST_ADAPTER.validate_json(cache.json_bytes()) == cache.peek()
+
+def test_product_index_upsert_many_matches_rebuild():
+    products = [_product(pid, price=float(pid * 10), name=f"Producto {pid}") for pid in range(1, 20)]
+    index = ProductIndex(products)
+    changes = [_product(5, price=999.0, name="Zeta"), _product(40, price=1.0, name="Alfa"), _product(7, price=3.0)]
+    index.upsert_many(changes)
+    expected = ProductIndex({p.id: p for p in products + changes}.values())
+    for sort in ("price", "-name", "id"):
+        assert index.query(sort=sort)[0] == expected.query(sort=sort)[0]
+    assert index.total_units == expected.total_units
+
+def test_search_index_upsert_many_keeps_vocabulary_sorted():
+    index = SearchIndex([_product(1, name="Martillo"), _product(2, name="Taladro")])
+    index.upsert_many([_product(1, name="Alicate"), _product(3, name="Zapapico"), _product(4, name="Alicate grande")])
+    assert index._vocabulary == sorted(index._vocabulary)
+    assert not index.search("martillo")
+    assert {pid for pid, _ in index.search("alic")} == {1, 4}
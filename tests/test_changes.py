@@ -0,0 +1,55 @@
+# ferremas_api/tests/test_changes.py
+from fastapi.testclient import TestClient
+
+from change_feed import ChangeFeed
+
+def _feed() -> ChangeFeed:
+    return ChangeFeed(max_connections=10, max_pending=10, replay_size=10)
+
+def _delivered(feed: ChangeFeed, subscription, topics) -> bool:
+    before = len(subscription._pending)
+    feed.publish("product.updated", topics, {"id": 1})
+    return len(subscription._pending) > before
+
+def test_subscription_without_filters_receives_everything():
+    feed = _feed()
+    subscription = feed.subscribe()
+    assert _delivered(feed, subscription, (("product", 1),))
+
+def test_unsubscribing_last_topic_does_not_enable_everything():
+    feed = _feed()
+    subscription = feed.subscribe(product_ids=[1])
+    feed.update(subscription, False, product_ids=[1])
+    assert not subscription.everything
+    assert not _delivered(feed, subscription, (("product", 1),))
+    assert not _delivered(feed, subscription, (("product", 2),))
+    assert feed.stats()["unfiltered_connections"] == 0
+
+def test_topic_subscription_replaces_everything():
+    feed = _feed()
+    subscription = feed.subscribe()
+    feed.update(subscription, True, product_ids=[1])
+    assert not _delivered(feed, subscription, (("product", 2),))
+    assert _delivered(feed, subscription, (("product", 1),))
+    feed.update(subscription, False)
+    feed.update(subscription, True)
+    assert _delivered(feed, subscription, (("product", 2),))
+
+def test_websocket_rejects_filters_that_are_not_lists():
+    from main import app
+
+    with TestClient(app) as client, client.websocket_connect("/ws/products") as websocket:
+        assert websocket.receive_json()["type"] == "subscribed"
+        for command in (
+            {"action": "subscribe", "product_ids": "12"},
+            {"action": "subscribe", "product_ids": [1, "2"]},
+            {"action": "subscribe", "branch_ids": [True]},
+            {"action": "subscribe", "categories": "Herramientas"},
+        ):
+            websocket.send_json(command)
+            assert websocket.receive_json()["type"] == "error"
+        websocket.send_json({"action": "subscribe", "product_ids": [12]})
+        reply = websocket.receive_json()
+        assert reply == {"type": "subscribed", "everything": False, "filters": [["product", 12]]}
+        websocket.send_json({"action": "unsubscribe", "product_ids": [12]})
+        assert websocket.receive_json() == {"type": "unsubscribed", "everything": False, "filters": []}
@@ -0,0 +1,67 @@
+# ferremas_api/tests/test_compression.py
+import asyncio
+
+from fastapi import FastAPI, Request, Response
+
+from compression import CompressionMiddleware, decoded_etag, encoded_etag
+from config import settings
+from http_cache import check_not_modified, raw_json_response
+
+def _app(body: bytes) -> FastAPI:
+    app = FastAPI()
+    app.add_middleware(CompressionMiddleware)
+
+    @app.get("/data")
+    async def data(request: Request, response: Response):
+        not_modified = check_not_modified(request, response, '"v1"')
+        if not_modified:
+            return not_modified
+        return raw_json_response(body, response)
+    return app
+
+def _get(app: FastAPI, headers: dict):
+    import httpx
+
+    async def main():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://app") as client:
+            return await client.get("/data", headers=headers)
+    return asyncio.run(main())
+
+BODY = b"[" + b",".join(b'{"id": %d, "name": "Martillo"}' % i for i in range(5000)) + b"]"
+
+def test_encoded_etag_round_trip():
+    assert encoded_etag('"abc"', "gzip") == '"abc-gzip"'
+    assert decoded_etag('"abc-br"') == '"abc"'
+    assert decoded_etag('"abc"') == '"abc"'
+
+def test_compressed_response_has_its_own_etag_and_vary():
+    assert len(BODY) >= settings.COMPRESSION_THREADPOOL_MIN_SIZE
+    response = _get(_app(BODY), {"Accept-Encoding": "gzip"})
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["etag"] == '"v1-gzip"'
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert response.content == BODY
+
+def test_identity_response_keeps_etag_and_sends_vary():
+    response = _get(_app(BODY), {"Accept-Encoding": "identity"})
+    assert "content-encoding" not in response.headers
+    assert response.headers["etag"] == '"v1"'
+    assert response.headers["vary"] == "Accept-Encoding"
+
+def test_not_modified_echoes_the_encoded_etag():
+    response = _get(_app(BODY), {"Accept-Encoding": "gzip", "If-None-Match": '"v1-gzip"'})
+    assert response.status_code == 304
+    assert response.headers["etag"] == '"v1-gzip"'
+    assert response.headers["vary"] == "Accept-Encoding"
+
+def test_precompressed_catalog_uses_encoded_etag(run_app):
+    async def scenario(client):
+        response = await client.get("/products", headers={"Accept-Encoding": "gzip"})
+        assert response.headers["content-encoding"] == "gzip"
+        etag = response.headers["etag"]
+        assert etag.endswith('-gzip"')
+        response = await client.get("/products", headers={"Accept-Encoding": "gzip", "If-None-Match": etag})
+        assert response.status_code == 304
+        response = await client.get("/products", headers={"Accept-Encoding": "identity"})
+        assert response.headers["etag"] == decoded_etag(etag)
+    run_app(scenario)
@@ -0,0 +1,53 @@
+# ferremas_api/tests/test_currency.py
+import json
+import os
+from datetime import date
+
+from conftest import auth_headers
+from currency import currency_service, CurrencyService
+
+def _write_extra_rates(path, as_of: str, clp: float) -> str:
+    with open(path, "w") as f:
+        json.dump({"date": as_of, "rates_per_eur": {"CLP": clp}}, f)
+    return str(path)
+
+def test_extra_rates_carry_their_own_date_and_reload(tmp_path):
+    path = _write_extra_rates(tmp_path / "extra.json", "2026-10-01", 1000.0)
+    service = CurrencyService(None, path, refresh_interval=3600.0)
+    table = service.table
+    assert table.rates["CLP"] == 1000.0
+    assert table.rate_date("CLP") == date(2026, 10, 1)
+    assert table.rate_date("USD") == table.as_of
+    _write_extra_rates(tmp_path / "extra.json", "2026-10-02", 1100.0)
+    os.utime(path, (0, 1))
+    service._load()
+    assert service.table.rates["CLP"] == 1100.0
+    assert service.table.version == 2
+
+def test_prices_unavailable_without_catalog_rate(run_app):
+    assert "CLP" not in currency_service.table.rates
+
+    async def scenario(client):
+        response = await client.get("/products/prices", headers=auth_headers("javier_thompson"))
+        assert response.status_code == 503
+        response = await client.post("/api/v1/currencyConversion", json={"amount": 10, "from_currency": "CLP", "to_currency": "USD"})
+        assert response.status_code == 400
+    run_app(scenario)
+
+def test_prices_report_rate_date(run_app, tmp_path, monkeypatch):
+    path = _write_extra_rates(tmp_path / "extra.json", "2000-01-03", 1000.0)
+    monkeypatch.setattr(currency_service, "extra_path", path)
+
+    async def scenario(client):
+        currency_service._load()
+        response = await client.get("/products/prices", params={"currency": ["EUR"], "limit": 1}, headers=auth_headers("javier_thompson"))
+        assert response.status_code == 200
+        assert response.headers["X-Rates-Date"] == "2000-01-03"
+        product = response.json()[0]
+        assert product["converted"]["EUR"] == round(product["price"] / 1000.0, 2)
+        response = await client.post("/api/v1/currencyConversion", json={"amount": 1000, "from_currency": "CLP", "to_currency": "EUR"})
+        assert response.json()["converted_amount"] == 1.0
+        assert response.json()["rate_date"] == "2000-01-03"
+    run_app(scenario)
+    currency_service.extra_path = None
+    currency_service._load()
@@ -0,0 +1,44 @@
+# ferremas_api/tests/test_ingestion.py
+import json
+import os
+
+import pytest
+
+from ingestion import JsonlSink
+
+def _lines(path) -> list:
+    with open(path) as f:
+        return [json.loads(line) for line in f]
+
+def test_failed_fsync_leaves_no_lines_behind(tmp_path, monkeypatch):
+    path = str(tmp_path / "contact.jsonl")
+    sink = JsonlSink(path, fsync=True)
+    sink.write([{"id": "a"}])
+    real_fsync = os.fsync
+
+    def failing_fsync(fd):
+        raise OSError("disco lleno")
+    monkeypatch.setattr(os, "fsync", failing_fsync)
+    with pytest.raises(OSError):
+        sink.write([{"id": "b"}, {"id": "c"}])
+    monkeypatch.setattr(os, "fsync", real_fsync)
+    # El reintento de la tanda completa no duplica líneas
+    sink.write([{"id": "b"}, {"id": "c"}])
+    sink.close()
+    assert [record["id"] for record in _lines(path)] == ["a", "b", "c"]
+
+def test_partial_write_is_truncated(tmp_path, monkeypatch):
+    path = str(tmp_path / "contact.jsonl")
+    sink = JsonlSink(path, fsync=False)
+    sink.write([{"id": "a"}])
+    real_write = os.write
+
+    def short_write(fd, data):
+        return real_write(fd, data[: len(data) // 2])
+    monkeypatch.setattr(os, "write", short_write)
+    with pytest.raises(OSError):
+        sink.write([{"id": "b"}, {"id": "c"}])
+    monkeypatch.setattr(os, "write", real_write)
+    sink.write([{"id": "b"}, {"id": "c"}])
+    sink.close()
+    assert [record["id"] for record in _lines(path)] == ["a", "b", "c"]
@@ -0,0 +1,71 @@
+# ferremas_api/tests/test_orders.py
+import httpx
+
+from conftest import auth_headers
+
+ADMIN = auth_headers("javier_thompson")
+
+async def _place(client, product_id: int, quantity: int) -> str:
+    response = await client.post("/api/v1/orders", headers=ADMIN, json={
+        "client_username": "javier_thompson", "branch_id": 1,
+        "items": [{"product_id": product_id, "quantity": quantity}],
+    })
+    assert response.status_code == 201, response.text
+    return response.json()["order_id"]
+
+async def _upstream_stock(product_id: int) -> int:
+    from config import settings
+    async with httpx.AsyncClient(base_url=str(settings.FERREMAS_DB_API_URL)) as upstream:
+        return (await upstream.get(f"/products/{product_id}")).json()["stock"]
+
+async def _set_upstream_stock(product_id: int, stock: int) -> None:
+    from config import settings
+    async with httpx.AsyncClient(base_url=str(settings.FERREMAS_DB_API_URL)) as upstream:
+        (await upstream.put(f"/products/{product_id}", json={"stock": stock})).raise_for_status()
+
+def test_mixed_batch_updates_ledger_stock(run_app):
+    from orders import order_engine
+
+    async def scenario(client):
+        await _place(client, 11, 2)
+        response = await client.patch("/products/batch", headers=ADMIN, json={"updates": [
+            {"id": 11, "changes": {"stock": 999}},
+            {"id": 12, "changes": {"is_promotion": True}},
+        ]})
+        assert response.status_code == 200
+        assert response.json()["failed"] == 0
+        assert order_engine.available(11) == 999 - 2
+    run_app(scenario)
+
+def test_restock_after_confirm_is_not_overwritten_by_sync(run_app, monkeypatch):
+    from orders import order_engine
+
+    # La sincronización se dispara a mano para fijar el orden confirmación -> reposición -> envío
+    monkeypatch.setattr(order_engine, "sync_interval", 60.0)
+
+    async def scenario(client):
+        order_id = await _place(client, 21, 10)
+        assert (await client.post(f"/api/v1/orders/{order_id}/confirm", headers=ADMIN)).status_code == 200
+        response = await client.patch("/products/batch", headers=ADMIN, json={"updates": [
+            {"id": 21, "changes": {"stock": 500}},
+        ]})
+        assert response.json()["failed"] == 0
+        assert await order_engine._flush()
+        assert await _upstream_stock(21) == 500
+        assert order_engine.available(21) == 500
+    run_app(scenario)
+
+def test_sync_subtracts_sales_from_current_upstream_stock(run_app, monkeypatch):
+    from orders import order_engine
+
+    monkeypatch.setattr(order_engine, "sync_interval", 60.0)
+
+    async def scenario(client):
+        order_id = await _place(client, 31, 4)
+        assert (await client.post(f"/api/v1/orders/{order_id}/confirm", headers=ADMIN)).status_code == 200
+        # Otro worker vendió mientras tanto y ya sincronizó su stock
+        await _set_upstream_stock(31, 100)
+        assert await order_engine._flush()
+        assert await _upstream_stock(31) == 96
+        assert order_engine.available(31) == 96
+    run_app(scenario)
@@ -0,0 +1,39 @@
+# ferremas_api/tests/test_product_index.py
+import random
+
+from models import Product
+from product_index import ProductIndex
+
+def _catalog(n: int):
+    rng = random.Random(7)
+    return [
+        Product(
+            id=pid, name=f"Producto {rng.randrange(1000):03d}", description="x", price=float(rng.randrange(100, 100000)),
+            stock=rng.randrange(0, 50), category=rng.choice(["Herramientas", "Pinturas"]), brand="Bosch",
+            is_promotion=False, is_new_product=False,
+        )
+        for pid in range(1, n + 1)
+    ]
+
+def _pages(index: ProductIndex, **filters):
+    products, cursor = index.query(limit=7, **filters)
+    pages = list(products)
+    while cursor:
+        products, cursor = index.query(limit=7, cursor=cursor, **filters)
+        pages.extend(products)
+    return pages
+
+def test_price_range_with_other_sort_matches_full_scan():
+    products = _catalog(500)
+    index = ProductIndex(products)
+    for min_price, max_price in ((1000.0, 3000.0), (None, 80000.0), (50000.0, 50000.0)):
+        in_range = [
+            p for p in products
+            if (min_price is None or p.price >= min_price) and (max_price is None or p.price <= max_price)
+        ]
+        for sort in ("name", "-name", "id", "-id"):
+            reverse = sort.startswith("-")
+            key = (lambda p: (p.name.lower(), p.id)) if sort.lstrip("-") == "name" else (lambda p: p.id)
+            expected = sorted(in_range, key=key, reverse=reverse)
+            assert _pages(index, min_price=min_price, max_price=max_price, sort=sort) == expected
+            assert index.query(min_price=min_price, max_price=max_price, sort=sort)[0] == expected
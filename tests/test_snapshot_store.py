@@ -0,0 +1,60 @@
+# ferremas_api/tests/test_snapshot_store.py
+import asyncio
+import os
+import stat
+import time
+
+import pytest
+
+from catalog import SnapshotCache
+from database import PRODUCT_LIST_ADAPTER
+from snapshot_store import SnapshotStore, UnsafeSnapshotDirError, ensure_private_dir, write_snapshot
+
+PLANTED = b'[{"id": 1, "name": "Falso", "description": "x", "price": 1.0, "stock": 1, "category": "x", "brand": "x", "is_promotion": false, "is_new_product": false}]'
+
+async def _no_upstream():
+    return None
+
+def _mode(path: str) -> int:
+    return stat.S_IMODE(os.stat(path).st_mode)
+
+def test_creates_private_directory(tmp_path):
+    directory = str(tmp_path / "snapshots")
+    ensure_private_dir(directory)
+    assert _mode(directory) == 0o700
+
+def test_rejects_directory_writable_by_others(tmp_path):
+    directory = tmp_path / "snapshots"
+    directory.mkdir()
+    os.chmod(directory, 0o777)
+    with pytest.raises(UnsafeSnapshotDirError):
+        ensure_private_dir(str(directory))
+
+@pytest.mark.skipif(not hasattr(os, "getuid") or os.getuid() != 0, reason="requiere root para cambiar el dueño")
+def test_rejects_directory_owned_by_another_user(tmp_path):
+    directory = tmp_path / "snapshots"
+    directory.mkdir(mode=0o700)
+    os.chown(directory, 12345, 12345)
+    with pytest.raises(UnsafeSnapshotDirError):
+        ensure_private_dir(str(directory))
+
+def test_store_ignores_snapshot_planted_in_unsafe_directory(tmp_path):
+    directory = tmp_path / "snapshots"
+    directory.mkdir()
+    os.chmod(directory, 0o777)
+    write_snapshot(str(directory / "products.snap"), PLANTED, time.time_ns(), time.time())
+    cache = SnapshotCache("products", _no_upstream, PRODUCT_LIST_ADAPTER, ttl=60.0, max_stale=300.0)
+    store = SnapshotStore(str(directory), [cache], poll_interval=1.0)
+
+    async def scenario():
+        await store.start()
+        await store.close()
+    asyncio.run(scenario())
+    assert cache.peek() is None
+
+def test_snapshot_files_are_private(tmp_path):
+    directory = str(tmp_path / "snapshots")
+    ensure_private_dir(directory)
+    path = os.path.join(directory, "products.snap")
+    write_snapshot(path, PLANTED, time.time_ns(), time.time())
+    assert _mode(path) == 0o600